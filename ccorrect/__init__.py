@@ -1,7 +1,43 @@
+import importlib
+
 # allow access to debugger API depending if ccorrect is imported from inside gdb
 try:
-    from ccorrect._debugger import Debugger
-    from ccorrect._values import Ptr, gdb_array_iter, gdb_struct_iter
-    from ccorrect._testing import TestCase, run_tests, test_metadata
-except:
-    from ccorrect._run import run, _get_cmd
+    import gdb  # noqa: F401
+    _exports = {
+        "Debugger": "_debugger",
+        "Ptr": "_values",
+        "gdb_array_iter": "_values",
+        "gdb_struct_iter": "_values",
+        "TestCase": "_testing",
+        "run_tests": "_testing",
+        "test_metadata": "_testing"
+    }
+except ImportError:
+    _exports = {
+        "run": "_run",
+        "run_many": "_run",
+        "run_sharded": "_run",
+        "run_async": "_run",
+        "stream_async": "_run",
+        "recover_results": "_run",
+        "_get_cmd": "_run",
+        "WorkerPool": "_pool",
+        "build_index_cache": "_index",
+        "add_gdb_index": "_index",
+        "load_heap_snapshot": "_heap"
+    }
+
+__all__ = [name for name in _exports if not name.startswith("_")]
+
+
+def __getattr__(name):
+    # submodules are only imported when one of their names is first used so that their dependencies are not loaded by runs that don't need them
+    if name not in _exports:
+        raise AttributeError(f"module 'ccorrect' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f"ccorrect.{_exports[name]}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
@@ -1,36 +1,101 @@
 import gdb
+import re
 import sys
 import os
+import time
+import math
+import array
+import bisect
+import signal
+import resource
+import threading
+from collections import deque
 from contextlib import contextmanager
 from ccorrect._values import ValueBuilder, FuncWrapper, ensure_none_debugging, ensure_self_debugging
+from ccorrect._results import output_path
+from ccorrect._heap import write_heap_snapshot
+from ccorrect._preload import PreloadWatch, SIGNATURES, MAX_WHEN, FUNCTIONS as PRELOAD_FUNCTIONS, disable_library_locations
 
 
-def malloc_tracker(debugger, return_value, location):
-    start = return_value
-    size = debugger.stats[location].args[-1][0]
+class AllocationTracker:
+    """
+    Index of the memory regions allocated by the inferior: a sorted list of their start addresses to find the region containing an address
+    in O(log n), a dictionnary of their sizes by start address and their total size.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._sizes = {}
+        self.total_size = 0
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __iter__(self):
+        """Iterates over the (start, size) tuples of the regions, sorted by start address."""
+        return ((start, self._sizes[start]) for start in self._starts)
+
+    def add(self, start, size):
+        if start in self._sizes:
+            # the previous region at this address has been freed without being tracked
+            self.total_size -= self._sizes[start]
+        else:
+            bisect.insort(self._starts, start)
+        self._sizes[start] = size
+        self.total_size += size
+
+    def remove(self, start):
+        """Removes the region starting at `start`, returns False if there is none."""
+        size = self._sizes.pop(start, None)
+        if size is None:
+            return False
+        del self._starts[bisect.bisect_left(self._starts, start)]
+        self.total_size -= size
+        return True
+
+    def find(self, address):
+        """Returns the (start, size) tuple of the region containing `address` or None if there is none."""
+        i = bisect.bisect_right(self._starts, address) - 1
+        if i < 0:
+            return None
+        start = self._starts[i]
+        size = self._sizes[start]
+        return (start, size) if address < start + size else None
+
+    def clear(self):
+        self._starts.clear()
+        self._sizes.clear()
+        self.total_size = 0
+
+
+# the allocation trackers receive the return value and the arguments of the call (as gdb.Value or int) because the stats may not keep them
+
+
+def malloc_tracker(debugger, return_value, args):
+    start = int(return_value)
+    size = int(args[0])
     if start > 0:
-        debugger._allocated_regions.append((start, size))
+        debugger._allocations.add(start, size)
 
 
-def calloc_tracker(debugger, return_value, location):
-    start = return_value
-    size = debugger.stats[location].args[-1][0] * debugger.stats[location].args[-1][1]
+def calloc_tracker(debugger, return_value, args):
+    start = int(return_value)
+    size = int(args[0]) * int(args[1])
     if start > 0:
-        debugger._allocated_regions.append((start, size))
+        debugger._allocations.add(start, size)
 
 
-def realloc_tracker(debugger, return_value, location):
-    new_start = return_value
-    new_size = debugger.stats[location].args[-1][1]
-    target = debugger.stats[location].args[-1][0]
-    for i, (start, _) in enumerate(debugger._allocated_regions):
-        if start == target:
-            debugger._allocated_regions[i] = (new_start, new_size)
+def realloc_tracker(debugger, return_value, args):
+    new_start = int(return_value)
+    new_size = int(args[1])
+    target = int(args[0])
+    # the region is kept as is if realloc failed
+    if new_start > 0 and debugger._allocations.remove(target):
+        debugger._allocations.add(new_start, new_size)
 
 
-def free_tracker(debugger, _, location):
-    target = debugger.stats[location].args[-1][0]
-    debugger._allocated_regions = [(start, size) for start, size in debugger._allocated_regions if start != target]
+def free_tracker(debugger, _, args):
+    debugger._allocations.remove(int(args[0]))
 
 
 alloc_trackers = {
@@ -41,28 +106,428 @@ alloc_trackers = {
 }
 
 
+# state of the inferior kept between the tests by the `Debugger` instances using the checkpoint mode:
+# the "key" of the setup of the inferior, the number of the "pristine" checkpoint taken at main() and the number of the "current" checkpoint being tested
+_checkpoints = None
+
+
+def close_checkpoints():
+    """Kills the inferior and the checkpoints kept between the tests by the `Debugger` instances using the checkpoint mode, if any."""
+    global _checkpoints
+    if _checkpoints is None:
+        return
+    _checkpoints = None
+    try:
+        gdb.execute("kill")  # also kills all the checkpoints
+    except gdb.error:
+        pass
+    gdb.execute("file")
+
+
+def enable_index_cache(directory):
+    """Makes GDB save the symbol indexes it builds in `directory` and reuse them when the same object files are loaded again."""
+    os.makedirs(directory, exist_ok=True)
+    gdb.execute(f"set index-cache directory {directory}")
+    try:
+        gdb.execute("set index-cache enabled on")
+    except gdb.error:
+        # GDB < 12
+        gdb.execute("set index-cache on")
+
+
+def to_plain(value):
+    """Converts `value` (a `gdb.Value`) to a plain python value: an int or a float for scalars and pointers, the bytes of its contents otherwise."""
+    if not isinstance(value, gdb.Value):
+        return value
+    code = value.type.strip_typedefs().unqualified().code
+    if code == gdb.TYPE_CODE_FLT:
+        return float(value)
+    if code in (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_PTR, gdb.TYPE_CODE_ENUM, gdb.TYPE_CODE_BOOL, gdb.TYPE_CODE_CHAR):
+        return int(value)
+    if value.address is not None:
+        return gdb.selected_inferior().read_memory(value.address, value.type.sizeof).tobytes()
+    return str(value)
+
+
+class PlainColumn:
+    """
+    Plain python values (see `to_plain`) kept by a `FuncStats` in compact mode. While they are all ints or all floats, their `values` are
+    an `array.array` (8 bytes per value instead of a python object per value), otherwise they are a list.
+    Only the last `history` values are kept if it is not None: `values` is then a ring buffer whose oldest value is at index `start`.
+    """
+    def __init__(self, history=None):
+        self.history = history
+        self.values = None
+        self.start = 0
+
+    def append(self, value):
+        if self.values is None:
+            typecode = self.__typecode(value)
+            self.values = [] if typecode is None else array.array(typecode)
+        elif not self.__fits(value):
+            self.values = self.values.tolist()
+        if self.history is None or len(self.values) < self.history:
+            self.values.append(value)
+        else:
+            # the oldest value is replaced
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.history
+
+    def set_last(self, value):
+        if not self.__fits(value):
+            self.values = self.values.tolist()
+        self.values[self.__index(-1)] = value
+
+    def __index(self, i):
+        # index in `values` of the i-th kept value
+        return (self.start + range(len(self))[i]) % len(self.values)
+
+    def __fits(self, value):
+        if not isinstance(self.values, array.array):
+            return True
+        if self.values.typecode == "d":
+            return type(value) is float
+        if type(value) is not int:
+            return False
+        return 0 <= value < 2**64 if self.values.typecode == "Q" else -2**63 <= value < 2**63
+
+    @staticmethod
+    def __typecode(value):
+        if type(value) is float:
+            return "d"
+        if type(value) is int:
+            # unsigned 64 bits values (addresses, size_t...) only fit in the unsigned array
+            return "q" if -2**63 <= value < 2**63 else "Q" if 0 <= value < 2**64 else None
+        return None
+
+    def __len__(self):
+        return 0 if self.values is None else len(self.values)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        try:
+            return self.values[self.__index(i)]
+        except IndexError:
+            raise IndexError("column index out of range") from None
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.values[(self.start + i) % len(self.values)]
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class PlainArgs:
+    """
+    Arguments of the calls kept by a `FuncStats` in compact mode. The i-th argument of all the calls is kept in `columns[i]` (a `PlainColumn`)
+    and indexing rebuilds the list of the arguments of a call. If the calls don't all have the same number of arguments, the lists are kept instead.
+    """
+    def __init__(self, history=None):
+        self.history = history
+        self.columns = None
+        self.rows = None
+        self.length = 0
+
+    def append(self, args):
+        if self.rows is None and (args is None or (self.columns is not None and len(args) != len(self.columns))):
+            self.rows = list(self) if self.history is None else deque(self, maxlen=self.history)
+            self.columns = None
+        if self.rows is not None:
+            self.rows.append(args)
+            return
+
+        if self.columns is None:
+            self.columns = [PlainColumn(self.history) for _ in args]
+        for column, value in zip(self.columns, args):
+            column.append(value)
+        self.length = self.length + 1 if self.history is None else min(self.length + 1, self.history)
+
+    def set_last(self, i, value):
+        if self.rows is not None:
+            self.rows[-1][i] = value
+        else:
+            self.columns[i].set_last(value)
+
+    def __len__(self):
+        if self.rows is not None:
+            return len(self.rows)
+        return 0 if self.columns is None else self.length
+
+    def __getitem__(self, i):
+        if self.rows is not None:
+            return self.rows[i]
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        i = range(len(self))[i]
+        return [column[i] for column in self.columns]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
 class FuncStats:
-    def __init__(self, name: str):
+    """
+    Number of times a watched function has been `called`, with the `args` and the `returns` values of its calls.
+
+    If `history` is None, the arguments and return values of all the calls are kept. Otherwise, only the ones of the last `history` calls are kept
+    (0 only counts the calls). If `compact` is True, they are converted to plain python values (see `to_plain`) instead of being kept as `gdb.Value`
+    and they are stored by columns: `returns` is a `PlainColumn` and `args` is a `PlainArgs`, which keep the ints and the floats in arrays.
+    """
+    def __init__(self, name: str, history=None, compact=False):
         self.name = name
         self.called = 0
-        self.args = []
-        self.returns = []
+        self.history = history
+        self.compact = compact
+        if compact:
+            self.args = PlainArgs(history)
+            self.returns = PlainColumn(history)
+        else:
+            self.args = [] if history is None else deque(maxlen=history)
+            self.returns = [] if history is None else deque(maxlen=history)
+
+    def add_call(self, args):
+        self.called += 1
+        if self.history != 0:
+            self.args.append([to_plain(arg) for arg in args] if self.compact and args is not None else args)
+
+    def add_return(self, value):
+        if self.history != 0:
+            self.returns.append(to_plain(value) if self.compact else value)
+
+    def set_last_arg(self, i, value):
+        if self.history == 0 or not self.args or self.args[-1] is None:
+            return
+        if self.compact:
+            self.args.set_last(i, to_plain(value))
+        else:
+            self.args[-1][i] = value
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(name='{self.name}', called={self.called}, args={self.args}, returns={self.returns})"
 
 
 class FuncFinishBreakpoint(gdb.FinishBreakpoint):
-    def __init__(self, debugger, func_location, *args, **kwargs):
+    def __init__(self, debugger, func_location, call_args, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.debugger = debugger
         self.func_location = func_location
+        self.call_args = call_args
 
     def stop(self):
-        self.debugger.stats[self.func_location].returns.append(self.return_value)
+        self.debugger.stats[self.func_location].add_return(self.return_value)
 
         if self.func_location in alloc_trackers:
-            alloc_trackers[self.func_location](self.debugger, self.return_value, self.func_location)
+            alloc_trackers[self.func_location](self.debugger, self.return_value, self.call_args)
+
+        return False
+
+
+class CrashReport:
+    """Text file written by a `Debugger` when the inferior crashes, which stops being written after `max_size` bytes or `timeout` seconds."""
+
+    def __init__(self, file, max_size, timeout):
+        self.file = file
+        self.remaining = max_size
+        self.deadline = time.monotonic() + timeout
+        self.truncated = False
+
+    def has_budget(self):
+        return not self.truncated and self.remaining > 0 and time.monotonic() < self.deadline
+
+    def write(self, text):
+        """Writes `text` in the report, returns False if it was truncated because its budget is exhausted."""
+        if not self.has_budget():
+            self.truncate()
+            return False
+
+        data = text.encode(errors="replace")
+        if len(data) > self.remaining:
+            self.file.write(data[:self.remaining].decode(errors="ignore"))
+            self.remaining = 0
+            self.truncate()
+            return False
+
+        self.file.write(text)
+        self.remaining -= len(data)
+        return True
+
+    def truncate(self):
+        if not self.truncated:
+            self.truncated = True
+            self.file.write("\n--- crash report truncated ---\n")
+
+
+class Watchdog:
+    """
+    Thread of the GDB process which stops the inferior with a SIGSTOP (that it can't block, ignore or handle)
+    when it exceeds its wall-clock `deadline` or its CPU time `cpu_deadline`. The thread runs from `arm` until `disarm`.
+    """
+
+    # interval in seconds between two reads of the CPU time of the inferior
+    CPU_POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self.fired = False
+        self._pid = None
+        self._deadline = None
+        self._cpu_deadline = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def arm(self, pid, timeout=0, cpu_timeout=0):
+        """Watches the inferior `pid` for `timeout` seconds from now and `cpu_timeout` seconds of CPU time (0 means no limit)."""
+        with self._condition:
+            self.fired = False
+            self._pid = pid
+            self._deadline = time.monotonic() + timeout if timeout > 0 else None
+            self._cpu_deadline = self.cpu_time(pid) + cpu_timeout if cpu_timeout > 0 else None
+            if self._thread is None:
+                # gdb.Thread blocks the signals that GDB must receive itself (GDB >= 13)
+                self._thread = getattr(gdb, "Thread", threading.Thread)(target=self.__run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def disarm(self):
+        with self._condition:
+            self._pid = None
+            thread = self._thread
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+
+    def push_deadline(self, timeout):
+        """Brings the wall-clock deadline forward to `timeout` seconds from now if it is sooner, returns the previous deadline to restore it with `restore_deadline`."""
+        with self._condition:
+            previous = self._deadline
+            if timeout > 0 and (previous is None or time.monotonic() + timeout < previous):
+                self._deadline = time.monotonic() + timeout
+                self._condition.notify()
+            return previous
+
+    def restore_deadline(self, deadline):
+        with self._condition:
+            if not self.fired:
+                self._deadline = deadline
+                self._condition.notify()
+
+    def __run(self):
+        with self._condition:
+            while self._pid is not None:
+                if self.fired or (self._deadline is None and self._cpu_deadline is None):
+                    self._condition.wait()
+                    continue
+
+                now = time.monotonic()
+                expired = self._deadline is not None and now >= self._deadline
+                if not expired and self._cpu_deadline is not None:
+                    expired = self.cpu_time(self._pid) >= self._cpu_deadline
+
+                if expired:
+                    # set before sending the signal so that the stop event handler always knows that the SIGSTOP comes from the watchdog
+                    self.fired = True
+                    try:
+                        os.kill(self._pid, signal.SIGSTOP)
+                    except ProcessLookupError:
+                        self.fired = False
+                        self._pid = None
+                    continue
+
+                wait = None if self._deadline is None else self._deadline - now
+                if self._cpu_deadline is not None:
+                    wait = self.CPU_POLL_INTERVAL if wait is None else min(wait, self.CPU_POLL_INTERVAL)
+                self._condition.wait(wait)
+            # the next `arm` starts a new thread so that long-lived GDB processes (see WorkerPool) don't accumulate them
+            self._thread = None
+
+    @staticmethod
+    def cpu_time(pid):
+        """Returns the CPU time (user and system) used by the process `pid` in seconds."""
+        try:
+            # /proc/<pid>/stat times are in clock ticks
+            with open(f"/proc/{pid}/stat", "r") as f:
+                stat = f.read().rsplit(")", 1)[1].split()
+            return (int(stat[11]) + int(stat[12])) / os.sysconf("SC_CLK_TCK")
+        except OSError:
+            return 0
+
+
+# whether the `Watchdog` thread can run while the inferior executes a function called by GDB, None until it is checked
+_watchdog_supported = None
+
+# duration in microseconds of the call used to check if the `Watchdog` is supported
+WATCHDOG_PROBE_DURATION = 50000
+
+
+def watchdog_supported():
+    """
+    Returns True if GDB lets the other python threads run (it releases the GIL) while the inferior executes a function called from python,
+    which the `Watchdog` thread needs to stop it. Older GDB versions don't. This is checked once by calling usleep in the running inferior.
+    """
+    global _watchdog_supported
+    if _watchdog_supported is not None:
+        return _watchdog_supported
+
+    state = {"calling": False, "ran_during_call": False}
+    ready = threading.Event()
+
+    def probe():
+        ready.wait()
+        # this only runs before the end of the call if GDB released the GIL
+        state["ran_during_call"] = state["calling"]
+
+    thread = getattr(gdb, "Thread", threading.Thread)(target=probe, daemon=True)
+    thread.start()
+    try:
+        usleep = gdb.parse_and_eval("*(int (*)(unsigned int)) usleep")
+        state["calling"] = True
+        ready.set()
+        usleep(WATCHDOG_PROBE_DURATION)
+        _watchdog_supported = state["ran_during_call"]
+    except gdb.error:
+        # assume a recent GDB
+        _watchdog_supported = True
+    finally:
+        state["calling"] = False
+        ready.set()
+        thread.join()
+    return _watchdog_supported
+
+
+class FuncReturnBreakpoint(gdb.Breakpoint):
+    """Breakpoint on a return instruction of the function of a `FuncBreakpoint` which captures the return values of its watched calls."""
+
+    def __init__(self, owner, address, return_type):
+        super().__init__(f"*{address:#x}")
+        self.owner = owner
+        self.return_type = return_type
+
+    def stop(self):
+        # the stack pointer points to the return address of the call, which was the stack pointer of the caller (see FuncBreakpoint.push_call)
+        caller_sp = int(gdb.parse_and_eval("$sp")) + 8
+        if caller_sp not in self.owner.calls:
+            return False
+        args = self.owner.calls.pop(caller_sp)
+
+        code = self.return_type.strip_typedefs().code
+        if code == gdb.TYPE_CODE_VOID:
+            return_value = None
+        elif code == gdb.TYPE_CODE_FLT:
+            # only floats and doubles are captured by return breakpoints (see FuncBreakpoint.__set_return_breakpoints)
+            register = "$xmm0.v4_float[0]" if self.return_type.strip_typedefs().sizeof == 4 else "$xmm0.v2_double[0]"
+            return_value = gdb.parse_and_eval(register).cast(self.return_type)
+        else:
+            return_value = gdb.parse_and_eval("$rax").cast(self.return_type)
+
+        debugger = self.owner.debugger
+        debugger.stats[self.owner.location].add_return(return_value)
+        if self.owner.location in alloc_trackers:
+            alloc_trackers[self.owner.location](debugger, return_value, args)
 
         return False
 
@@ -73,26 +538,108 @@ class FuncBreakpoint(gdb.Breakpoint):
         self.debugger = debugger
         self.failure = failure
         self.watch = watch
+        # argument symbols of each location (by pc) of the breakpoint
+        self.__arg_symbols = {}
+        # return breakpoints of each location (by pc) of the breakpoint, None if the returns of the location are captured by FinishBreakpoints
+        self.__return_breakpoints = {}
+        # arguments of the watched calls waiting for their return value, by stack pointer of their caller
+        self.calls = {}
+        if debugger._preload is not None:
+            disable_library_locations(self, debugger._preload.library)
 
     def get_args(self):
         try:
             frame = gdb.newest_frame()
-            block = frame.block()
-            return [symbol.value(frame) for symbol in block if symbol.is_argument]
+            pc = frame.pc()
+            symbols = self.__arg_symbols.get(pc)
+            if symbols is None:
+                # the arguments of a location never change so its block is only searched on its first hit
+                symbols = self.__arg_symbols[pc] = [symbol for symbol in frame.block() if symbol.is_argument]
+            return [symbol.value(frame) for symbol in symbols]
         except RuntimeError:
             return None
 
-    def set_finish_breakpoint(self):
+    def set_finish_breakpoint(self, args):
+        if self.debugger._return_capture == "ret" and self.push_call(args):
+            return
         try:
-            FuncFinishBreakpoint(self.debugger, self.location)
+            FuncFinishBreakpoint(self.debugger, self.location, args)
         except ValueError:
             # print(f"Cannot set finish breakpoint for '{self.location}'", file=sys.stderr)
             pass
 
+    def push_call(self, args):
+        """Makes the return breakpoints of the current location capture the return value of this call, returns False if they can't."""
+        try:
+            frame = gdb.newest_frame()
+            pc = frame.pc()
+            if pc not in self.__return_breakpoints:
+                self.__return_breakpoints[pc] = self.__set_return_breakpoints(frame)
+            if self.__return_breakpoints[pc] is None:
+                return False
+
+            caller = frame.older()
+            if caller is None or caller.type() == gdb.DUMMY_FRAME:
+                # called by gdb
+                return True
+            self.calls[int(caller.read_register("rsp"))] = args
+            return True
+        except RuntimeError:
+            return False
+
+    def delete(self):
+        for breakpoints in self.__return_breakpoints.values():
+            for bp in breakpoints or []:
+                if bp.is_valid():
+                    bp.delete()
+        super().delete()
+
+    def __set_return_breakpoints(self, frame):
+        """
+        Sets a breakpoint on each return instruction of the function of `frame`, found by disassembling it, and returns them.
+        Returns None if the return values of this function can't be captured this way.
+        """
+        if frame.architecture().name() != "i386:x86-64" or frame.function() is None:
+            return None
+        return_type = frame.function().type.target()
+        code = return_type.strip_typedefs().code
+        if code not in (gdb.TYPE_CODE_VOID, gdb.TYPE_CODE_INT, gdb.TYPE_CODE_PTR, gdb.TYPE_CODE_ENUM,
+                        gdb.TYPE_CODE_BOOL, gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_FLT):
+            # aggregates are not returned in a single register
+            return None
+        if code == gdb.TYPE_CODE_FLT and return_type.strip_typedefs().sizeof not in (4, 8):
+            # only floats and doubles are returned in xmm0 (a long double is returned in st0, a _Float128 in the 16 bytes of xmm0)
+            return None
+
+        block = frame.block()
+        while block.function is None:
+            block = block.superblock
+
+        addresses = []
+        for instruction in frame.architecture().disassemble(block.start, block.end - 1):
+            # skip the prefixes (rep, bnd, notrack...)
+            mnemonic = next((word for word in instruction["asm"].split() if word.startswith(("ret", "jmp"))), "")
+            if mnemonic.startswith("ret"):
+                addresses.append(instruction["addr"])
+            elif mnemonic.startswith("jmp"):
+                target = re.search(r"\b0x([0-9a-f]+)\b", instruction["asm"])
+                if target is None or not block.start <= int(target.group(1), 16) < block.end:
+                    # indirect jump or tail call: the function may return without executing one of its return instructions
+                    return None
+
+        if not addresses:
+            return None
+        return [FuncReturnBreakpoint(self, address, return_type) for address in addresses]
+
     def stop(self):
         if gdb.convenience_variable("__CCorrect_disable_watch_fail"):
             return False
 
+        if not self.watch and self.failure is None and not self.debugger._allocated_addresses:
+            # the free breakpoint stops on every free of the inferior but only needs its argument to forget the values freed by the
+            # inferior that were allocated by the Debugger, reading it (from the frame of the call) is skipped when there is none
+            return False
+
         args = self.get_args()
         stats = self.debugger.stats
 
@@ -104,10 +651,9 @@ class FuncBreakpoint(gdb.Breakpoint):
         if self.watch:
             # if we can't set finish breakpoint, it's because the frame must be a dummy frame (meaning it's called by gdb so we don't want to keep stats of it)
             if self.failure is None:
-                self.set_finish_breakpoint()
+                self.set_finish_breakpoint(args)
 
-            stats[self.location].called += 1
-            stats[self.location].args.append(args)
+            stats[self.location].add_call(args)
 
         if self.failure is not None:
             if "when" in self.failure and self.failure["when"] is not None:
@@ -123,7 +669,7 @@ class FuncBreakpoint(gdb.Breakpoint):
                     self.failure["when"].remove(when_count)
                 else:
                     if self.watch:
-                        self.set_finish_breakpoint()
+                        self.set_finish_breakpoint(args)
                     return False
 
             if "errno" in self.failure and self.failure["errno"] is not None:
@@ -144,16 +690,16 @@ class FuncBreakpoint(gdb.Breakpoint):
                     inferior.write_memory(old, new_bytes, new.type.sizeof)
 
                     if self.watch:
-                        stats[self.location].args[-1][i] = new
+                        stats[self.location].set_last_arg(i, new)
 
             if "return" in self.failure and self.failure["return"] is not None:
                 gdb.set_convenience_variable("__CCorrect_return_var", self.failure["return"])
                 if self.watch:
-                    stats[self.location].returns.append(gdb.convenience_variable('__CCorrect_return_var'))
+                    stats[self.location].add_return(gdb.convenience_variable('__CCorrect_return_var'))
                 gdb.execute("return $__CCorrect_return_var")
             else:
                 if self.watch:
-                    stats[self.location].returns.append(None)
+                    stats[self.location].add_return(None)
                 gdb.execute("return")
 
         return False
@@ -168,15 +714,76 @@ class Debugger(ValueBuilder):
     If `asan_detect_leaks` is set to True and if the tested program has been compiled with the `-fsanitize=address` option, LeakSanitizer's will be enabled to find memory leaks.
 
     The GDB process needs to have access to the tested program and the standard library symbols for a `Debugger` to work.
+
+    If `debuginfod` is set to False, GDB does not download missing debug information from debuginfod servers (which can stall on hosts without network access).
+    If `index_cache` is the path of a directory, GDB saves the symbol indexes it builds in this directory and reuses them instead of building them again
+    each time the tested program and its shared libraries are loaded (see `ccorrect.build_index_cache`).
+    When they are None, they are set by the 'CCORRECT_DEBUGINFOD' ('0' disables debuginfod) and 'CCORRECT_INDEX_CACHE' environment variables.
+
+    If `checkpoint` is set to True, the tested program is only loaded and started once: a checkpoint (a fork of the inferior) is taken when it reaches main()
+    and each `start` gives a fresh copy of this checkpoint to the test, which is discarded by `finish`. This is much faster than loading and starting the program for each test.
+    The program must not have any side effect outside of its memory before main() as they are only done once. This cannot be used with `asan_detect_leaks`.
+
+    If `watch_backend` is 'preload', the calls of malloc, calloc, realloc and free are watched by a library preloaded in the inferior
+    which logs them in a ring buffer of `watch_buffer_size` calls shared with GDB instead of stopping the inferior on each call.
+    The logged calls are read in bulk into `stats` when a `watch` exits, after each call of a function of the inferior by a `FuncWrapper`
+    and by `malloced` and `allocated_size`. The number of calls is always exact but the oldest arguments and return values are lost if more than
+    `watch_buffer_size` calls are logged between two reads. The other functions are still watched with breakpoints.
+
+    If `return_capture` is 'ret', the return values of the functions watched with breakpoints are captured by permanent breakpoints
+    on their return instructions (found once by disassembling them) instead of creating a `gdb.FinishBreakpoint` for each call.
+    This is only possible on x86-64 for functions with debug information that return a scalar, a pointer or nothing and that don't make tail calls.
+    The other functions still use a `gdb.FinishBreakpoint`.
+
+    When the inferior crashes, the backtrace and the variables of its `backtrace_max_depth` newest frames are written in 'crash_log.txt'.
+    A summary of every variable (the value of scalars and pointers, the size and address of arrays, structures and unions) is written first,
+    then the content of the arrays, structures and unions while the report is smaller than `crash_report_max_size` bytes and took less
+    than `crash_report_timeout` seconds to write. The report is truncated when one of these limits is reached.
+    If allocations are tracked (by watching malloc, calloc, realloc or free), the content of the allocated blocks is also written in a binary
+    heap snapshot 'heap_snapshot.<pid>.bin' of at most `heap_snapshot_max_size` bytes of content (0 disables it), to be loaded later by `ccorrect.load_heap_snapshot`.
+
+    If `arena_size` is greater than 0, the values built by `value`, `pointer` and `string` are allocated in arenas of `arena_size` bytes
+    (allocated with a single malloc when the previous one is full) instead of allocating each value and each pointed value separately.
+    All the bytes of a value, including the values it points to, are then written with a single write and `free_allocated_values` frees the arenas.
+    This makes building big values (such as long linked lists) much faster but the tested program must not free or reallocate them.
+
+    After each `finish`, the `resources` attribute contains the resources used by the inferior since its `start`: its "wall_time",
+    "cpu_user" and "cpu_system" times in seconds and its "peak_rss" (peak resident memory size) in bytes, or None if they could not be measured.
+    If the inferior exited by itself during the test (for example when it is stopped by AddressSanitizer), its "peak_rss" is
+    the highest one of all the inferiors of the GDB process.
     """
-    def __init__(self, program, backtrace_max_depth=8, asan_detect_leaks=False):
-        super().__init__()
+    def __init__(self, program, backtrace_max_depth=8, asan_detect_leaks=False, debuginfod=None, index_cache=None, checkpoint=False,
+                 watch_backend="breakpoint", watch_buffer_size=65536, return_capture="finish", crash_report_max_size=65536, crash_report_timeout=2.0,
+                 heap_snapshot_max_size=16777216, arena_size=0):
+        if checkpoint and asan_detect_leaks:
+            # LeakSanitizer needs the inferior to be detached and to exit normally, which is not possible for a checkpoint
+            raise ValueError("The checkpoint mode cannot be used with 'asan_detect_leaks'")
+        if watch_backend not in ("breakpoint", "preload"):
+            raise ValueError(f"Invalid watch backend '{watch_backend}' (must be 'breakpoint' or 'preload')")
+        if return_capture not in ("finish", "ret"):
+            raise ValueError(f"Invalid return capture '{return_capture}' (must be 'finish' or 'ret')")
+        super().__init__(arena_size)
         self.stats = {}
+        self.resources = None
         self.backtrace_max_depth = backtrace_max_depth
+        self.crash_report_max_size = crash_report_max_size
+        self.crash_report_timeout = crash_report_timeout
+        self.heap_snapshot_max_size = heap_snapshot_max_size
         self._program = program
         self._asan_detect_leaks = asan_detect_leaks
-        self._allocated_regions = []
+        self._debuginfod = os.environ.get("CCORRECT_DEBUGINFOD", "1") != "0" if debuginfod is None else debuginfod
+        self._index_cache = os.environ.get("CCORRECT_INDEX_CACHE") if index_cache is None else index_cache
+        self._checkpoint = checkpoint
+        self._preload = PreloadWatch(watch_buffer_size) if watch_backend == "preload" else None
+        self._return_capture = return_capture
+        self._allocations = AllocationTracker()
         self.__breakpoints = {}
+        self.__watchdog = Watchdog()
+        self.__call_deadline = None
+        # signals of the timeouts enforced without the watchdog (see `watchdog_supported`)
+        self.__timeout_signals = set()
+        self.__signal_timed_out = False
+        self.__call_alarm = None
 
     def __enter__(self):
         pid = self.start()
@@ -187,10 +794,14 @@ class Debugger(ValueBuilder):
 
     @contextmanager
     @ensure_self_debugging
-    def watch(self, functions):
+    def watch(self, functions, history=None, compact=False):
         """
         Collect the number of calls, arguments and returns values of the given functions and place them in the `stats` dictionnary of the `Debugger` instance.
 
+        By default, the arguments and return values of every call are kept as `gdb.Value`. For functions called a lot of times, `history` limits them
+        to the ones of the last `history` calls (0 only counts the calls) and `compact` converts them to plain python values (see `FuncStats`).
+        These options are set when the `FuncStats` of a function is created, by the first `watch` of this function since the `stats` were cleared.
+
         This cannot watch function calls that are directly called by the debugger/gdb
 
         Usage example::
@@ -217,7 +828,17 @@ class Debugger(ValueBuilder):
 
         cleanup_breakpoints = []
         cleanup_watch = []
+        cleanup_preload = []
         for func in functions:
+            if func not in self.stats:
+                self.stats[func] = FuncStats(func, history=history, compact=compact)
+
+            if self._preload is not None and func in PRELOAD_FUNCTIONS:
+                if not self._preload.is_watched(func):
+                    self._preload.set_watched(func, True)
+                    cleanup_preload.append(func)
+                continue
+
             bp = self.__get_breakpoint(func)
             if bp is None:
                 # create a new watch breakpoint if there wasn't one at this location
@@ -228,13 +849,14 @@ class Debugger(ValueBuilder):
                 # start watching if there is already a breakpoint at this location but it isn't watching
                 bp.watch = True
                 cleanup_watch.append(bp)
-            
-            if func not in self.stats:
-                self.stats[func] = FuncStats(func)
 
         try:
             yield
         finally:
+            if cleanup_preload:
+                self._read_preload()
+            for func in cleanup_preload:
+                self._preload.set_watched(func, False)
             for bp in cleanup_watch:
                 bp.watch = False
             for bp in cleanup_breakpoints:
@@ -252,6 +874,9 @@ class Debugger(ValueBuilder):
 
         This cannot fail function calls that are directly called by the debugger/gdb
 
+        With the 'preload' watch backend, malloc, calloc, realloc and free are failed by the preloaded library without stopping the inferior
+        unless `ret_args` is set or `when` contains more than 64 call indexes.
+
         Usage example::
 
             debugger = Debugger("program")
@@ -270,11 +895,20 @@ class Debugger(ValueBuilder):
             debuffer.finish()
         """
         # TODO function can be a gdb.Value
+        if self._preload is not None and function in PRELOAD_FUNCTIONS and ret_args is None and (when is None or 0 < len(when) <= MAX_WHEN):
+            old_fault = self._preload.fault(function)
+            self._preload.set_fault(function, 0 if retval is None else int(retval), None if errno is None else int(errno), when)
+            try:
+                yield
+            finally:
+                self._preload.restore_fault(function, old_fault)
+            return
+
         failure = {}
 
         if retval is not None:
             if not isinstance(retval, gdb.Value):
-                retval = self.value(gdb.parse_and_eval(function).type.target(), retval)
+                retval = self.value(self._lookups.function(function).value.type.target(), retval)
             failure["return"] = retval
 
         if errno is not None:
@@ -284,10 +918,9 @@ class Debugger(ValueBuilder):
         if ret_args is not None:
             assert isinstance(ret_args, dict)
 
-            func = gdb.parse_and_eval(function)
+            func_arg_types = self._lookups.function(function).arg_types
             parsed_ret_args = {}
-            func_type_fields = func.type.fields()
-            arg_types = [(func_type_fields[i].type, i) for i in ret_args.keys()]
+            arg_types = [(func_arg_types[i], i) for i in ret_args.keys()]
             for arg, (type, i) in zip(ret_args.values(), arg_types):
                 if isinstance(arg, FuncWrapper):
                     arg = arg._value
@@ -322,62 +955,128 @@ class Debugger(ValueBuilder):
                 bp.delete()
 
     @ensure_none_debugging
-    def start(self, timeout=0):
+    def start(self, timeout=0, memory_limit=0, cpu_limit=0, cpu_timeout=0):
         """
         Starts the `Debugger`, reserving GDB for this instance. This must be called for every other method of `Debugger` to work.
-        A `timeout` in seconds can be set in order to limit the execution time of the inferior (0 means no timeout).
+        A `timeout` in seconds of wall-clock time and a `cpu_timeout` in seconds of CPU time can be set in order to limit the execution time of the inferior (0 means no timeout).
+        They are enforced by a watchdog thread of the GDB process which stops the inferior when they expire, even if it blocks or ignores signals.
+        If GDB doesn't let this thread run while the inferior executes (older GDB versions), the inferior is stopped by a SIGALRM (see `alarm`)
+        for the `timeout` and by a SIGXCPU (see `cpu_limit` below) for the `cpu_timeout` instead.
+        The call of a function of the inferior running at this moment raises a `gdb.error` and `timed_out` becomes True.
+        A single call can also be limited with the `timeout` argument of a `FuncWrapper`.
+
+        A `memory_limit` in bytes and a `cpu_limit` in seconds of CPU time can be set in order to limit the resources used by the inferior (0 means no limit).
+        The inferior receives a SIGXCPU signal when it exceeds its CPU limit. Memory allocations fail when it exceeds its memory limit
+        (its address space size) or, if it has been compiled with the `-fsanitize=address` option, it is stopped by AddressSanitizer when its resident memory exceeds the limit.
         """
         self.stats.clear()
-        self._allocated_regions.clear()
+        self.resources = None
+        self._allocations.clear()
 
         # enable debuginfod if possible
         try:
-            gdb.execute("set debuginfod enabled on")
+            gdb.execute(f"set debuginfod enabled {'on' if self._debuginfod else 'off'}")
         except gdb.error:
-            print("debuginfod cannot be enabled", file=sys.stderr)
+            if self._debuginfod:
+                print("debuginfod cannot be enabled", file=sys.stderr)
+
+        if self._index_cache:
+            enable_index_cache(self._index_cache)
 
         gdb.events.stop.connect(self.__stop_event_handler)
         gdb.events.exited.connect(self.__exited_event_handler)
 
         # gdb.execute(f"set environment ASAN_OPTIONS=log_path=asan_log:detect_leaks={int(self._asan_detect_leaks)}:stack_trace_format='[]'")
-        gdb.execute(f"set environment ASAN_OPTIONS=log_path=asan_log:detect_leaks={int(self._asan_detect_leaks)}")
-        gdb.execute("set environment TSAN_OPTIONS=log_path=tsan_log")
+        asan_options = f"log_path={output_path('asan_log')}:detect_leaks={int(self._asan_detect_leaks)}"
+        if memory_limit > 0:
+            # AddressSanitizer reserves a huge address space so it must enforce the limit by itself
+            asan_options += f":hard_rss_limit_mb={math.ceil(memory_limit / 2**20)}"
+        if self._preload is not None:
+            # the preloaded library comes before the AddressSanitizer runtime
+            asan_options += ":verify_asan_link_order=0"
+        gdb.execute(f"set environment ASAN_OPTIONS={asan_options}")
+        gdb.execute(f"set environment TSAN_OPTIONS=log_path={output_path('tsan_log')}")
 
         # prevent malloced memory to be set to 0 (ignored when compiled with "-fsanitize=address" but it does something similar)
         gdb.execute("set environment GLIBC_TUNABLES=glibc.malloc.perturb=42")
 
-        gdb.execute(f"file {self._program}")  # load program
-        gdb.execute("start 1> stdout.txt 2> stderr.txt")
+        if self._checkpoint:
+            self._start_time = time.monotonic()
+            self.__start_checkpoint(asan_options)
+        else:
+            close_checkpoints()
+            gdb.execute(f"file {self._program}")  # load program
+            self.__setup_preload()
+            self._start_time = time.monotonic()
+            gdb.execute(f"start 1> '{output_path('stdout.txt')}' 2> '{output_path('stderr.txt')}'")
+            # taken once the previous inferior has been killed and waited by the start command
+            self._children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.__started_preload()
+        pid = gdb.selected_inferior().pid
+        # the lookups are kept as long as the same program stays loaded (checkpoint mode)
+        self._lookups.use(gdb.current_progspace().objfiles()[0])
+
+        if memory_limit > 0 and not self.__is_sanitized():
+            resource.prlimit(pid, resource.RLIMIT_AS, (memory_limit, memory_limit))
+        if cpu_limit > 0:
+            # the hard limit kills the inferior so it is set a bit higher to let gdb catch the SIGXCPU sent at the soft limit
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))
 
         # create breakpoint after start command to avoid the address sanitizer setup
         self.__free_breakpoint = FuncBreakpoint(self, False, None, "free")
         self.__free_breakpoint.watch = False
 
-        if timeout > 0:
-            gdb.execute("handle SIGALRM stop")  # tell gdb to stop when the inferior receives a SIGALRM
-            gdb.parse_and_eval(f"(unsigned int) alarm({timeout})")
+        # the SIGSTOP sent by the watchdog stops the inferior but must not be delivered again when it is resumed
+        gdb.execute("handle SIGSTOP stop print nopass")
+        self.__timeout_signals.clear()
+        self.__signal_timed_out = False
+        if (timeout > 0 or cpu_timeout > 0) and not watchdog_supported():
+            self.__arm_signal_timeouts(pid, timeout, cpu_timeout)
+            timeout = cpu_timeout = 0
+        self.__watchdog.arm(pid, timeout, cpu_timeout)
 
         gdb.set_convenience_variable("__CCorrect_debugging", self._id)
 
-        return gdb.selected_inferior().pid
+        return pid
 
     @ensure_self_debugging
     def finish(self, free_allocated_values=True):
         """
         Finishes the `Debugger`, releasing GDB for other `Debugger` instances.
         All allocated values by the `value`, `pointer` and `string` methods are freed by default but this behaviour can be changed by setting `free_allocated_values` to False.
+        The inferior is killed if it exceeded a timeout (see `timed_out`).
         """
-        try:
-            if free_allocated_values:
-                self.free_allocated_values()
-            self.__detach_and_wait_leak_sanitizer()
-        except gdb.error:
-            pass
+        self.__watchdog.disarm()
+        if self._checkpoint:
+            # the values are freed with the checkpoint
+            self._allocated_addresses.clear()
+            self._arena = None
+            self.__discard_checkpoint()
+        else:
+            # measured before anything else because the inferior is not waited below if it crashed,
+            # it is replaced by the measure of the whole execution of the inferior if it is waited
+            pid = gdb.selected_inferior().pid
+            self.resources = self.__proc_resources(pid) if pid else self.__exited_resources()
+            try:
+                if self.timed_out:
+                    # the inferior may still be running the code that exceeded the timeout (an infinite loop...) if it is resumed
+                    # so it is killed (and waited by gdb) instead of being detached, which also frees its values
+                    self._allocated_addresses.clear()
+                    self._arena = None
+                    gdb.execute("kill")
+                else:
+                    if free_allocated_values:
+                        self.free_allocated_values()
+                    self.__detach_and_wait_leak_sanitizer()
+            except gdb.error:
+                pass
 
         gdb.events.stop.disconnect(self.__stop_event_handler)
         gdb.events.exited.disconnect(self.__exited_event_handler)
 
-        gdb.execute("file")  # discard any info on the loaded program and the symbol table
+        if not self._checkpoint:
+            gdb.execute("file")  # discard any info on the loaded program and the symbol table
+            self._lookups.clear()
         gdb.execute("delete")  # delete all breakpoints
         self.__breakpoints.clear()
         self.__free_breakpoint = None
@@ -386,13 +1085,13 @@ class Debugger(ValueBuilder):
     @ensure_self_debugging
     def get_stdout(self):
         """Returns a list where each element is a line of the inferior's stdout."""
-        with open("stdout.txt", "r") as f:
+        with open(output_path("stdout.txt"), "r") as f:
             return f.readlines()
 
     @ensure_self_debugging
     def get_stderr(self):
         """Returns a list where each element is a line of the inferior's stderr."""
-        with open("stderr.txt", "r") as f:
+        with open(output_path("stderr.txt"), "r") as f:
             return f.readlines()
 
     @ensure_self_debugging
@@ -405,17 +1104,125 @@ class Debugger(ValueBuilder):
         """
         Check if a given memory address is within one of the allocated regions (this only keep track of allocated memory when malloc/calloc/realloc/free are watched).
         """
-        for start, size in self._allocated_regions:
-            if ptr >= start and ptr < start + size:
-                return True
-        return False
+        self._read_preload()
+        return self._allocations.find(int(ptr)) is not None
 
     @ensure_self_debugging
     def allocated_size(self):
         """
         Returns the total size of all allocated memory regions (this only keep track of allocated memory when malloc/calloc/realloc/free are watched).
         """
-        return sum(size for _, size in self._allocated_regions)
+        self._read_preload()
+        return self._allocations.total_size
+
+    @property
+    def timed_out(self):
+        """True if the inferior has been stopped since the last `start` because it exceeded a timeout."""
+        return self.__watchdog.fired or self.__signal_timed_out
+
+    def _before_call(self, timeout):
+        if timeout > 0 and not watchdog_supported():
+            self.__call_alarm = self.__push_alarm(timeout)
+        else:
+            self.__call_deadline = self.__watchdog.push_deadline(timeout)
+
+    def _after_call(self):
+        if self.__call_alarm is not None:
+            self.__restore_alarm(*self.__call_alarm)
+            self.__call_alarm = None
+        else:
+            self.__watchdog.restore_deadline(self.__call_deadline)
+            self.__call_deadline = None
+        self._read_preload()
+
+    def __arm_signal_timeouts(self, pid, timeout, cpu_timeout):
+        """Enforces the timeouts with signals sent to the inferior, which it can block or ignore, when the watchdog is not supported."""
+        if timeout > 0:
+            self.__push_alarm(timeout)
+        if cpu_timeout > 0:
+            limit = math.ceil(Watchdog.cpu_time(pid) + cpu_timeout)
+            soft, hard = resource.prlimit(pid, resource.RLIMIT_CPU)
+            if soft == resource.RLIM_INFINITY or limit < soft:
+                # the inferior is killed by the hard limit if it is still running a second later
+                hard = limit + 1 if hard == resource.RLIM_INFINITY else min(limit + 1, hard)
+                resource.prlimit(pid, resource.RLIMIT_CPU, (limit, hard))
+                gdb.execute("handle SIGXCPU stop print nopass")
+                self.__timeout_signals.add("SIGXCPU")
+
+    def __push_alarm(self, timeout):
+        """Sets an alarm of the inferior in `timeout` seconds unless its current one is sooner, returns what `__restore_alarm` needs to restore it."""
+        gdb.execute("handle SIGALRM stop print nopass")
+        self.__timeout_signals.add("SIGALRM")
+        seconds = math.ceil(timeout)
+        previous = int(gdb.parse_and_eval(f"(unsigned int) alarm({seconds})"))
+        if 0 < previous <= seconds:
+            gdb.parse_and_eval(f"(unsigned int) alarm({previous})")
+        return previous, time.monotonic()
+
+    def __restore_alarm(self, previous, pushed_time):
+        # an alarm that would have rung during the call rings as soon as possible
+        seconds = max(math.ceil(previous - (time.monotonic() - pushed_time)), 1) if previous > 0 else 0
+        try:
+            gdb.parse_and_eval(f"(unsigned int) alarm({seconds})")
+        except gdb.error:
+            # the inferior has exited
+            pass
+
+    def _pause_watch(self, paused):
+        if self._preload is not None:
+            self._preload.set_paused(paused)
+
+    def _read_preload(self):
+        """Moves the calls logged by the preloaded library into `stats`, as if they had been watched with breakpoints."""
+        if self._preload is None or gdb.convenience_variable("__CCorrect_debugging") is None:
+            return
+
+        records, counts = self._preload.read()
+        for function, args, ret in records:
+            stats = self.stats.setdefault(function, FuncStats(function))
+            ret_type, arg_types = SIGNATURES[function]
+            if ret_type is None:
+                ret = None
+            if stats.history == 0 or stats.compact:
+                # the values don't need to be converted to gdb.Value
+                stats.add_call(list(args))
+                stats.add_return(ret)
+            else:
+                stats.add_call([self.__preload_value(value, type) for value, type in zip(args, arg_types)])
+                stats.add_return(None if ret is None else self.__preload_value(ret, ret_type))
+            if function in alloc_trackers:
+                alloc_trackers[function](self, ret, args)
+            counts[function] -= 1
+
+        lost = 0
+        for function, count in counts.items():
+            # the calls that could not be kept by the ring buffer are still counted
+            self.stats.setdefault(function, FuncStats(function)).called += count
+            lost += count
+        if lost > 0:
+            print(f"{lost} watched calls could not be recorded (increase the 'watch_buffer_size' of the Debugger)", file=sys.stderr)
+
+    def __preload_value(self, value, type):
+        if type.endswith("*"):
+            return gdb.Value(value).cast(self._lookups.type(type[:-1].strip()).pointer())
+        return gdb.Value(value).cast(self._lookups.type(type))
+
+    def __setup_preload(self):
+        if self._preload is None:
+            # the environment of the inferior may have been changed by another Debugger
+            for name in ("LD_PRELOAD", "CCORRECT_WATCH_SHM"):
+                if name in os.environ:
+                    gdb.execute(f"set environment {name}={os.environ[name]}")
+                else:
+                    gdb.execute(f"unset environment {name}")
+            return
+
+        for name, value in self._preload.setup().items():
+            gdb.execute(f"set environment {name}={value}")
+
+    def __started_preload(self):
+        if self._preload is not None:
+            self._preload.started()
 
     def __get_breakpoint(self, function):
         if function == "free":
@@ -424,13 +1231,97 @@ class Debugger(ValueBuilder):
             return self.__breakpoints[function]
         return None
 
+    def __is_sanitized(self):
+        try:
+            gdb.parse_and_eval("__asan_init")
+            return True
+        except gdb.error:
+            return False
+
+    def __checkpoint(self):
+        output = gdb.execute("checkpoint", to_string=True)
+        return int(re.search(r"checkpoint (\d+)", output).group(1))
+
+    def __start_checkpoint(self, asan_options):
+        global _checkpoints
+        stdout_path = output_path("stdout.txt")
+        stderr_path = output_path("stderr.txt")
+        key = (os.path.abspath(self._program), asan_options, os.path.abspath(stdout_path), os.path.abspath(stderr_path))
+
+        if _checkpoints is not None and _checkpoints["key"] == key:
+            # the pristine checkpoint becomes the tested inferior and a copy of it is kept as the new pristine checkpoint
+            gdb.execute(f"restart {_checkpoints['pristine']}", to_string=True)
+            _checkpoints["current"] = _checkpoints["pristine"]
+            _checkpoints["pristine"] = self.__checkpoint()
+            return
+
+        close_checkpoints()
+        for path in (stdout_path, stderr_path):
+            open(path, "w").close()
+        gdb.execute(f"file {self._program}")  # load program
+        self.__setup_preload()
+        # all the checkpoints share the same stdout and stderr files, which are truncated after each test, so they must write at their end
+        gdb.execute(f"start 1>> '{stdout_path}' 2>> '{stderr_path}'")
+        self.__started_preload()
+        # the main process (checkpoint 0) is tested first
+        _checkpoints = {"key": key, "pristine": self.__checkpoint(), "current": 0}
+
+    def __discard_checkpoint(self):
+        self.resources = self.__proc_resources(gdb.selected_inferior().pid)
+
+        try:
+            gdb.execute(f"restart {_checkpoints['pristine']}", to_string=True)
+            gdb.execute(f"delete checkpoint {_checkpoints['current']}")
+        except gdb.error:
+            # the tested inferior has already exited
+            pass
+        _checkpoints["current"] = None
+
+    def __proc_resources(self, pid):
+        """Returns the resources used so far by the running inferior `pid` or None if they cannot be read."""
+        try:
+            # /proc/<pid>/stat times are in clock ticks
+            with open(f"/proc/{pid}/stat", "r") as f:
+                stat = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/status", "r") as f:
+                peak_rss = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            return None
+        return {
+            "wall_time": round(time.monotonic() - self._start_time, 3),
+            "cpu_user": round(int(stat[11]) / os.sysconf("SC_CLK_TCK"), 3),
+            "cpu_system": round(int(stat[12]) / os.sysconf("SC_CLK_TCK"), 3),
+            "peak_rss": peak_rss * 1024  # VmHWM is in kilobytes
+        }
+
+    def __exited_resources(self):
+        """Returns the resources used by the inferior that exited during the test, which GDB has already waited."""
+        # the usage of the waited children of this process only grows so the inferior used the difference since its start
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return {
+            "wall_time": round(time.monotonic() - self._start_time, 3),
+            "cpu_user": round(usage.ru_utime - self._children_usage.ru_utime, 3),
+            "cpu_system": round(usage.ru_stime - self._children_usage.ru_stime, 3),
+            # the peak of the children is the highest one of all of them, this is an upper bound
+            "peak_rss": usage.ru_maxrss * 1024  # ru_maxrss is in kilobytes
+        }
+
     def __detach_and_wait_leak_sanitizer(self):
         # detach inferior process to allow the leak sanitizer to work
         # https://stackoverflow.com/a/54373833
         pid = gdb.selected_inferior().pid
+        if "SIGALRM" in self.__timeout_signals:
+            # the detached inferior must not be killed by its alarm
+            gdb.parse_and_eval("(unsigned int) alarm(0)")
         gdb.execute("detach")
         # waiting for the leak sanitizer checks to complete
-        os.waitpid(pid, 0)
+        _, _, rusage = os.wait4(pid, 0)
+        self.resources = {
+            "wall_time": round(time.monotonic() - self._start_time, 3),
+            "cpu_user": round(rusage.ru_utime, 3),
+            "cpu_system": round(rusage.ru_stime, 3),
+            "peak_rss": rusage.ru_maxrss * 1024  # ru_maxrss is in kilobytes
+        }
 
     def __stop_event_handler(self, event):
         # this is needed to avoid parallel exec of the handler
@@ -439,16 +1330,34 @@ class Debugger(ValueBuilder):
 
         # the breakpoint on main() created by the gdb start command will call this handler so we ignore all events that aren't signals
         # this handler won't be called by our own FuncBreakpoint and FuncFinishBreakpoint because they never stop (their stop method always return False)
-        if not isinstance(event, gdb.SignalEvent) or event.stop_signal == "SIGALRM":
+        # the inferior stopped by the watchdog did not crash
+        if not isinstance(event, gdb.SignalEvent) or (event.stop_signal == "SIGSTOP" and self.__watchdog.fired):
             gdb.execute("set scheduler-locking off")
             return
+        if event.stop_signal in self.__timeout_signals:
+            # the inferior exceeded a timeout enforced without the watchdog
+            self.__signal_timed_out = True
+            gdb.execute("set scheduler-locking off")
+            return
+
+        with open(output_path("crash_log.txt"), "w") as f:
+            report = CrashReport(f, self.crash_report_max_size, self.crash_report_timeout)
+            self.__write_backtrace(report, event.stop_signal, max_depth=self.backtrace_max_depth)
 
-        with open("crash_log.txt", "w") as f:
-            f.write(self.__backtrace(event.stop_signal, max_depth=self.backtrace_max_depth))
+        self._read_preload()
+        if self.heap_snapshot_max_size > 0 and len(self._allocations) > 0:
+            with open(output_path(f"heap_snapshot.{gdb.selected_inferior().pid}.bin"), "wb") as f:
+                write_heap_snapshot(f, self._allocations, self.__read_memory, self.heap_snapshot_max_size)
 
         print(f"RECEIVED SIGNAL: {event.stop_signal} (check 'crash_log.txt' for more info)", file=sys.stderr)
         gdb.execute("set scheduler-locking off")
 
+    def __read_memory(self, address, length):
+        try:
+            return gdb.selected_inferior().read_memory(address, length).tobytes()
+        except gdb.MemoryError:
+            return None
+
     def __exited_event_handler(self, event):
         print(f"event type: exit ({event})")
         if hasattr(event, 'exit_code'):
@@ -475,6 +1384,18 @@ class Debugger(ValueBuilder):
         except RuntimeError:
             return None
 
+    def __value_summary(self, name, value):
+        prefix = f"{name} = ({value.type})"
+
+        if value.type.strip_typedefs().code in (gdb.TYPE_CODE_ARRAY, gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION):
+            # the content of aggregates is only written in the details of the variables
+            return f"{prefix} <{value.type.sizeof} bytes at {value.address}>", True
+
+        try:
+            return f"{prefix} {value.format_string(raw=True, max_elements=16)}", False
+        except gdb.MemoryError:
+            return f"{prefix} <cannot access memory at address: {value.address}>", False
+
     def __value_str(self, name, value):
         prefix = f"{name} = ({value.type})"
 
@@ -492,25 +1413,36 @@ class Debugger(ValueBuilder):
 
         return f"{prefix} {value_str}"
 
-    def __backtrace(self, stop_signal, max_depth):
-        ret = f"ERROR: Program received signal {stop_signal}\n\n{'=' * 65}\n" \
-            "Backtrace and stack variables at the moment of the crash:\n"
+    def __write_backtrace(self, report, stop_signal, max_depth):
+        """Writes the frames and a summary of their variables in `report`, then the details of the variables while its budget remains."""
+        if not report.write(f"ERROR: Program received signal {stop_signal}\n\n{'=' * 65}\n"
+                            "Backtrace and stack variables at the moment of the crash:\n"):
+            return
 
+        # variables whose summary is not their whole value, by frame
+        details = []
         for i, frame in enumerate(self.__frames(max_depth)):
             if isinstance(frame, str):
-                return f"{ret} {frame}\n"
+                if not report.write(f" {frame}\n"):
+                    return
+                break
 
-            variables = self.__frame_variables(frame) if frame is not None else None
+            variables = self.__frame_variables(frame)
             if variables is None:
                 arg_names = ""
                 variables_str = "    <no variables>"
             else:
                 arg_names = ", ".join(name for name, (_, is_argument) in variables.items() if is_argument)
-                variables_str = "\n".join(self.__value_str(name, value) for name, (value, _) in variables.items())
-                lines = variables_str.splitlines()
-                for j in range(len(lines)):
-                    lines[j] = f"    {lines[j]}"
+                lines = []
+                aggregates = []
+                for name, (value, _) in variables.items():
+                    summary, is_aggregate = self.__value_summary(name, value)
+                    lines.append(f"    {summary}")
+                    if is_aggregate:
+                        aggregates.append((name, value))
                 variables_str = "\n".join(lines)
+                if aggregates:
+                    details.append((i, frame.name(), aggregates))
 
             sal = frame.find_sal()
             if sal is None or sal.symtab is None:
@@ -519,6 +1451,19 @@ class Debugger(ValueBuilder):
             else:
                 filepath = sal.symtab.fullname()
                 line = sal.line
-            ret += f"#{i} {frame.name()}({arg_names}) at {filepath}:{line}\n{variables_str}\n"
+            if not report.write(f"#{i} {frame.name()}({arg_names}) at {filepath}:{line}\n{variables_str}\n"):
+                return
 
-        return ret
+        if not details or not report.write(f"\n{'=' * 65}\nContent of the arrays, structures and unions of the stack:\n"):
+            return
+
+        for i, name, aggregates in details:
+            if not report.write(f"#{i} {name}\n"):
+                return
+            for variable, value in aggregates:
+                if not report.has_budget():
+                    report.truncate()
+                    return
+                lines = self.__value_str(variable, value).splitlines()
+                if not report.write("\n".join(f"    {line}" for line in lines) + "\n"):
+                    return
@@ -0,0 +1,115 @@
+import bisect
+import struct
+from collections import namedtuple
+
+
+# layout of a heap snapshot: a header (magic, version, number of blocks) followed by each block
+# (address, size, number of stored bytes) and its stored bytes
+HEADER = struct.Struct("=4sII")
+BLOCK = struct.Struct("=QQQ")
+MAGIC = b"CCHS"
+VERSION = 1
+
+HeapBlock = namedtuple("HeapBlock", ["address", "size", "data"])
+
+
+def write_heap_snapshot(f, regions, read_memory, max_size, max_gap=4096, max_read=1 << 20):
+    """
+    Writes a heap snapshot of the allocated `regions` (a sorted iterable of (address, size) tuples) in the binary file `f`.
+
+    The content of the regions is read with `read_memory(address, length)`, which returns bytes or None if the memory cannot be read.
+    Regions separated by less than `max_gap` bytes are read together, in reads of at most `max_read` bytes (unless a single region is bigger),
+    to limit the number of reads. At most `max_size` bytes of content are stored, the regions after this limit are stored without their content.
+    """
+    # number of bytes stored for each region
+    regions = list(regions)
+    stored = []
+    remaining = max_size
+    for _, size in regions:
+        stored.append(min(size, remaining))
+        remaining -= stored[-1]
+
+    f.write(HEADER.pack(MAGIC, VERSION, len(regions)))
+    i = 0
+    while i < len(regions):
+        # regions read by the same read
+        start = regions[i][0]
+        end = start + stored[i]
+        j = i + 1
+        while j < len(regions) and stored[j] > 0 and regions[j][0] - end <= max_gap and regions[j][0] + stored[j] - start <= max_read:
+            end = max(end, regions[j][0] + stored[j])
+            j += 1
+
+        data = read_memory(start, end - start) if end > start else b""
+        for k in range(i, j):
+            address, size = regions[k]
+            if data is None:
+                content = read_memory(address, stored[k])
+                content = b"" if content is None else content
+            else:
+                content = data[address - start:address - start + stored[k]]
+            f.write(BLOCK.pack(address, size, len(content)))
+            f.write(content)
+        i = j
+
+
+def load_heap_snapshot(filepath):
+    """
+    Loads the heap snapshot written in `filepath` when the tested program crashed (see the "heap_snapshot" of the results of a test).
+
+    Usage example::
+
+        snapshot = ccorrect.load_heap_snapshot(results["problems"]["test_list"]["tests"][0]["heap_snapshot"])
+        for block in snapshot.blocks:
+            print(f"{block.address:#x}: {block.size} bytes")
+        value, next_ptr = snapshot.unpack("=i4xQ", head_address)
+    """
+    with open(filepath, "rb") as f:
+        data = f.read()
+
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"'{filepath}' is not a heap snapshot")
+
+    blocks = []
+    offset = HEADER.size
+    for _ in range(count):
+        address, size, stored = BLOCK.unpack_from(data, offset)
+        offset += BLOCK.size
+        blocks.append(HeapBlock(address, size, data[offset:offset + stored]))
+        offset += stored
+    return HeapSnapshot(blocks)
+
+
+class HeapSnapshot:
+    """
+    Allocated blocks of the tested program at the moment of its crash. Each `HeapBlock` of `blocks` has an `address`, a `size`
+    and its stored content as `data` (which is shorter than `size` if the snapshot reached its maximum size or if the block could not be read).
+    """
+
+    def __init__(self, blocks):
+        self.blocks = sorted(blocks)
+        self._addresses = [block.address for block in self.blocks]
+
+    def find(self, address):
+        """Returns the block that contains `address` or None if it is not in an allocated block."""
+        i = bisect.bisect_right(self._addresses, address) - 1
+        if i >= 0 and address < self.blocks[i].address + self.blocks[i].size:
+            return self.blocks[i]
+        return None
+
+    def read(self, address, size):
+        """Returns the `size` bytes stored at `address`. Raises a `ValueError` if they are not in the stored content of a block."""
+        block = self.find(address)
+        offset = None if block is None else address - block.address
+        if block is None or offset + size > len(block.data):
+            raise ValueError(f"{size} bytes at {address:#x} are not stored in the heap snapshot")
+        return block.data[offset:offset + size]
+
+    def unpack(self, fmt, address):
+        """Returns the values of the `struct` format `fmt` stored at `address`."""
+        return struct.unpack(fmt, self.read(address, struct.calcsize(fmt)))
+
+    def view(self, address, format, count):
+        """Returns a memoryview of `count` items of the `struct` format `format` (a single type) stored at `address`."""
+        return memoryview(self.read(address, struct.calcsize(format) * count)).cast(format)
@@ -0,0 +1,45 @@
+import os
+import shutil
+import subprocess
+
+
+def build_index_cache(program, cache_dir, silent_gdb=True):
+    """
+    Fills the GDB index cache `cache_dir` with the symbol indexes of `program` and of the shared libraries it loads (the standard library, the sanitizers libraries...).
+    The `Debugger` instances whose `index_cache` is `cache_dir` then load these symbols without building their indexes again.
+
+    This only needs to be done once per host for the shared libraries but it must be done again each time `program` is recompiled
+    (`add_gdb_index` can be used instead for `program`).
+
+    Usage example::
+
+        ccorrect.build_index_cache("main", "/var/cache/ccorrect")
+        os.environ["CCORRECT_INDEX_CACHE"] = "/var/cache/ccorrect"
+        results = ccorrect.run("test.py")
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    debuginfod = "on" if os.environ.get("CCORRECT_DEBUGINFOD", "1") != "0" else "off"
+    p = subprocess.run([
+        "gdb", "-batch-silent" if silent_gdb else "-batch",
+        "-ex", f"set debuginfod enabled {debuginfod}",
+        "-ex", f"python import sys; sys.path.insert(0, {package_dir!r})",
+        "-ex", f"python from ccorrect._debugger import enable_index_cache; enable_index_cache({os.path.abspath(cache_dir)!r})",
+        "-ex", f"file {program}",
+        # the shared libraries are only loaded once the program is started
+        "-ex", "start 1> /dev/null 2> /dev/null",
+        "-ex", "kill"
+    ])
+    if p.returncode != 0:
+        raise RuntimeError(f"GDB exited with return code: {p.returncode}")
+
+
+def add_gdb_index(program):
+    """
+    Adds a '.gdb_index' section to the `program` executable using the 'gdb-add-index' tool so that GDB loads its symbols without indexing them.
+    This should be done right after `program` is compiled.
+    """
+    if shutil.which("gdb-add-index") is None:
+        raise RuntimeError("gdb-add-index cannot be found")
+    p = subprocess.run(["gdb-add-index", program])
+    if p.returncode != 0:
+        raise RuntimeError(f"gdb-add-index exited with return code: {p.returncode}")
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import tempfile
+import threading
+import subprocess
+from ccorrect._run import _load_results
+
+
+class _Worker:
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.stream = connection.makefile("rw")
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+        return self.process.wait()
+
+
+class WorkerPool:
+    """
+    A pool of `workers` long-lived GDB processes (defaults to the number of CPUs) with CCorrect already imported that execute test scripts.
+    This avoids paying for the start of a new GDB process for each test script execution.
+
+    The workers receive their jobs over a Unix socket. A worker is replaced by a new one after `max_jobs` jobs or when its
+    memory usage exceeds `max_memory` bytes (0 means no limit).
+
+    The `run` method of a `WorkerPool` can be called from multiple threads at the same time: each call is executed by an idle worker.
+    If a worker cannot be replaced, a new one is started by the next call of `run` instead, which raises a `RuntimeError` if it fails again.
+
+    Usage example::
+
+        with ccorrect.WorkerPool(workers=4, max_jobs=100) as pool:
+            results = pool.run("test.py", cwd="submissions/alice")
+    """
+    def __init__(self, workers=None, max_jobs=0, max_memory=0, silent_gdb=True, startup_timeout=60):
+        self._size = workers if workers else os.cpu_count()
+        self._max_jobs = max_jobs
+        self._max_memory = max_memory
+        self._silent_gdb = silent_gdb
+        self._idle = queue.Queue()
+        self._spawn_lock = threading.Lock()
+
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="ccorrect_pool_")
+        self._socket_path = os.path.join(self._tmp_dir.name, "pool.sock")
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self._socket_path)
+        self._listener.listen(self._size)
+        self._listener.settimeout(startup_timeout)
+
+        with self._spawn_lock:
+            processes = [self.__start_process() for _ in range(self._size)]
+            for worker in self.__accept_workers(processes):
+                self._idle.put(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def run(self, test_script, cwd=None):
+        """
+        Executes `test_script` in one of the workers, returns a dictionnary containing the results of the tests or None if there are none.
+        This behaves like `ccorrect.run`: the test script is executed in `cwd` (defaults to the current working directory)
+        and the results are read from `cwd` or from the directory of `test_script` if `cwd` is not set.
+        """
+        worker = self.__get_worker()
+        job = {
+            "test_script": os.path.abspath(test_script),
+            "cwd": os.path.abspath(os.getcwd() if cwd is None else cwd),
+            "launch_time": time.time()
+        }
+        try:
+            worker.stream.write(json.dumps(job) + "\n")
+            worker.stream.flush()
+            response = json.loads(worker.stream.readline())
+        except (OSError, ValueError):
+            # the worker died during the job
+            returncode = worker.close()
+            self.__replace()
+            raise RuntimeError(f"GDB exited with return code: {returncode}")
+
+        if response["recycle"]:
+            worker.close()
+            self.__replace()
+        else:
+            self._idle.put(worker)
+
+        if response["error"] is not None:
+            raise RuntimeError(f"Test script failed: {response['error']}")
+
+        return _load_results(os.path.dirname(test_script) if cwd is None else cwd)
+
+    def close(self):
+        """Stops all the workers once they have finished their current job."""
+        for _ in range(self._size):
+            worker = self._idle.get()
+            if worker is not None:
+                worker.close()
+        self._listener.close()
+        self._tmp_dir.cleanup()
+
+    def __start_process(self):
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        serve = f"ccorrect._worker.serve({self._socket_path!r}, max_jobs={self._max_jobs}, max_memory={self._max_memory})"
+        return subprocess.Popen([
+            "gdb", "-batch-silent" if self._silent_gdb else "-batch",
+            "-ex", f"python import sys; sys.path.insert(0, {package_dir!r})",
+            "-ex", 'python __name__ = "gdb"',
+            "-ex", f"python import ccorrect._worker; {serve}"
+        ])
+
+    def __accept_workers(self, processes):
+        processes = {p.pid: p for p in processes}
+        workers = []
+        while processes:
+            try:
+                connection, _ = self._listener.accept()
+            except socket.timeout:
+                for process in processes.values():
+                    process.kill()
+                    process.wait()
+                raise RuntimeError("GDB worker did not start in time")
+            connection.settimeout(None)
+            try:
+                hello = json.loads(connection.makefile("r").readline())
+                process = processes.pop(hello["pid"])
+            except (ValueError, KeyError):
+                # late connection of a worker killed after a previous start timeout
+                connection.close()
+                continue
+            workers.append(_Worker(process, connection))
+        return workers
+
+    def __spawn(self):
+        with self._spawn_lock:
+            return self.__accept_workers([self.__start_process()])[0]
+
+    def __get_worker(self):
+        worker = self._idle.get()
+        if worker is None:
+            # the replacement of a worker failed, try to start it again
+            try:
+                worker = self.__spawn()
+            except BaseException:
+                self._idle.put(None)
+                raise
+        return worker
+
+    def __replace(self):
+        """Puts a new worker in the idle queue to replace a closed one, or None if it could not be started so that the next job retries."""
+        try:
+            worker = self.__spawn()
+        except Exception as e:
+            # keep the size of the pool, otherwise the jobs and close() would wait forever for this worker
+            print(f"Could not replace a GDB worker: {e}", file=sys.stderr)
+            worker = None
+        self._idle.put(worker)
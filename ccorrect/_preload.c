@@ -0,0 +1,177 @@
+// Interposition library preloaded in the inferior by the 'preload' watch backend of a `Debugger` (see _preload.py).
+// Each call of a watched function is logged in a ring buffer shared with GDB instead of stopping the inferior
+// and the functions are failed according to a fault table written by GDB in the same shared memory.
+
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+// must match the FUNCTIONS list of _preload.py
+enum { MALLOC, CALLOC, REALLOC, FREE, FUNCTION_COUNT };
+
+// must match the MAX_WHEN constant of _preload.py
+#define MAX_WHEN 64
+#define FAULT_ERRNO 1
+
+// must match the HEADER, FAULT and RECORD formats of _preload.py
+struct header {
+    uint64_t capacity; // number of records in the ring buffer
+    uint64_t head;     // number of records ever written
+    uint32_t watched;  // bit mask of the watched functions
+    uint32_t paused;   // non-zero while GDB calls functions itself
+    uint64_t calls[FUNCTION_COUNT];
+};
+
+struct fault {
+    uint32_t active;
+    uint32_t flags;
+    uint64_t ret;
+    int32_t errno_value;
+    uint32_t when_count;      // 0 means that every call fails
+    uint64_t calls;           // number of calls since the fault is active
+    uint64_t when[MAX_WHEN];  // indexes of the calls that fail
+};
+
+struct record {
+    uint32_t function;
+    uint32_t reserved;
+    uint64_t args[2];
+    uint64_t ret;
+};
+
+static struct header *header;
+static struct fault *faults;
+static struct record *records;
+
+static void *(*real_malloc)(size_t);
+static void *(*real_calloc)(size_t, size_t);
+static void *(*real_realloc)(void *, size_t);
+static void (*real_free)(void *);
+
+// dlsym() may allocate memory before the real functions are known
+static char bootstrap_heap[4096];
+static size_t bootstrap_used;
+static int initializing;
+
+static void *bootstrap_alloc(size_t size) {
+    size = (size + 15) & ~(size_t) 15;
+    if (bootstrap_used + size > sizeof(bootstrap_heap))
+        return NULL;
+    void *ptr = bootstrap_heap + bootstrap_used;
+    bootstrap_used += size;
+    return ptr;
+}
+
+static int is_bootstrap(void *ptr) {
+    return (char *) ptr >= bootstrap_heap && (char *) ptr < bootstrap_heap + sizeof(bootstrap_heap);
+}
+
+static void init_functions(void) {
+    initializing = 1;
+    real_malloc = dlsym(RTLD_NEXT, "malloc");
+    real_calloc = dlsym(RTLD_NEXT, "calloc");
+    real_realloc = dlsym(RTLD_NEXT, "realloc");
+    real_free = dlsym(RTLD_NEXT, "free");
+    initializing = 0;
+}
+
+__attribute__((constructor)) static void init(void) {
+    if (!real_malloc)
+        init_functions();
+
+    const char *path = getenv("CCORRECT_WATCH_SHM");
+    if (!path)
+        return;
+    int fd = open(path, O_RDWR);
+    if (fd < 0)
+        return;
+    struct stat st;
+    if (fstat(fd, &st) == 0) {
+        void *shm = mmap(NULL, st.st_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        if (shm != MAP_FAILED) {
+            faults = (struct fault *) ((struct header *) shm + 1);
+            records = (struct record *) (faults + FUNCTION_COUNT);
+            header = shm;
+        }
+    }
+    close(fd);
+}
+
+static void log_call(uint32_t function, uint64_t arg0, uint64_t arg1, uint64_t ret) {
+    if (!header || __atomic_load_n(&header->paused, __ATOMIC_RELAXED))
+        return;
+    if (!(__atomic_load_n(&header->watched, __ATOMIC_RELAXED) & (1u << function)))
+        return;
+
+    __atomic_fetch_add(&header->calls[function], 1, __ATOMIC_RELAXED);
+    uint64_t i = __atomic_fetch_add(&header->head, 1, __ATOMIC_RELAXED);
+    struct record *record = &records[i % header->capacity];
+    record->function = function;
+    record->args[0] = arg0;
+    record->args[1] = arg1;
+    record->ret = ret;
+}
+
+// returns non-zero if this call of `function` must fail instead of calling the real function, in which case errno is set if needed
+static int must_fail(uint32_t function) {
+    if (!header || __atomic_load_n(&header->paused, __ATOMIC_RELAXED))
+        return 0;
+    struct fault *fault = &faults[function];
+    if (!__atomic_load_n(&fault->active, __ATOMIC_ACQUIRE))
+        return 0;
+
+    uint64_t index = __atomic_fetch_add(&fault->calls, 1, __ATOMIC_RELAXED);
+    int fail = fault->when_count == 0;
+    for (uint32_t i = 0; i < fault->when_count && !fail; i++)
+        fail = fault->when[i] == index;
+
+    if (fail && (fault->flags & FAULT_ERRNO))
+        errno = fault->errno_value;
+    return fail;
+}
+
+void *malloc(size_t size) {
+    if (!real_malloc) {
+        if (initializing)
+            return bootstrap_alloc(size);
+        init_functions();
+    }
+    void *ret = must_fail(MALLOC) ? (void *) (uintptr_t) faults[MALLOC].ret : real_malloc(size);
+    log_call(MALLOC, size, 0, (uintptr_t) ret);
+    return ret;
+}
+
+void *calloc(size_t nmemb, size_t size) {
+    if (!real_calloc) {
+        if (initializing)
+            return bootstrap_alloc(nmemb * size); // the bootstrap heap is zeroed
+        init_functions();
+    }
+    void *ret = must_fail(CALLOC) ? (void *) (uintptr_t) faults[CALLOC].ret : real_calloc(nmemb, size);
+    log_call(CALLOC, nmemb, size, (uintptr_t) ret);
+    return ret;
+}
+
+void *realloc(void *ptr, size_t size) {
+    if (!real_realloc)
+        init_functions();
+    void *ret = must_fail(REALLOC) ? (void *) (uintptr_t) faults[REALLOC].ret : real_realloc(ptr, size);
+    log_call(REALLOC, (uintptr_t) ptr, size, (uintptr_t) ret);
+    return ret;
+}
+
+void free(void *ptr) {
+    if (is_bootstrap(ptr))
+        return;
+    if (!real_free)
+        init_functions();
+    if (!must_fail(FREE))
+        real_free(ptr);
+    log_call(FREE, (uintptr_t) ptr, 0, 0);
+}
@@ -0,0 +1,173 @@
+import gdb
+import os
+import re
+import mmap
+import struct
+import hashlib
+import tempfile
+import subprocess
+
+
+# functions that can be watched by the 'preload' watch backend, in the order of their identifiers in _preload.c
+FUNCTIONS = ("malloc", "calloc", "realloc", "free")
+
+# return type and arguments types of the FUNCTIONS
+SIGNATURES = {
+    "malloc": ("void *", ["unsigned long"]),
+    "calloc": ("void *", ["unsigned long", "unsigned long"]),
+    "realloc": ("void *", ["void *", "unsigned long"]),
+    "free": (None, ["void *"])
+}
+
+# maximum number of call indexes given to `when` for a function to be failed by the preloaded library
+MAX_WHEN = 64
+_FAULT_ERRNO = 1
+
+# layout of the shared memory: a header (capacity, head, watched, paused, calls of each function), the fault table
+# (active, flags, return value, errno, number of call indexes, calls since active, call indexes of each function) and the records of the ring buffer
+HEADER = struct.Struct(f"=QQII{len(FUNCTIONS)}Q")
+FAULT = struct.Struct(f"=IIQiIQ{MAX_WHEN}Q")
+RECORD = struct.Struct("=IIQQQ")
+_RECORDS_OFFSET = HEADER.size + len(FUNCTIONS) * FAULT.size
+
+_WATCHED_OFFSET = 16
+_PAUSED_OFFSET = 20
+
+
+def library_path():
+    """Returns the path of the interposition library, compiled from _preload.c the first time it is needed."""
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_preload.c")
+    with open(source, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+
+    cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ccorrect")
+    path = os.path.join(cache_dir, f"preload-{digest}.so")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # compiled under another name first so that concurrent GDB processes never load a partially written library
+        tmp_path = f"{path}.{os.getpid()}"
+        p = subprocess.run(["gcc", "-shared", "-fPIC", "-O2", "-o", tmp_path, source, "-ldl"])
+        if p.returncode != 0:
+            raise RuntimeError("The interposition library of the 'preload' watch backend cannot be compiled")
+        os.replace(tmp_path, path)
+    return path
+
+
+def disable_library_locations(breakpoint, library):
+    """Disables the locations of `breakpoint` inside `library` so that a call to an interposed function only stops in the real function."""
+    if hasattr(breakpoint, "locations"):
+        for location in breakpoint.locations:
+            if gdb.solib_name(location.address) == library:
+                location.enabled = False
+    else:
+        # gdb < 13: gdb.Breakpoint has no 'locations' attribute
+        output = gdb.execute(f"info breakpoints {breakpoint.number}", to_string=True)
+        for number, address in re.findall(r"^(\d+\.\d+)\s+\S+\s+(0x[0-9a-f]+)", output, re.MULTILINE):
+            if gdb.solib_name(int(address, 16)) == library:
+                gdb.execute(f"disable {number}")
+
+
+class PreloadWatch:
+    """
+    Ring buffer of `capacity` records shared with the interposition library preloaded in the inferior, which logs each call of the watched `FUNCTIONS` in it.
+    The records are read in bulk by GDB instead of stopping the inferior on each call.
+    The shared memory also contains the fault table that tells the library which calls of the `FUNCTIONS` must fail without stopping the inferior.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.library = library_path()
+        self._shm = None
+        self._path = None
+        self._tail = 0
+        self._calls = [0] * len(FUNCTIONS)
+
+    def setup(self):
+        """Creates the shared memory of the next started inferior and returns the environment variables it needs."""
+        self.close()
+        fd, self._path = tempfile.mkstemp(prefix="ccorrect_watch_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        size = _RECORDS_OFFSET + self.capacity * RECORD.size
+        try:
+            os.ftruncate(fd, size)
+            self._shm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self._shm, 0, self.capacity, 0, 0, 0, *self._calls)
+
+        preload = os.environ.get("LD_PRELOAD")
+        return {
+            "LD_PRELOAD": self.library if not preload else f"{self.library}:{preload}",
+            "CCORRECT_WATCH_SHM": self._path
+        }
+
+    def started(self):
+        """Removes the name of the shared memory once the inferior has mapped it."""
+        if self._path is not None:
+            os.remove(self._path)
+            self._path = None
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+        self.started()
+        self._tail = 0
+        self._calls = [0] * len(FUNCTIONS)
+
+    def is_watched(self, function):
+        return bool(self.__watched() & (1 << FUNCTIONS.index(function)))
+
+    def set_watched(self, function, watched):
+        mask = 1 << FUNCTIONS.index(function)
+        struct.pack_into("=I", self._shm, _WATCHED_OFFSET, (self.__watched() | mask) if watched else (self.__watched() & ~mask))
+
+    def set_paused(self, paused):
+        if self._shm is not None:
+            struct.pack_into("=I", self._shm, _PAUSED_OFFSET, int(paused))
+
+    def read(self):
+        """
+        Returns the calls logged since the last read as a list of tuples of the function name, its arguments and its return value (as ints),
+        and a dictionnary of the number of calls of each function since the last read, which also counts the calls that could not be kept by the ring buffer.
+        """
+        header = HEADER.unpack_from(self._shm, 0)
+        head = header[1]
+        calls = header[4:]
+
+        records = []
+        for i in range(max(self._tail, head - self.capacity), head):
+            function, _, arg0, arg1, ret = RECORD.unpack_from(self._shm, _RECORDS_OFFSET + (i % self.capacity) * RECORD.size)
+            name = FUNCTIONS[function]
+            records.append((name, (arg0, arg1)[:len(SIGNATURES[name][1])], ret))
+
+        counts = {name: calls[i] - self._calls[i] for i, name in enumerate(FUNCTIONS) if calls[i] != self._calls[i]}
+        self._tail = head
+        self._calls = list(calls)
+        return records, counts
+
+    def fault(self, function):
+        """Returns the raw entry of `function` in the fault table, to restore it with `restore_fault`."""
+        offset = self.__fault_offset(function)
+        return bytes(self._shm[offset:offset + FAULT.size])
+
+    def restore_fault(self, function, entry):
+        offset = self.__fault_offset(function)
+        self._shm[offset:offset + FAULT.size] = entry
+
+    def set_fault(self, function, retval=0, errno=None, when=None):
+        """
+        Makes the calls of `function` fail: they return `retval` (an int) and set `errno` if it is not None.
+        `when` is None to fail every call or a set of at most `MAX_WHEN` indexes of the calls to fail, counted from now.
+        """
+        when = sorted(when) if when is not None else []
+        if len(when) > MAX_WHEN:
+            raise ValueError(f"The preloaded library cannot fail more than {MAX_WHEN} calls of a function")
+        flags = _FAULT_ERRNO if errno is not None else 0
+        FAULT.pack_into(self._shm, self.__fault_offset(function), 1, flags, retval & 0xFFFFFFFFFFFFFFFF, 0 if errno is None else errno,
+                        len(when), 0, *when, *[0] * (MAX_WHEN - len(when)))
+
+    def __fault_offset(self, function):
+        return HEADER.size + FUNCTIONS.index(function) * FAULT.size
+
+    def __watched(self):
+        return struct.unpack_from("=I", self._shm, _WATCHED_OFFSET)[0]
@@ -0,0 +1,240 @@
+import os
+import json
+
+
+# version of the structure of the results data, incremented when it changes in an incompatible way
+RESULTS_VERSION = 1
+
+# default name of the results file for each results format
+RESULTS_FILENAMES = {
+    "yaml": "results.yml",
+    "json": "results.json",
+    "binary": "results.bin"
+}
+
+# the binary format is a msgpack encoding of the results data prefixed by this magic number
+_BINARY_MAGIC = b"CCRB"
+
+
+def _yaml():
+    # yaml is only imported when the 'yaml' format is used, it is slow to import
+    import yaml
+    return yaml
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("The 'binary' results format needs the 'msgpack' package (pip install CCorrect[binary])")
+    return msgpack
+
+
+def _encode_set(obj):
+    # JSON and msgpack have no set type (such as the banned functions found), a set is written as a sorted list
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"Object of type '{type(obj).__name__}' cannot be written in the results")
+
+
+def results_format(result_format=None):
+    """Returns `result_format` or, if it is None, the format set by the 'CCORRECT_RESULT_FORMAT' environment variable ('yaml' by default)."""
+    result_format = os.environ.get("CCORRECT_RESULT_FORMAT", "yaml") if result_format is None else result_format
+    if result_format not in RESULTS_FILENAMES:
+        raise ValueError(f"Invalid results format '{result_format}' (must be one of: {', '.join(RESULTS_FILENAMES)})")
+    return result_format
+
+
+def dump_results(data, filepath, result_format="yaml"):
+    """Writes the results `data` in the `filepath` file using the `result_format` format ('yaml', 'json' or 'binary')."""
+    data = {"version": RESULTS_VERSION, **data}
+
+    if result_format == "binary":
+        with open(filepath, "wb") as f:
+            f.write(_BINARY_MAGIC)
+            f.write(_msgpack().packb(data, default=_encode_set))
+    elif result_format == "json":
+        with open(filepath, "w") as f:
+            json.dump(data, f, default=_encode_set)
+    elif result_format == "yaml":
+        with open(filepath, "w") as f:
+            yaml = _yaml()
+            # use the libyaml bindings of PyYAML when they are available as they are much faster than the pure python implementation
+            yaml.dump(data, f, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper), sort_keys=False)
+    else:
+        raise ValueError(f"Invalid results format '{result_format}'")
+
+
+def load_results(filepath):
+    """Returns the results data of the `filepath` file, written in any of the formats supported by `dump_results`, which is detected automatically."""
+    with open(filepath, "rb") as f:
+        content = f.read()
+
+    if content.startswith(_BINARY_MAGIC):
+        return _msgpack().unpackb(content[len(_BINARY_MAGIC):])
+    if content.lstrip().startswith(b"{"):
+        try:
+            return json.loads(content)
+        except ValueError:
+            # YAML flow mapping
+            pass
+    yaml = _yaml()
+    return yaml.load(content, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def output_path(filename):
+    """
+    Returns the path where the file `filename` written during the tests (outputs, sanitizers and crash logs, results) must be placed.
+    These files are placed in the current working directory unless the 'CCORRECT_OUTPUT_DIR' environment variable is set.
+    """
+    return os.path.join(os.environ.get("CCORRECT_OUTPUT_DIR", ""), filename)
+
+
+def summarize(problems):
+    """Computes the scores of `problems` (a dictionnary of problem names and their results) and returns the results data with its summary."""
+    total = sum([len(x["tests"]) for x in problems.values()])
+    succeeded = 0
+    total_score = 0
+    total_sum_weights = 0
+    for problem in problems.values():
+        problem_sum_weights = 0
+        problem_success = True
+        for t in problem["tests"]:
+            if "asan_log" in t and t["asan_log"]:
+                t["success"] = False
+            problem_success = problem_success and t["success"]
+            if t["success"]:
+                succeeded += 1
+                total_score += t["weight"]
+                problem["score"] += t["weight"]
+
+            problem_sum_weights += t["weight"]
+            total_sum_weights += t["weight"]
+
+        problem["success"] = problem_success
+
+        if problem_sum_weights > 0:
+            problem["score"] = round((problem["score"] / problem_sum_weights) * 100, 2)
+
+    if total_sum_weights > 0:
+        total_score /= total_sum_weights
+
+    return {
+        "summary": {
+            "total": total,
+            "succeeded": succeeded,
+            "failed": total - succeeded,
+            "score": round(total_score * 100, 2),
+        },
+        "problems": problems
+    }
+
+
+def journal_path(result_filepath):
+    """Returns the path of the journal where the result of each test is appended as soon as it is known, while the results are written in `result_filepath`."""
+    return f"{os.path.splitext(result_filepath)[0]}.jsonl"
+
+
+def read_journal(journal_filepath):
+    """
+    Returns the last known state of each test record of the `journal_filepath` JSON lines file (in their execution order) or None if there is no journal.
+    A record without a duration is a test that was not finished.
+    """
+    records = {}
+    try:
+        with open(journal_filepath, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line may have been cut if the process was killed while writing it
+                    break
+                records[record["id"]] = record
+    except FileNotFoundError:
+        return None
+    return list(records.values())
+
+
+def recover(journal_filepath, reason="aborted", data=None):
+    """
+    Rebuilds the results data of an abnormally stopped execution of the tests from its journal or returns None if there is no journal.
+    Its summary contains an error with the given `reason` and `data` and the test that was running when the execution stopped is failed and tagged as 'interrupted'.
+    """
+    records = read_journal(journal_filepath)
+    if records is None:
+        return None
+
+    for record in records:
+        if "duration" not in record:
+            record["test"]["success"] = False
+            record["test"]["tags"].append("interrupted")
+
+    results = summarize(_problems_from_records(records))
+    results["summary"]["error"] = {
+        "reason": reason,
+        "data": data
+    }
+    return results
+
+
+def load_durations(filepath):
+    """Returns the dictionnary of test ids and their last known duration (in seconds) saved in the `filepath` JSON file, if any."""
+    if filepath is None:
+        return {}
+    try:
+        with open(filepath, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def shard_tests(test_ids, shards, durations=None):
+    """
+    Splits `test_ids` into `shards` lists of test ids that should take roughly the same time to execute according to their past `durations`.
+    Tests without a known duration are assumed to take the mean of the known durations.
+
+    The split only depends on the arguments so every shard computes the same one.
+    """
+    durations = {} if durations is None else durations
+    known = [durations[test_id] for test_id in test_ids if test_id in durations]
+    default = sum(known) / len(known) if known else 1
+
+    # greedily give the longest remaining test to the least loaded shard
+    loads = [0] * shards
+    assignment = [[] for _ in range(shards)]
+    for test_id in sorted(test_ids, key=lambda test_id: durations.get(test_id, default), reverse=True):
+        i = loads.index(min(loads))
+        assignment[i].append(test_id)
+        loads[i] += durations.get(test_id, default)
+
+    return assignment
+
+
+def merge_shards(partials):
+    """
+    Merges the partial results written by each shard of a sharded `run_tests` into the results data that `run_tests` would have written.
+    Returns a tuple of the results data and of the dictionnary of test ids and their duration (in seconds).
+    """
+    for partial in partials:
+        if "records" not in partial:
+            # a shard stopped before running its tests (banned functions)
+            return partial, {}
+
+    order = {test_id: i for i, test_id in enumerate(partials[0]["order"])}
+    records = sorted((record for partial in partials for record in partial["records"]), key=lambda record: order[record["id"]])
+    durations = {record["id"]: record["duration"] for record in records}
+
+    return summarize(_problems_from_records(records)), durations
+
+
+def _problems_from_records(records):
+    problems = {}
+    for record in records:
+        if record["problem"] not in problems:
+            problems[record["problem"]] = {
+                "success": False,
+                "score": 0,
+                "tests": []
+            }
+        problems[record["problem"]]["tests"].append(record["test"])
+    return problems
@@ -1,21 +1,246 @@
 import subprocess
 import shlex
 import os
-from yaml import safe_load as yaml_load
+import json
+import time
+import asyncio
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from ccorrect._results import load_durations, merge_shards, journal_path, recover, load_results, dump_results, results_format, RESULTS_FILENAMES
 
 
-def run(test_script, silent_gdb=True):
-    """Starts the GDB process that executes `test_script`, returns a dictionnary containing the results of the tests or None if there are none."""
+# maximum size in bytes of a record streamed by the GDB process of `stream_async`
+_STREAM_LIMIT = 1 << 30
+
+
+def run(test_script, silent_gdb=True, cwd=None):
+    """
+    Starts the GDB process that executes `test_script`, returns a dictionnary containing the results of the tests or None if there are none.
+
+    If `cwd` is set, the GDB process is started in this directory and the results are read from it instead of the directory of `test_script`.
+
+    If the GDB process exits abnormally, the partial results are recovered from the journal of the tests (see `recover_results`).
+    A `RuntimeError` is raised if there is no journal to recover them from.
+    """
+    results_dir = os.path.dirname(test_script) if cwd is None else cwd
     cmd = _get_cmd(test_script, silent_gdb)
-    p = subprocess.run(shlex.split(cmd))
-    if p.returncode != 0:
-        raise RuntimeError(f"GDB exited with return code: {p.returncode}")
+    p = subprocess.run(shlex.split(cmd), cwd=cwd, env=_env())
+    return _exit_results(results_dir, p.returncode)
+
+
+def recover_results(result_filepath=None, returncode=None, result_format=None):
+    """
+    Rebuilds the results of the tests whose GDB process was killed (for example because it exceeded its memory or time limits) from their journal
+    and writes them in `result_filepath` using the `result_format` format (see `run_tests` for their default values). Returns these results or None if there is no journal.
+
+    The recovered results only contain the tests that were started. The test that was running when the GDB process was killed is failed and tagged as 'interrupted'.
+    Their summary contains an error whose reason is 'aborted' and whose data is `returncode`.
+
+    Usage example::
+
+        stdout, stderr, returncode = run_student.run_student_simple(ccorrect._get_cmd("test.py"))
+        if returncode:
+            results = ccorrect.recover_results(returncode=returncode)
+    """
+    result_format = results_format(result_format)
+    if result_filepath is None:
+        result_filepath = RESULTS_FILENAMES[result_format]
+
+    journal_filepath = journal_path(result_filepath)
+    results = recover(journal_filepath, data=returncode)
+    if results is None:
+        return None
+
+    dump_results(results, result_filepath, result_format)
+    os.remove(journal_filepath)
+
+    return results
+
+
+def run_many(test_script, submission_dirs, workers=None, silent_gdb=True):
+    """
+    Grades several submissions in parallel, each one by its own GDB process executing `test_script`.
+
+    Each GDB process is started in its submission directory so that the files written during the tests (outputs, sanitizers and crash logs, results)
+    of a submission don't clobber the ones of another. The tested program and any relative path used by `test_script` are resolved from this directory.
+
+    At most `workers` GDB processes run at the same time (defaults to the number of CPUs).
+
+    Returns a list containing, for each directory of `submission_dirs` (in the same order), the value returned by `run` for this submission
+    or the exception raised while grading it (a `RuntimeError` if its GDB process failed, an `OSError` if it could not be started, ...).
+
+    Usage example::
+
+        results = ccorrect.run_many("test.py", ["submissions/alice", "submissions/bob"], workers=8)
+        for submission, result in zip(["alice", "bob"], results):
+            if isinstance(result, Exception):
+                print(f"{submission}: {result}")
+            else:
+                print(f"{submission}: {result['summary']['score']}")
+    """
+    test_script = os.path.abspath(test_script)
+
+    # each worker thread only waits for its GDB process to exit so threads are enough to keep all the CPUs busy
+    with ThreadPoolExecutor(max_workers=workers if workers else os.cpu_count()) as executor:
+        futures = [executor.submit(run, test_script, silent_gdb, cwd=submission_dir) for submission_dir in submission_dirs]
+
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            # the error of a submission must not prevent the results of the others from being returned
+            results.append(e)
+    return results
+
+
+def run_sharded(test_script, shards=None, silent_gdb=True, durations_filepath=None):
+    """
+    Same as `run` but the test methods executed by `test_script` are split between `shards` GDB processes running at the same time (defaults to the number of CPUs).
+
+    The tests are balanced between the shards using their durations during the previous runs, saved in the `durations_filepath` JSON file
+    (defaults to '.ccorrect_durations.json' in the directory of `test_script`).
+    The partial results of the shards are merged and scored like `run_tests` does and written in the directory of `test_script`
+    in the format set by the 'CCORRECT_RESULT_FORMAT' environment variable (see `run_tests`).
+
+    Each shard writes the files of its tests (outputs, sanitizers and crash logs) in its own temporary directory.
+    The heap snapshots of the tests whose program crashed are moved from there to the directory of `test_script`.
+    """
+    shards = shards if shards else os.cpu_count()
+    test_dir = os.path.dirname(test_script)
+    if durations_filepath is None:
+        durations_filepath = os.path.join(test_dir, ".ccorrect_durations.json")
+    durations_filepath = os.path.abspath(durations_filepath)
+
+    cmd = shlex.split(_get_cmd(test_script, silent_gdb))
+    with tempfile.TemporaryDirectory(prefix="ccorrect_shards_") as tmp_dir:
+        processes = []
+        for i in range(shards):
+            output_dir = os.path.join(tmp_dir, str(i))
+            os.mkdir(output_dir)
+            env = _env(CCORRECT_SHARD=f"{i}/{shards}", CCORRECT_SHARD_DURATIONS=durations_filepath, CCORRECT_OUTPUT_DIR=output_dir)
+            processes.append(subprocess.Popen(cmd, env=env))
+
+        returncodes = [p.wait() for p in processes]
+        for returncode in returncodes:
+            if returncode != 0:
+                raise RuntimeError(f"GDB exited with return code: {returncode}")
 
+        partials = []
+        for i in range(shards):
+            try:
+                partials.append(load_results(os.path.join(tmp_dir, str(i), RESULTS_FILENAMES["json"])))
+            except FileNotFoundError:
+                return None
+            _move_heap_snapshots(partials[-1], test_dir)
+
+    results, durations = merge_shards(partials)
+
+    result_format = results_format()
+    dump_results(results, os.path.join(test_dir, RESULTS_FILENAMES[result_format]), result_format)
+
+    with open(durations_filepath, "w") as f:
+        json.dump({**load_durations(durations_filepath), **durations}, f)
+
+    return results
+
+
+async def stream_async(test_script, silent_gdb=True, cwd=None):
+    """
+    Asynchronous iterator that starts the GDB process that executes `test_script` like `run` does and yields the result of each test as soon as it is finished.
+
+    Each yielded result is a dictionnary with the "id" of the test method, the name of its "problem", its results in "test"
+    (the same as in the results written by `run_tests`, except that its success doesn't take the sanitizers logs into account yet)
+    and its "duration" in seconds.
+
+    Usage example::
+
+        async for result in ccorrect.stream_async("test.py"):
+            print(f"{result['id']}: {'success' if result['test']['success'] else 'failed'}")
+    """
+    read_fd, write_fd = os.pipe()
+    env = _env(CCORRECT_STREAM_FD=str(write_fd))
+    try:
+        process = await asyncio.create_subprocess_exec(*shlex.split(_get_cmd(test_script, silent_gdb)), cwd=cwd, env=env, pass_fds=(write_fd,))
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+
+    # a record contains the outputs of its test, which can be much longer than the default line limit of a StreamReader (64 KiB)
+    reader = asyncio.StreamReader(limit=_STREAM_LIMIT)
+    transport, _ = await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, "rb"))
     try:
-        with open(os.path.join(os.path.dirname(test_script), "results.yml"), "r") as f:
-            return yaml_load(f)
-    except FileNotFoundError:
+        async for line in reader:
+            yield json.loads(line)
+    finally:
+        transport.close()
+        if not reader.at_eof():
+            # the iteration was stopped before the end of the tests
+            process.kill()
+        returncode = await process.wait()
+
+    if returncode != 0:
+        raise RuntimeError(f"GDB exited with return code: {returncode}")
+
+
+async def run_async(test_script, silent_gdb=True, cwd=None):
+    """
+    Coroutine version of `run` that doesn't block the event loop while the GDB process executes `test_script`.
+    Like `run`, it recovers the partial results from the journal of the tests if the GDB process exits abnormally.
+
+    Usage example::
+
+        results = await ccorrect.run_async("test.py", cwd="submissions/alice")
+    """
+    process = await asyncio.create_subprocess_exec(*shlex.split(_get_cmd(test_script, silent_gdb)), cwd=cwd, env=_env())
+    try:
+        returncode = await process.wait()
+    except BaseException:
+        # the coroutine was cancelled
+        process.kill()
+        raise
+
+    results_dir = os.path.dirname(test_script) if cwd is None else cwd
+    return await asyncio.get_running_loop().run_in_executor(None, _exit_results, results_dir, returncode)
+
+
+def _move_heap_snapshots(partial, directory):
+    """Moves the heap snapshots of the tests of the `partial` results of a shard to `directory` and updates their path in the results."""
+    for record in partial.get("records", []):
+        heap_snapshot_path = record["test"].get("heap_snapshot")
+        if heap_snapshot_path is None:
+            continue
+        new_path = os.path.abspath(os.path.join(directory, os.path.basename(heap_snapshot_path)))
+        shutil.move(heap_snapshot_path, new_path)
+        record["test"]["heap_snapshot"] = new_path
+
+
+def _env(**variables):
+    """Returns the environment of a GDB process started now, with the additional environment `variables`."""
+    return dict(os.environ, CCORRECT_LAUNCH_TIME=str(time.time()), **variables)
+
+
+def _exit_results(results_dir, returncode):
+    """Returns the results written in `results_dir` by a GDB process that exited with `returncode`, recovered from their journal if it is not 0."""
+    if returncode != 0:
+        results = recover_results(os.path.join(results_dir, RESULTS_FILENAMES[results_format()]), returncode=returncode)
+        if results is None:
+            raise RuntimeError(f"GDB exited with return code: {returncode}")
+        return results
+
+    return _load_results(results_dir)
+
+
+def _load_results(results_dir):
+    """Returns the latest results written by the test script in `results_dir`, whatever their format, or None if there are none."""
+    filepaths = [os.path.join(results_dir, filename) for filename in RESULTS_FILENAMES.values()]
+    filepaths = [filepath for filepath in filepaths if os.path.exists(filepath)]
+    if not filepaths:
         return None
+    return load_results(max(filepaths, key=os.path.getmtime))
 
 
 def _get_cmd(test_script, silent_gdb=True):
@@ -1,14 +1,25 @@
 import os
 import re
+import sys
+import json
+import time
 import unittest
 import gdb
 from functools import wraps
-from yaml import safe_dump as yaml_dump
 from ccorrect import Debugger
-from ccorrect._parser import FuncCallParser
+from ccorrect._debugger import close_checkpoints
+from ccorrect._results import output_path, summarize, load_durations, shard_tests, journal_path, recover, dump_results, results_format, RESULTS_FILENAMES
 
 
 _test_results = {}
+# (test id, problem, test results, duration) of each executed test, used to merge the results of a sharded run
+_test_records = []
+# pipe where each test result is sent as soon as its test is finished when the test script is executed by `ccorrect.stream_async`
+_stream = None
+# file where each test record is appended when its test starts and when it finishes, to recover the results if the GDB process is killed
+_journal = None
+# time between the launch of the GDB process and the start of the first test
+_startup_time = None
 
 
 class TestAssertionError(AssertionError):
@@ -111,21 +122,21 @@ class TestCase(unittest.TestCase, metaclass=MetaTestCase):
             pass
 
         try:
-            with open("stdout.txt", "r+") as f:
+            with open(output_path("stdout.txt"), "r+") as f:
                 _test_results[self.__current_problem]["tests"][-1]["stdout"] = f.read()
                 f.truncate(0)
         except FileNotFoundError:
             _test_results[self.__current_problem]["tests"][-1]["stdout"] = ""
 
         try:
-            with open("stderr.txt", "r+") as f:
+            with open(output_path("stderr.txt"), "r+") as f:
                 _test_results[self.__current_problem]["tests"][-1]["stderr"] = f.read()
                 f.truncate(0)
         except FileNotFoundError:
             _test_results[self.__current_problem]["tests"][-1]["stderr"] = ""
 
     def _push_sanitizers_and_crash_logs(self, pid):
-        asan_log_path = f"asan_log.{pid}"
+        asan_log_path = output_path(f"asan_log.{pid}")
         try:
             with open(asan_log_path, "r") as f:
                 asan_logs = f.read()
@@ -140,7 +151,7 @@ class TestCase(unittest.TestCase, metaclass=MetaTestCase):
         except FileNotFoundError:
             pass
 
-        tsan_log_path = f"tsan_log.{pid}"
+        tsan_log_path = output_path(f"tsan_log.{pid}")
         try:
             with open(tsan_log_path, "r") as f:
                 tsan_logs = f.read()
@@ -154,7 +165,7 @@ class TestCase(unittest.TestCase, metaclass=MetaTestCase):
             pass
 
         try:
-            with open("crash_log.txt", "r") as f:
+            with open(output_path("crash_log.txt"), "r") as f:
                 crash_logs = f.read()
                 _test_results[self.__current_problem]["tests"][-1]["crash_log"] = crash_logs
                 # parse crash output to push tags
@@ -164,15 +175,29 @@ class TestCase(unittest.TestCase, metaclass=MetaTestCase):
                         self.push_tag("double-free")
                     else:
                         self.push_tag(reason.group(1))
-            os.remove("crash_log.txt")
+            os.remove(output_path("crash_log.txt"))
         except FileNotFoundError:
             pass
 
+        heap_snapshot_path = output_path(f"heap_snapshot.{pid}.bin")
+        if os.path.exists(heap_snapshot_path):
+            # the snapshot is kept next to the results, to be loaded by `ccorrect.load_heap_snapshot`
+            _test_results[self.__current_problem]["tests"][-1]["heap_snapshot"] = os.path.abspath(heap_snapshot_path)
 
-def test_metadata(problem=None, description=None, weight=1, timeout=0):
-    """This sets a `problem` name, a `description` a grading `weight` and a `timeout` (0 means no timeout) to a test."""
+
+def test_metadata(problem=None, description=None, weight=1, timeout=0, memory_limit=0, cpu_limit=0, cpu_timeout=0):
+    """
+    This sets a `problem` name, a `description` a grading `weight` and a `timeout` (0 means no timeout) to a test.
+    A `cpu_timeout` in seconds of CPU time, a `memory_limit` in bytes and a `cpu_limit` in seconds can also be set (0 means no limit, see `Debugger.start`).
+    The tests stopped by one of their timeouts are tagged as 'timeout'.
+
+    The resources used by the tested program during the test (see `Debugger.resources`) are added to its results.
+    """
     assert weight >= 1
     assert timeout >= 0
+    assert memory_limit >= 0
+    assert cpu_limit >= 0
+    assert cpu_timeout >= 0
 
     def decorator(func):
         func.__CCorrect_test_has_metadata = True
@@ -198,10 +223,15 @@ def test_metadata(problem=None, description=None, weight=1, timeout=0):
                 "messages": [],
                 "tags": []
             })
+            record = {"id": self.id(), "problem": pb, "test": _test_results[pb]["tests"][-1]}
+            _test_records.append(record)
+            _journal_record(record)
 
+            _record_startup_time()
             pid = None
+            start_time = time.monotonic()
             try:
-                pid = self.debugger.start(timeout=timeout)
+                pid = self.debugger.start(timeout=timeout, memory_limit=memory_limit, cpu_limit=cpu_limit, cpu_timeout=cpu_timeout)
                 func(self, *args, **kwargs)
             except self.failureException as e:
                 self.push_info_msg(e)
@@ -212,7 +242,14 @@ def test_metadata(problem=None, description=None, weight=1, timeout=0):
                 if pid is not None:
                     self._push_output()
                     self.debugger.finish()
+                    if self.debugger.resources is not None:
+                        _test_results[pb]["tests"][-1]["resources"] = self.debugger.resources
+                    if self.debugger.timed_out:
+                        self.push_tag("timeout")
                     self._push_sanitizers_and_crash_logs(pid)
+                record["duration"] = time.monotonic() - start_time
+                _journal_record(record)
+                _stream_record(record)
 
         return wrapper
 
@@ -243,6 +280,9 @@ class BanFuncTestCase(unittest.TestCase):
         if banned is None or "functions" not in banned or "sources" not in banned:
             return None
 
+        # pycparser is slow to import so it is only imported when banned functions are checked
+        from ccorrect._parser import FuncCallParser
+
         func_calls = set()
         for source in banned["sources"]:
             func_calls.update(FuncCallParser(source).parse())
@@ -251,105 +291,187 @@ class BanFuncTestCase(unittest.TestCase):
         return found if found else None
 
 
-def _run_ban_test(ban_functions, runner, result_filepath):
+def _run_ban_test(ban_functions, runner, result_filepath, result_format):
     BanFuncTestCase.ban_functions = ban_functions
     BanFuncTestCase._found = []
     ban_suite = unittest.TestSuite([unittest.defaultTestLoader.loadTestsFromTestCase(BanFuncTestCase)])
     res = runner.run(ban_suite)
     if res.failures:
-        with open(result_filepath, "w") as f:
-            data = {
-                "summary": {
-                    "total": 1,
-                    "succeeded": 0,
-                    "failed": 1,
-                    "score": 0,
-                    "error": {
-                        "reason": "banned_functions",
-                        "data": BanFuncTestCase._found,
-                    }
+        data = {
+            "summary": {
+                "total": 1,
+                "succeeded": 0,
+                "failed": 1,
+                "score": 0,
+                "error": {
+                    "reason": "banned_functions",
+                    "data": BanFuncTestCase._found,
                 }
             }
-            yaml_dump(data=data, stream=f, sort_keys=False)
+        }
+        dump_results(data, result_filepath, result_format)
         return True
     return False
 
 
-def run_tests(test_cases=None, verbosity=0, ban_functions=None, result_filepath="results.yml"):
+def _record_startup_time():
+    global _startup_time
+    launch_time = os.environ.get("CCORRECT_LAUNCH_TIME")
+    if _startup_time is None and launch_time is not None:
+        _startup_time = round(time.time() - float(launch_time), 3)
+
+
+def _open_stream():
+    global _stream
+    fd = os.environ.get("CCORRECT_STREAM_FD")
+    if fd is None or _stream is not None:
+        return
+    fd = int(fd)
+    # the inferiors must not inherit the pipe
+    os.set_inheritable(fd, False)
+    _stream = os.fdopen(fd, "w")
+
+
+def _stream_record(record):
+    if _stream is None:
+        return
+    _stream.write(json.dumps(record) + "\n")
+    _stream.flush()
+
+
+def _open_journal(journal_filepath):
+    global _journal
+    _close_journal()
+    _journal = open(journal_filepath, "w")
+
+
+def _close_journal():
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+
+
+def _journal_record(record):
+    if _journal is None:
+        return
+    _journal.write(json.dumps(record) + "\n")
+    _journal.flush()
+
+
+def _iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from _iter_tests(test)
+        else:
+            yield test
+
+
+def _get_shard():
+    """Returns the (index, count) tuple of the shard executed by this process if it is a worker of `ccorrect.run_sharded`, None otherwise."""
+    shard = os.environ.get("CCORRECT_SHARD")
+    if shard is None:
+        return None
+    index, count = shard.split("/")
+    return int(index), int(count)
+
+
+def _shard_suite(suite, index, count):
+    """Returns the ids of all the tests of `suite` in their execution order and a suite made of the tests of the shard number `index`."""
+    tests = list(_iter_tests(suite))
+    ids = [test.id() for test in tests]
+    durations = load_durations(os.environ.get("CCORRECT_SHARD_DURATIONS"))
+    selected = set(shard_tests(ids, count, durations)[index])
+    return ids, unittest.TestSuite(test for test in tests if test.id() in selected)
+
+
+def run_tests(test_cases=None, verbosity=0, ban_functions=None, result_filepath=None, result_format=None):
     """
     This runs the test methods of the test cases defined in the same file as this is called.
     Optionnaly, the test cases to execute can be set in the `test_cases` argument that is a list of `TestCase` classes.
 
     The test methods of a `TestCase` are executed in the lexicographic order.
 
-    The results are written in the `result_filepath` YAML file.
+    The results are written in the `result_filepath` file using the `result_format` format: 'yaml', 'json' or 'binary' (msgpack, needs the 'msgpack' package).
+    If `result_format` is None, the format is set by the 'CCORRECT_RESULT_FORMAT' environment variable and defaults to 'yaml'.
+    If `result_filepath` is None, it is 'results.yml', 'results.json' or 'results.bin' depending on the format.
+    The results data contains a "version" key which is the version of its structure.
+    When the GDB process has been started by one of the `ccorrect.run` functions, it also contains a "startup_time" key which is
+    the time in seconds between the launch of the GDB process and the start of the first test.
+    While the tests are executed, their results are also appended to a JSON lines journal next to `result_filepath` (with a '.jsonl' extension)
+    so that the results of the finished tests can be recovered if the GDB process is killed (see `ccorrect.recover_results`).
+    If an exception stops the execution of the tests, the partial results are rebuilt from this journal and written in `result_filepath`.
 
     If `ban_functions` is an optional dictionnary that contains 2 keys: "sources" and "functions" and is used to fail all tests if the tested program use a banned function.
     "functions" is a list of strings of function identifiers.
     "sources" is a list of C source file paths that will all be parsed to check if there is any call to a function that is also present in the "functions" list.
+
+    When the GDB process is a worker started by `ccorrect.run_sharded`, only the tests of its shard are executed and
+    their partial results are written in its output directory instead, to be merged by `ccorrect.run_sharded`.
     """
+    result_format = results_format(result_format)
+    shard = _get_shard()
+    if shard is not None:
+        # the shards results are only read by ccorrect.run_sharded
+        result_format = "json"
+        result_filepath = output_path(RESULTS_FILENAMES[result_format])
+    elif result_filepath is None:
+        result_filepath = RESULTS_FILENAMES[result_format]
+
     try:
         os.remove(result_filepath)
     except FileNotFoundError:
         pass
 
+    global _startup_time
+    _startup_time = None
     _test_results.clear()
+    _test_records.clear()
+    _open_stream()
 
     runner = unittest.TextTestRunner(verbosity=verbosity)
 
-    if ban_functions is not None and _run_ban_test(ban_functions, runner, result_filepath):
+    if ban_functions is not None and _run_ban_test(ban_functions, runner, result_filepath, result_format):
         return
 
-    if test_cases is None:
-        unittest.main(exit=False, verbosity=verbosity)
-    else:
-        suite = unittest.TestSuite()
-        for test_class in test_cases:
-            tests = unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
-            suite.addTests(tests)
-        runner.run(suite)
+    journal_filepath = journal_path(result_filepath)
+    _open_journal(journal_filepath)
+    try:
+        if test_cases is None and shard is None:
+            unittest.main(exit=False, verbosity=verbosity)
+        else:
+            suite = unittest.TestSuite()
+            if test_cases is None:
+                # same tests as the ones unittest.main() would have found
+                suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(sys.modules["__main__"]))
+            else:
+                for test_class in test_cases:
+                    tests = unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
+                    suite.addTests(tests)
+            if shard is not None:
+                order, suite = _shard_suite(suite, *shard)
+            runner.run(suite)
+    except BaseException as e:
+        _close_journal()
+        dump_results(recover(journal_filepath, data=repr(e)), result_filepath, result_format)
+        raise
+    finally:
+        close_checkpoints()
+    _close_journal()
 
     try:
-        os.remove("stdout.txt")
-        os.remove("stderr.txt")
+        os.remove(output_path("stdout.txt"))
+        os.remove(output_path("stderr.txt"))
     except FileNotFoundError:
         pass
 
-    total = sum([len(x["tests"]) for x in _test_results.values()])
-    succeeded = 0
-    total_score = 0
-    total_sum_weights = 0
-    for problem in _test_results.values():
-        problem_sum_weights = 0
-        problem_success = True
-        for t in problem["tests"]:
-            if "asan_log" in t and t["asan_log"]:
-                t["success"] = False
-            problem_success = problem_success and t["success"]
-            if t["success"]:
-                succeeded += 1
-                total_score += t["weight"]
-                problem["score"] += t["weight"]
-
-            problem_sum_weights += t["weight"]
-            total_sum_weights += t["weight"]
-
-        problem["success"] = problem_success
-
-        if problem_sum_weights > 0:
-            problem["score"] = round((problem["score"] / problem_sum_weights) * 100, 2)
-
-    if total_sum_weights > 0:
-        total_score /= total_sum_weights
-
-    with open(result_filepath, "w") as f:
-        data = {
-            "summary": {
-                "total": total,
-                "succeeded": succeeded,
-                "failed": total - succeeded,
-                "score": round(total_score * 100, 2),
-            },
-            "problems": _test_results
-        }
-        yaml_dump(data=data, stream=f, sort_keys=False)
+    if shard is not None:
+        data = {"order": order, "records": _test_records}
+    else:
+        data = summarize(_test_results)
+        if _startup_time is not None:
+            data["startup_time"] = _startup_time
+    dump_results(data, result_filepath, result_format)
+
+    # the results are complete, the journal is no longer needed
+    os.remove(journal_filepath)
@@ -3,6 +3,8 @@ import struct
 import sys
 import math
 import re
+import array
+from collections import namedtuple
 from functools import wraps
 
 
@@ -55,9 +57,13 @@ def disable_watch_fail(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
         gdb.set_convenience_variable("__CCorrect_disable_watch_fail", True)
-        ret = func(self, *args, **kwargs)
-        gdb.set_convenience_variable("__CCorrect_disable_watch_fail", False)
-        return ret
+        self._pause_watch(True)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            # the watches and the failures must come back even if the call raised (for example a gdb.error for an invalid value)
+            self._pause_watch(False)
+            gdb.set_convenience_variable("__CCorrect_disable_watch_fail", False)
 
     return wrapper
 
@@ -100,6 +106,49 @@ class Ptr(int):
         return hex(self)
 
 
+# formats of the items of the buffers that can be written as integers and floats (see `check_buffer`)
+_INT_BUFFER_FORMATS = "bBhHiIlLqQnNc?"
+_FLOAT_BUFFER_FORMATS = "fd"
+
+
+def as_buffer(template):
+    """Returns a `memoryview` of `template` if it supports the buffer protocol (bytes, bytearray, memoryview, array.array, NumPy arrays...), None otherwise."""
+    if template is None or isinstance(template, (int, float, str, list, tuple, dict)):
+        return None
+    try:
+        return memoryview(template)
+    except TypeError:
+        return None
+
+
+def check_buffer(view, type):
+    """Raises a `ValueError` if the items of the buffer `view` are not in the native representation of `type`."""
+    format = view.format
+    if format[:1] in "@=<>!":
+        order, format = format[0], format[1:]
+        if (order in ">!" and sys.byteorder == "little") or (order == "<" and sys.byteorder == "big"):
+            raise ValueError(f"The items of the buffer are not in the byte order of the inferior (format: '{view.format}')")
+
+    stripped = type.strip_typedefs().unqualified()
+    if stripped.code == gdb.TYPE_CODE_ENUM:
+        stripped = stripped.target().strip_typedefs().unqualified()
+    if stripped.code in (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_BOOL):
+        # raw bytes are accepted for every type of 1 byte (such as the char of strings)
+        valid = format in _INT_BUFFER_FORMATS and view.itemsize == type.sizeof and \
+            (view.itemsize == 1 or format.islower() == type_is_signed(stripped))
+    elif stripped.code == gdb.TYPE_CODE_FLT:
+        valid = format in _FLOAT_BUFFER_FORMATS and view.itemsize == type.sizeof
+    else:
+        valid = False
+    if not valid:
+        raise ValueError(f"A buffer of format '{view.format}' cannot be written as '{type}'")
+
+
+def buffer_bytes(view):
+    """Returns the bytes of the buffer `view` as a flat buffer, without copying them if possible."""
+    return view.cast("B") if view.c_contiguous else view.tobytes()
+
+
 class ValueNode:
     def __init__(self, type, template, value_builder, parent=None):
         self.type = type
@@ -204,35 +253,461 @@ class UnionNode(ValueNode):
         return obj
 
 
+class BufferNode(ValueNode):
+    """Array whose elements are the items of an object supporting the buffer protocol, written as is instead of being parsed element by element."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.view = as_buffer(self.template)
+
+        element_type = self.type
+        while element_type.strip_typedefs().code == gdb.TYPE_CODE_ARRAY:
+            element_type = element_type.strip_typedefs().target()
+        check_buffer(self.view, element_type)
+
+        if not self.parent:
+            # same as ArrayNode: the type of a root array is the type of its elements
+            for length in reversed(self.view.shape):
+                self.type = self.type.array(length - 1)
+
+    def to_bytes(self):
+        return bytearray(buffer_bytes(self.view))
+
+
 class PointerNode(ValueNode):
+    """
+    Pointer whose pointed values are only parsed by `parse_pointee` and allocated by `ValueBuilder._tree_bytes`,
+    which sets its `address`, so that long chains of pointers (such as linked lists) are not parsed recursively.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if self.template is not None and not isinstance(self.template, Ptr):
-            if isinstance(self.template, str):
-                self.template = tuple(self.template + chr(0))
+        self.address = self.template if isinstance(self.template, Ptr) else None
+        if isinstance(self.template, str):
+            self.template = tuple(self.template + chr(0))
 
-            if isinstance(self.template, (list, tuple)):
-                for elem in self.template:
-                    self.children.append(self.value_builder._parse_template(self.type.target(), elem, self))
-            else:
-                self.children = [self.value_builder._parse_template(self.type.target(), self.template, self)]
+    def parse_pointee(self):
+        """Parses the children of this pointer (the values it points to), their own pointers are not parsed."""
+        if isinstance(self.template, (list, tuple)):
+            self.children = [self.value_builder._parse_template(self.type.target(), elem, self) for elem in self.template]
+        else:
+            self.children = [self.value_builder._parse_template(self.type.target(), self.template, self)]
+
+    def pointee_bytes(self):
+        if len(self.children) == 1 and isinstance(self.children[0], BufferNode):
+            # the pointed buffer is written without copying it
+            return buffer_bytes(self.children[0].view)
+        obj = bytearray()
+        for child in self.children:
+            obj += child.to_bytes()
+        return obj
 
     def to_bytes(self):
-        if isinstance(self.template, Ptr):
-            address = self.template
+        return bytearray(self.address.to_bytes(self.type.sizeof, sys.byteorder, signed=type_is_signed(self.type)))
+
+
+def unallocated_pointers(nodes):
+    """Returns the `PointerNode` of the trees `nodes` (without the values they point to) whose pointed values are not allocated yet, in the order of their bytes."""
+    pointers = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, PointerNode):
+            if node.address is None:
+                pointers.append(node)
         else:
-            obj = bytearray()
-            for child in self.children:
-                obj += child.to_bytes()
+            stack.extend(reversed(node.children))
+    return pointers
 
-            pointer = gdb.parse_and_eval(f"(void *) malloc({len(obj)})")
-            inferior = gdb.selected_inferior()
-            inferior.write_memory(pointer, obj)
 
-            address = int(pointer)
-            self.value_builder._allocated_addresses.add(address)
+# maximum nesting of the templates packed by plans, the deeper ones (such as long linked lists) are built with a tree of `ValueNode`
+PLAN_MAX_DEPTH = 32
+
+
+class UnsupportedTemplate(ValueError):
+    """Raised when the templates of a shape can't be packed by a `PackingPlan`, they are built with a tree of `ValueNode` instead."""
+
+
+def template_shape(template, depth=0):
+    """
+    Returns the shape of `template`: its structure and the kinds of its leaves, without their values (see `PackingPlan`).
+    Returns None if `template` contains values that are not handled by the plans or if it is nested deeper than `PLAN_MAX_DEPTH`.
+    """
+    if depth > PLAN_MAX_DEPTH:
+        return None
+    elif isinstance(template, Ptr):
+        return "P"
+    elif template is None:
+        return "N"
+    elif isinstance(template, float):
+        return "f"
+    elif isinstance(template, int):
+        return "i"
+    elif isinstance(template, str):
+        # a string is a single char, except for a pointer
+        return ("s", len(template))
+    elif isinstance(template, (list, tuple)):
+        shapes = []
+        for elem in template:
+            shape = template_shape(elem, depth + 1)
+            if shape is None:
+                return None
+            shapes.append(shape)
+        return ("l", tuple(shapes))
+    elif isinstance(template, dict):
+        shapes = []
+        for key, elem in template.items():
+            shape = template_shape(elem, depth + 1)
+            if shape is None:
+                return None
+            shapes.append((key, shape))
+        return ("d", tuple(shapes))
+    return None
+
+
+def pointee_templates(template):
+    """Returns the templates of the values pointed by a pointer built from `template` (see `PointerNode`)."""
+    if isinstance(template, str):
+        return tuple(template + chr(0))
+    if isinstance(template, (list, tuple)):
+        return template
+    return (template,)
+
+
+class PackingPlan:
+    """
+    Flat plan that packs the values of a type built from templates of the same shape (see `template_shape`) into the same bytes
+    as the tree of `ValueNode` of each template, without building the tree.
+
+    Each leaf of the templates is packed at its offset by a single `struct` format, with the padding of the structs precomputed.
+    The pointers to other templates are fix-up slots: the values they point to are packed by their own plan
+    and allocated in the inferior when the plan is packed, then their address is packed in the slot.
+    """
 
-        return bytearray(address.to_bytes(self.type.sizeof, sys.byteorder, signed=type_is_signed(self.type)))
+    def __init__(self, root_type):
+        self.root_type = root_type
+        self.size = 0
+        # (path of the leaf in the template, kind of the leaf, plan of the pointed values) of each packed leaf
+        self._leaves = []
+        self._formats = ["="]
+        self._struct = None
+
+    @classmethod
+    def compile(cls, type, template):
+        """Returns the plan of the values of `type` built from the templates of the shape of `template`, or None if this shape is not handled by the plans."""
+        plan = cls(type)
+        try:
+            plan.__node(type, template, (), root=True)
+        except UnsupportedTemplate:
+            # the templates of this shape are built with a tree of ValueNode
+            return None
+        plan.__finish()
+        return plan
+
+    def pack(self, value_builder, template):
+        """Returns the bytes of the value built from `template`, the values it points to are allocated by `value_builder`."""
+        values = []
+        for path, kind, plan in self._leaves:
+            value = template
+            for key in path:
+                value = value[key]
+            if kind == "char":
+                value = ord(value[0])
+            elif kind == "pointee":
+                value = value_builder._store_bytes(plan.pack(value_builder, pointee_templates(value)))
+            elif kind == "pointer" and value is None:
+                value = 0
+            values.append(value)
+
+        try:
+            return bytearray(self._struct.pack(*values))
+        except struct.error as e:
+            raise OverflowError(str(e)) from None
+
+    def __finish(self):
+        self._struct = struct.Struct("".join(self._formats))
+
+    def __add(self, path, kind, format, plan=None):
+        self._leaves.append((path, kind, plan))
+        self._formats.append(format)
+        self.size += struct.calcsize(f"={format}")
+
+    def __pad(self, size):
+        if size > 0:
+            self._formats.append(f"{size}x")
+            self.size += size
+
+    def __int_format(self, type):
+        format = {1: "b", 2: "h", 4: "i", 8: "q"}.get(type.sizeof)
+        if format is None:
+            raise UnsupportedTemplate(f"Integers of {type.sizeof} bytes are not packed by plans")
+        return format if type_is_signed(type.unqualified().strip_typedefs()) else format.upper()
+
+    def __node(self, type, template, path, root=False):
+        # same cases as ValueBuilder._parse_template
+        type_code = type.strip_typedefs().unqualified().code
+        if type_code == gdb.TYPE_CODE_PTR:
+            if template is None or isinstance(template, Ptr):
+                self.__add(path, "pointer", self.__int_format(type))
+            else:
+                plan = PackingPlan(type.target())
+                plan.__sequence(type.target(), pointee_templates(template), ())
+                plan.__finish()
+                self.__add(path, "pointee", self.__int_format(type), plan)
+        elif isinstance(template, (list, tuple)):
+            if root:
+                # see ArrayNode.__set_root_type
+                lengths = []
+                elem = template
+                while isinstance(elem, (list, tuple)):
+                    lengths.append(len(elem) - 1)
+                    elem = elem[0]
+                for length in reversed(lengths):
+                    type = type.array(length)
+                self.root_type = type
+            self.__sequence(type.target(), template, path)
+        elif isinstance(template, dict):
+            start = self.size
+            if type_code == gdb.TYPE_CODE_UNION:
+                if len(template) != 1:
+                    # every member of the template is built by UnionNode
+                    raise UnsupportedTemplate("Only unions with one initialized member are packed by plans")
+                fields = {f.name: f for f in type.fields()}
+                (name, elem), = template.items()
+                self.__node(fields[name].type, elem, (*path, name))
+                self.__pad(type.sizeof - (self.size - start))
+            else:
+                # see StructNode.__align_bytes
+                alignment = type.alignof
+                if type.sizeof % alignment != 0:
+                    alignment = 1
+                for f in type.fields():
+                    self.__node(f.type, template[f.name], (*path, f.name))
+                    size = self.size - start
+                    self.__pad(math.ceil(size / alignment) * alignment - size)
+        elif type_code == gdb.TYPE_CODE_ENUM:
+            self.__scalar(type.target(), template, path)
+        else:
+            self.__scalar(type, template, path)
+
+    def __sequence(self, type, templates, path):
+        for i, elem in enumerate(templates):
+            self.__node(type, elem, (*path, i))
+
+    def __scalar(self, type, template, path):
+        # see ScalarNode.to_bytes
+        stripped = type.unqualified().strip_typedefs()
+        if isinstance(template, float):
+            if stripped.code != gdb.TYPE_CODE_FLT:
+                raise ValueError(f"Cannot pack a float as a '{type}'")
+            self.__add(path, "float", "f" if stripped.name == "float" else "d")
+        elif stripped.code in (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_PTR, gdb.TYPE_CODE_VOID):
+            if isinstance(template, str):
+                if len(template) == 0:
+                    raise ValueError("Cannot pack an empty string as a char")
+                self.__add(path, "char", self.__int_format(type))
+            elif isinstance(template, int):
+                self.__add(path, "int", self.__int_format(type))
+            else:
+                raise ValueError(f"Cannot pack '{template}' as a '{type}'")
+        else:
+            raise ValueError(f"Cannot pack '{template}' as a '{type}'")
+
+
+class Arena:
+    """
+    Memory region of `size` bytes allocated in the inferior at `address` in which the values built by a `ValueBuilder` are bump-allocated.
+    The bytes of the values are only written in the inferior by `flush`, in a single write.
+    """
+
+    ALIGNMENT = 16
+
+    def __init__(self, address, size):
+        self.address = address
+        self.end = address + size
+        self.next = address
+        self.writes = []
+
+    def store(self, obj):
+        """Reserves the place of the bytes `obj` in the arena and returns their address, or None if there is not enough space left."""
+        start = (self.next + self.ALIGNMENT - 1) & ~(self.ALIGNMENT - 1)
+        if start + len(obj) > self.end:
+            return None
+        self.writes.append((start, obj))
+        self.next = start + len(obj)
+        return start
+
+    def flush(self):
+        """Writes the bytes stored since the last flush in the inferior."""
+        if not self.writes:
+            return
+        # the stored bytes are contiguous (except for their alignment) so they are patched into a single buffer
+        base = self.writes[0][0]
+        buffer = bytearray(self.writes[-1][0] + len(self.writes[-1][1]) - base)
+        for address, obj in self.writes:
+            buffer[address - base:address - base + len(obj)] = obj
+        gdb.selected_inferior().write_memory(base, buffer)
+        self.writes.clear()
+
+
+# a function looked up by a `LookupCache`: its `gdb.Value`, the list of the `gdb.Type` of its arguments and whether it is variadic
+FuncInfo = namedtuple("FuncInfo", ["value", "arg_types", "variadic"])
+
+
+class Layout:
+    """
+    Decoder of the bytes of the values of `type` into plain python values, compiled once per type (see `LookupCache.layout`):
+    an int or a float for scalars and pointers, a list for arrays and a dict of their members for structs and unions.
+    """
+
+    _INT_FORMATS = {1: "b", 2: "h", 4: "i", 8: "q"}
+
+    def __init__(self, type):
+        self.type = type
+        self.size = type.sizeof
+        self._decode = self.__compile(type)
+
+    def decode(self, data, offset=0):
+        """Returns the value of `type` whose bytes are at `offset` in the buffer `data`."""
+        return self._decode(data, offset)
+
+    @classmethod
+    def scalar_format(cls, type):
+        """Returns the `struct` format (without byte order) of a scalar `type` or None if it is not a scalar."""
+        stripped = type.strip_typedefs().unqualified()
+        if stripped.code == gdb.TYPE_CODE_FLT:
+            return {4: "f", 8: "d"}.get(stripped.sizeof)
+        if stripped.code in (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_BOOL, gdb.TYPE_CODE_ENUM, gdb.TYPE_CODE_PTR):
+            format = cls._INT_FORMATS.get(stripped.sizeof)
+            if format is None or stripped.code == gdb.TYPE_CODE_PTR or not type_is_signed(stripped):
+                return format if format is None else format.upper()
+            return format
+        return None
+
+    def __compile(self, type):
+        stripped = type.strip_typedefs().unqualified()
+        format = self.scalar_format(stripped)
+        if format is not None:
+            scalar = struct.Struct(f"={format}")
+            return lambda data, offset: scalar.unpack_from(data, offset)[0]
+
+        if stripped.code == gdb.TYPE_CODE_ARRAY:
+            low, high = stripped.range()
+            # flexible array members have no elements
+            count = max(high - low + 1, 0)
+            element_format = self.scalar_format(stripped.target())
+            if element_format is not None:
+                elements = struct.Struct(f"={count}{element_format}")
+                return lambda data, offset: list(elements.unpack_from(data, offset))
+            element = self.__compile(stripped.target())
+            size = stripped.target().sizeof
+            return lambda data, offset: [element(data, offset + i * size) for i in range(count)]
+
+        if stripped.code in (gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION):
+            members = []
+            for f in stripped.fields():
+                if not hasattr(f, "bitpos"):
+                    # static members are not stored in the value
+                    continue
+                decode = self.__compile_bitfield(f) if f.bitsize > 0 else self.__compile(f.type)
+                members.append((f.name, f.bitpos // 8, decode))
+
+            def decode_members(data, offset):
+                value = {}
+                for name, member_offset, decode in members:
+                    member = decode(data, offset + member_offset)
+                    if name is None:
+                        # members of an anonymous struct or union
+                        value.update(member)
+                    else:
+                        value[name] = member
+                return value
+            return decode_members
+
+        raise ValueError(f"The values of type '{type}' cannot be decoded")
+
+    def __compile_bitfield(self, field):
+        shift = field.bitpos % 8
+        size = (shift + field.bitsize + 7) // 8
+        mask = (1 << field.bitsize) - 1
+        sign = 1 << (field.bitsize - 1) if type_is_signed(field.type.strip_typedefs().unqualified()) else 0
+
+        def decode(data, offset):
+            # the bitfields are allocated from the least significant bit (little-endian targets)
+            value = (int.from_bytes(data[offset:offset + size], sys.byteorder) >> shift) & mask
+            return value - (sign << 1) if value & sign else value
+        return decode
+
+
+class LookupCache:
+    """
+    Memo of the types and functions looked up in the program loaded by GDB.
+    The looked up `gdb.Type` and `gdb.Value` are tied to the object file of this program so the cache is cleared when another one is loaded.
+    """
+
+    def __init__(self):
+        self._objfile = None
+        self._types = {}
+        self._functions = {}
+        self._plans = {}
+        self._layouts = {}
+
+    def use(self, objfile):
+        """Clears the cache if `objfile` (the `gdb.Objfile` of the loaded program) is not the one of the cached lookups."""
+        if self._objfile is not objfile or not objfile.is_valid():
+            self.clear()
+            self._objfile = objfile
+
+    def clear(self):
+        self._objfile = None
+        self._types.clear()
+        self._functions.clear()
+        self._plans.clear()
+        self._layouts.clear()
+
+    def type(self, name):
+        """Returns the `gdb.Type` whose identifier is `name`."""
+        type = self._types.get(name)
+        if type is None:
+            type = self._types[name] = gdb.lookup_type(name)
+        return type
+
+    def function(self, name):
+        """Returns the `FuncInfo` of the function whose identifier is `name`."""
+        info = self._functions.get(name)
+        if info is None:
+            value = gdb.parse_and_eval(name)
+            if value.type.strip_typedefs().unqualified().code != gdb.TYPE_CODE_FUNC:
+                raise ValueError(f"'{name}' is not a valid function identifier")
+            arg_types = [field.type for field in value.type.fields()]
+            variadic = re.search(r"\((.*, ?)*(\.\.\.)\)$", str(value.type)) is not None
+            info = self._functions[name] = FuncInfo(value, arg_types, variadic)
+        return info
+
+    def plan(self, type, template):
+        """Returns the `PackingPlan` of the values of `type` built from templates of the shape of `template`, or None if they are not packed by plans."""
+        shape = template_shape(template)
+        if shape is None:
+            return None
+        name = str(type)
+        if "{...}" in name:
+            # anonymous types can't be told apart by their name
+            return PackingPlan.compile(type, template)
+        key = (name, shape)
+        if key not in self._plans:
+            self._plans[key] = PackingPlan.compile(type, template)
+        return self._plans[key]
+
+    def layout(self, type):
+        """Returns the `Layout` of the values of `type`."""
+        name = str(type)
+        if "{...}" in name:
+            # anonymous types can't be told apart by their name
+            return Layout(type)
+        layout = self._layouts.get(name)
+        if layout is None:
+            layout = self._layouts[name] = Layout(type)
+        return layout
 
 
 class FuncWrapper:
@@ -243,29 +718,33 @@ class FuncWrapper:
 
     def __init__(self, valuebuilder, function):
         self._valuebuilder = valuebuilder
-        self._value = gdb.parse_and_eval(function)
-        if self._value.type.strip_typedefs().unqualified().code != gdb.TYPE_CODE_FUNC:
-            raise ValueError(f"'{function}' is not a valid function identifier")
+        self._value, self._arg_types, self._variadic = valuebuilder._lookups.function(function)
 
     @ensure_self_debugging
-    def __call__(self, *args):
+    def __call__(self, *args, timeout=0):
+        """
+        Calls the function with `args`, which are converted to `gdb.Value` using the types of the parameters of the function if needed.
+        If `timeout` is set, the inferior is stopped if the call lasts more than `timeout` seconds, which raises a `gdb.error`.
+        """
         parsed_args = []
         if args is not None:
-            arg_types = [field.type for field in self._value.type.fields()]
-            for arg, type in zip(args, arg_types):
+            for arg, type in zip(args, self._arg_types):
                 if isinstance(arg, FuncWrapper):
                     arg = arg._value
                 elif not isinstance(arg, gdb.Value):
                     arg = self._valuebuilder.value(type, arg)
                 parsed_args.append(arg)
 
-            if len(args) > len(parsed_args):
-                if re.search(r"\((.*, ?)*(\.\.\.)\)$", str(self._value.type)) is not None:
-                    # self._value is a variadic function
-                    for i in range(len(parsed_args), len(args)):
-                        parsed_args.append(args[i])
+            if len(args) > len(parsed_args) and self._variadic:
+                for i in range(len(parsed_args), len(args)):
+                    parsed_args.append(args[i])
 
-        return self._value(*parsed_args)
+        self._valuebuilder._before_call(timeout)
+        try:
+            ret = self._value(*parsed_args)
+        finally:
+            self._valuebuilder._after_call()
+        return ret
 
     def __str__(self):
         return str(self._value)
@@ -274,15 +753,32 @@ class FuncWrapper:
 class ValueBuilder:
     _id_counter = 0
 
-    def __init__(self):
+    def __init__(self, arena_size=0):
         self._allocated_addresses = set()
+        self._lookups = LookupCache()
+        self._arena_size = arena_size
+        self._arena = None
         self._id = ValueBuilder._id_counter
         ValueBuilder._id_counter += 1
 
+    def _before_call(self, timeout):
+        """Called before each call of a function of the inferior by a `FuncWrapper` with the `timeout` of the call (0 means no timeout)."""
+        pass
+
+    def _after_call(self):
+        """Called after each call of a function of the inferior by a `FuncWrapper`, even if it failed."""
+        pass
+
+    def _pause_watch(self, paused):
+        """Called with True before the functions of the inferior are called to build or free values and with False afterwards."""
+        pass
+
     def _parse_template(self, type, template, parent=None):
         type_code = type.strip_typedefs().unqualified().code
         if type_code == gdb.TYPE_CODE_PTR:
             return PointerNode(type, Ptr(0) if template is None else template, self, parent=parent)
+        elif as_buffer(template) is not None:
+            return BufferNode(type, template, self, parent=parent)
         elif isinstance(template, (list, tuple)):
             return ArrayNode(type, template, self, parent=parent)
         elif isinstance(template, dict):
@@ -296,11 +792,42 @@ class ValueBuilder:
 
     def _value_as_bytes(self, type, template):
         if not isinstance(type, gdb.Type):
-            type = gdb.lookup_type(type)
+            type = self._lookups.type(type)
+
+        if type.strip_typedefs().unqualified().code != gdb.TYPE_CODE_PTR and as_buffer(template) is not None:
+            # the bytes of the buffer are written as is
+            root = BufferNode(type, template, self)
+            return buffer_bytes(root.view), root.type
+
+        # the templates of the same shape are packed by the same plan, compiled once
+        plan = self._lookups.plan(type, template)
+        if plan is not None:
+            return plan.pack(self, template), plan.root_type
 
         root = self._parse_template(type, template)
         # self._print_tree(root)
-        return root.to_bytes(), root.type
+        return self._tree_bytes(root), root.type
+
+    def _tree_bytes(self, root):
+        """
+        Returns the bytes of the tree of `ValueNode` `root`. The values pointed by its pointers are parsed and allocated before the bytes
+        of the pointers are packed, with an explicit stack instead of recursive calls which would exceed the recursion limit for long linked lists.
+        """
+        # each entry is a tree (the root or the values pointed by a pointer) and its pointers whose values are not allocated yet, last one first
+        stack = [(root, unallocated_pointers([root])[::-1])]
+        while True:
+            node, pointers = stack[-1]
+            if pointers:
+                pointer = pointers.pop()
+                pointer.parse_pointee()
+                stack.append((pointer, unallocated_pointers(pointer.children)[::-1]))
+                continue
+
+            stack.pop()
+            if not stack:
+                return node.to_bytes()
+            # all the pointers of the values pointed by `node` have an address
+            node.address = self._store_bytes(node.pointee_bytes())
 
     def _print_tree(self, node, level=0):
         if level == 0:
@@ -314,17 +841,37 @@ class ValueBuilder:
         if level == 0:
             print("----------------")
 
+    def _store_bytes(self, obj):
+        """Allocates the bytes `obj` in the inferior and returns their address. In arena mode, they are only written by the next `Arena.flush`."""
+        if self._arena_size <= 0:
+            pointer = gdb.parse_and_eval(f"(void *) malloc({len(obj)})")
+            gdb.selected_inferior().write_memory(pointer, obj)
+            self._allocated_addresses.add(int(pointer))
+            return int(pointer)
+
+        address = None if self._arena is None else self._arena.store(obj)
+        if address is None:
+            # the arena is full: the next one is big enough for `obj`
+            if self._arena is not None:
+                self._arena.flush()
+            size = max(self._arena_size, len(obj))
+            pointer = gdb.parse_and_eval(f"(void *) malloc({size})")
+            self._allocated_addresses.add(int(pointer))
+            self._arena = Arena(int(pointer), size)
+            address = self._arena.store(obj)
+        return address
+
     @ensure_self_debugging
     @disable_watch_fail
     def _value_allocated(self, type, template):
         obj, root_type = self._value_as_bytes(type, template)
 
         # print(f"alloc size = {len(obj)}")
-        pointer = gdb.parse_and_eval(f"(void *) malloc({len(obj)})")
-        gdb.selected_inferior().write_memory(pointer, obj)
+        address = self._store_bytes(obj)
+        if self._arena is not None:
+            self._arena.flush()
 
-        self._allocated_addresses.add(int(pointer))
-        return pointer.cast(root_type.pointer())
+        return gdb.Value(address).cast(root_type.pointer())
 
     def value(self, type, template):
         """
@@ -338,6 +885,10 @@ class ValueBuilder:
 
         If the template is a `list`, its elements must be templates and the returned `gdb.Value` will be an array of the elements from the list.
 
+        The template of an array (or of the values pointed by a pointer) can also be an object supporting the buffer protocol (`bytes`, `bytearray`, `memoryview`,
+        `array.array`, NumPy arrays...) whose items have the representation of the elements of the array (same size, signedness and byte order, integers or floats).
+        Its bytes are written as is in the inferior's memory, which is much faster than a `list` for big arrays. A `ValueError` is raised if its items don't match the type.
+
         In the case where the given `type` is a struct or an union, the template must be a `dict` whose keys are strings representing
         each member's identifier and the values are templates.
 
@@ -350,6 +901,7 @@ class ValueBuilder:
             val = debugger.value("int", [0, 1, 2, 3])  # Creates an int array of 4 elements with values 0, 1, 2 and 3.
             val = debugger.value("char", ["H", "e", "l", "l", "o", "!", 0])  # Creates a char array containing the string "Hello!".
             val = debugger.value("struct student", {"id": 2468, "grades": [13, 12, 8, 17]})  # Creates a struct student.
+            val = debugger.value("int", array.array("i", range(100000)))  # Creates an int array of 100000 elements from a buffer.
 
             debugger.finish()
         """
@@ -370,11 +922,12 @@ class ValueBuilder:
 
             debugger.finish()
         """
-        return self.value("char", [*str, '\0']).cast(gdb.lookup_type("char").pointer())
+        return self.value("char", [*str, '\0']).cast(self._lookups.type("char").pointer())
 
     def pointer(self, value_or_type, value=None):
         """
         Returns a `gdb.Value` representing a pointer. It can be used to get a pointer towards a `gdb.Value` or create a pointer pointing to the given value.
+        If `value` supports the buffer protocol (see `value`), the returned pointer points to a copy of its items in the inferior's memory.
         """
         if value is None:
             value = value_or_type
@@ -385,9 +938,195 @@ class ValueBuilder:
             assert value.type.code == gdb.TYPE_CODE_PTR
             return self._value_allocated(value.type, Ptr(value))
 
-        type = gdb.lookup_type(value_or_type).pointer()
+        type = self._lookups.type(value_or_type).pointer()
+        if as_buffer(value) is not None:
+            return self._value_allocated(type, value).dereference()
         return self._value_allocated(type, Ptr(value)).dereference()
 
+    @ensure_self_debugging
+    def read_array(self, value, length=None, numpy=False):
+        """
+        Returns the `length` elements of the array `value` (a `gdb.Value` of an array or of a pointer to its first element) read with a single memory read.
+        `length` defaults to the length of the array type but it must be given for a pointer.
+
+        The elements of scalar types are returned in an `array.array` (or in a NumPy array if `numpy` is True), the other ones
+        in a list of plain python values (see `to_python`). This is much faster than reading the elements one by one with `gdb_array_iter`.
+
+        Usage example::
+
+            debugger = Debugger("program")
+            debugger.start()
+
+            sort = debugger.function("sort")
+            array = debugger.value("int", [5, 3, 4, 1, 2])
+            sort(array, 5)
+            elements = debugger.read_array(array)  # array('i', [1, 2, 3, 4, 5])
+            elements = debugger.read_array(debugger.pointer(array), 3)  # array('i', [1, 2, 3])
+
+            debugger.finish()
+        """
+        type = value.type.strip_typedefs().unqualified()
+        if type.code == gdb.TYPE_CODE_ARRAY:
+            if value.address is None:
+                raise ValueError("The array is not in the inferior's memory")
+            address = int(value.address)
+            if length is None:
+                low, high = type.range()
+                length = max(high - low + 1, 0)
+        elif type.code == gdb.TYPE_CODE_PTR:
+            address = int(value)
+            if length is None:
+                raise ValueError("The length of the array must be given for a pointer")
+        else:
+            raise ValueError(f"'{value.type}' is not an array or a pointer type")
+
+        element_type = type.target()
+        data = gdb.selected_inferior().read_memory(address, length * element_type.sizeof) if length > 0 else b""
+        format = Layout.scalar_format(element_type)
+        if numpy:
+            if format is None:
+                raise ValueError(f"The elements of type '{element_type}' cannot be read in a NumPy array")
+            try:
+                import numpy as np
+            except ImportError:
+                raise ImportError("Reading NumPy arrays needs the 'numpy' package (pip install CCorrect[numpy])")
+            return np.frombuffer(data, dtype=np.dtype(f"={format}")).copy()
+        if format is not None:
+            elements = array.array(format)
+            elements.frombytes(data)
+            return elements
+
+        layout = self._lookups.layout(element_type)
+        data = memoryview(data)
+        return [layout.decode(data, i * layout.size) for i in range(length)]
+
+    @ensure_self_debugging
+    def to_python(self, value):
+        """
+        Returns `value` (a `gdb.Value`) as a plain python value, read with a single memory read: an int or a float for scalars and pointers,
+        a list for arrays and a dict of their members for structs and unions (including the members of their nested arrays, structs and unions).
+
+        Usage example::
+
+            debugger = Debugger("program")
+            debugger.start()
+
+            val = debugger.value("struct student", {"id": 2468, "grades": [13, 12, 8, 17]})
+            student = debugger.to_python(val)  # {"id": 2468, "grades": [13, 12, 8, 17]}
+
+            debugger.finish()
+        """
+        layout = self._lookups.layout(value.type)
+        if value.address is not None:
+            data = memoryview(gdb.selected_inferior().read_memory(value.address, layout.size))
+        elif Layout.scalar_format(value.type) is not None:
+            # a scalar that is not in memory (such as a returned value)
+            return float(value) if value.type.strip_typedefs().code == gdb.TYPE_CODE_FLT else int(value)
+        else:
+            raise ValueError("The value is not in the inferior's memory")
+        return layout.decode(data)
+
+    @ensure_self_debugging
+    def read_linked(self, ptr, next_field="next", max_nodes=100000):
+        """
+        Returns the nodes of the linked list whose first node is pointed by `ptr` (a `gdb.Value`), as a list of plain python values (see `to_python`).
+        The list ends at the first node whose `next_field` member is NULL. Each node is read with a single memory read using the cached layout of its type.
+
+        A `ValueError` is raised if the list has a cycle or more than `max_nodes` nodes.
+
+        Usage example::
+
+            debugger = Debugger("program")
+            debugger.start()
+
+            list_ptr = debugger.pointer(debugger.value("node", {"value": 1, "next": {"value": 2, "next": None}}))
+            values = [node["value"] for node in debugger.read_linked(list_ptr)]  # [1, 2]
+
+            debugger.finish()
+        """
+        address, layout = self.__node_layout(ptr)
+        inferior = gdb.selected_inferior()
+        nodes = []
+        visited = set()
+        while address != 0:
+            if address in visited:
+                raise ValueError(f"The linked list has a cycle (node {len(nodes)} points to the node at {address:#x})")
+            if len(nodes) >= max_nodes:
+                raise ValueError(f"The linked list has more than {max_nodes} nodes")
+            visited.add(address)
+
+            node = layout.decode(memoryview(inferior.read_memory(address, layout.size)))
+            if next_field not in node:
+                raise ValueError(f"'{layout.type}' has no member '{next_field}'")
+            nodes.append(node)
+            address = node[next_field]
+        return nodes
+
+    @ensure_self_debugging
+    def read_tree(self, ptr, child_fields=("left", "right"), max_nodes=100000):
+        """
+        Returns the tree whose root is pointed by `ptr` (a `gdb.Value`) as a plain python value (see `to_python`) or None if `ptr` is NULL.
+        In each node, the members named by `child_fields` (pointers or arrays of pointers to the children) are replaced by the children nodes (None for NULL).
+        Each node is read with a single memory read using the cached layout of its type.
+
+        A `ValueError` is raised if a node is reachable more than once (a cycle or a shared node) or if the tree has more than `max_nodes` nodes.
+
+        Usage example::
+
+            debugger = Debugger("program")
+            debugger.start()
+
+            tree_insert = debugger.function("tree_insert")
+            root = debugger.pointer("tree_node", 0)
+            for value in [2, 1, 3]:
+                root = tree_insert(root, value)
+            tree = debugger.read_tree(root)
+            values = [tree["left"]["value"], tree["value"], tree["right"]["value"]]  # [1, 2, 3]
+
+            debugger.finish()
+        """
+        address, layout = self.__node_layout(ptr)
+        inferior = gdb.selected_inferior()
+        root = {"root": address}
+        # (node, member of the node, index in the member or None) of the children to read
+        pending = [(root, "root", None)]
+        visited = set()
+        while pending:
+            parent, field, index = pending.pop()
+            address = parent[field] if index is None else parent[field][index]
+            if address == 0:
+                node = None
+            else:
+                if address in visited:
+                    raise ValueError(f"The node at {address:#x} of the tree is reachable more than once")
+                if len(visited) >= max_nodes:
+                    raise ValueError(f"The tree has more than {max_nodes} nodes")
+                visited.add(address)
+
+                node = layout.decode(memoryview(inferior.read_memory(address, layout.size)))
+                for child_field in child_fields:
+                    if child_field not in node:
+                        raise ValueError(f"'{layout.type}' has no member '{child_field}'")
+                    if isinstance(node[child_field], list):
+                        pending.extend((node, child_field, i) for i in range(len(node[child_field])))
+                    else:
+                        pending.append((node, child_field, None))
+
+            if index is None:
+                parent[field] = node
+            else:
+                parent[field][index] = node
+        return root["root"]
+
+    def __node_layout(self, ptr):
+        """Returns the address of the node pointed by `ptr` (or of `ptr` if it is a struct) and the `Layout` of its type."""
+        type = ptr.type.strip_typedefs().unqualified()
+        if type.code == gdb.TYPE_CODE_PTR:
+            return int(ptr), self._lookups.layout(type.target())
+        if type.code == gdb.TYPE_CODE_STRUCT and ptr.address is not None:
+            return int(ptr.address), self._lookups.layout(ptr.type)
+        raise ValueError(f"'{ptr.type}' is not a pointer to a node")
+
     @ensure_self_debugging
     @disable_watch_fail
     def allocate(self, size, value=None):
@@ -397,6 +1136,7 @@ class ValueBuilder:
         `value` can be either `None`, any number in the range [0, 255] or a function that returns such a number and that is called for every position of the allocated memory region.
         If it is a function, it has one argument that is the 0-indexed position in the allocated memory region.
         If it is `None`, this has the same effect as just calling `malloc`.
+        It can also be an object supporting the buffer protocol (`bytes`, `array.array`...) of `size` bytes that are copied in the allocated memory region.
 
         Usage example::
 
@@ -412,13 +1152,24 @@ class ValueBuilder:
             # Allocate 6 bytes where the ith byte is set to i.
             ptr3 = debugger.allocate(6, lambda i: i)
 
+            # Allocate 4 bytes set to the bytes of a buffer.
+            ptr4 = debugger.allocate(4, b"\x01\x02\x03\x04")
+
             debugger.finish()
         """
+        view = as_buffer(value)
+        if view is not None and view.nbytes != size:
+            raise ValueError(f"The buffer has {view.nbytes} bytes instead of {size}")
+
         ptr = gdb.parse_and_eval(f"(void *) malloc({size})")
 
-        if value is not None:
-            obj = bytearray(value(i) if callable(value) else value for i in range(size))
+        if view is not None:
+            gdb.selected_inferior().write_memory(ptr, buffer_bytes(view), size)
+        elif callable(value):
+            obj = bytearray(value(i) for i in range(size))
             gdb.selected_inferior().write_memory(ptr, obj, size)
+        elif value is not None:
+            gdb.selected_inferior().write_memory(ptr, bytes([value]) * size, size)
 
         self._allocated_addresses.add(int(ptr))
         return ptr
@@ -469,3 +1220,4 @@ class ValueBuilder:
         for address in self._allocated_addresses:
             gdb.parse_and_eval(f"free({address})")
         self._allocated_addresses.clear()
+        self._arena = None
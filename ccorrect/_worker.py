@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import types
+import socket
+import traceback
+import gdb
+# import everything that a test script may need once for all the jobs executed by this worker
+import yaml  # noqa: F401
+import ccorrect._testing  # noqa: F401
+import ccorrect._parser  # noqa: F401
+from ccorrect._debugger import close_checkpoints
+
+
+_LIBRARY_PREFIXES = tuple({sys.prefix, sys.base_prefix, sys.exec_prefix})
+
+
+def _is_user_module(module):
+    """Returns True if `module` comes from the test scripts side (and not from the standard library, installed packages or CCorrect)."""
+    path = getattr(module, "__file__", None)
+    if path is None or module.__name__.split(".")[0] == "ccorrect":
+        return False
+    return not os.path.abspath(path).startswith(_LIBRARY_PREFIXES)
+
+
+def _memory_usage():
+    """Returns the resident memory size of this GDB process in bytes."""
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _reset_gdb():
+    """Puts GDB back in a clean state if a test script left a program loaded (for example if it raised an exception in the middle of a test)."""
+    close_checkpoints()
+    if gdb.convenience_variable("__CCorrect_debugging") is None:
+        return
+    try:
+        gdb.execute("kill")
+    except gdb.error:
+        pass
+    gdb.execute("file")
+    gdb.execute("delete")
+    gdb.set_convenience_variable("__CCorrect_debugging", None)
+
+
+def _run_job(test_script, cwd):
+    """
+    Executes `test_script` in `cwd` the same way `gdb -x test_script` would have done.
+    Returns None on success or the error that stopped the test script.
+    """
+    old_cwd = os.getcwd()
+    old_main = sys.modules["__main__"]
+    old_argv = sys.argv
+    old_modules = set(sys.modules)
+
+    # the test script is executed in a fresh __main__ module so that unittest.main() finds its tests
+    main = types.ModuleType("__main__")
+    main.__file__ = test_script
+    main.__name__ = "gdb"
+
+    error = None
+    try:
+        os.chdir(cwd)
+        sys.modules["__main__"] = main
+        sys.argv = [""]
+        with open(test_script, "r") as f:
+            code = compile(f.read(), test_script, "exec")
+        exec(code, main.__dict__)
+    except SystemExit as e:
+        if e.code:
+            error = f"test script exited with code: {e.code}"
+    except BaseException:
+        error = traceback.format_exc()
+    finally:
+        _reset_gdb()
+        sys.modules["__main__"] = old_main
+        sys.argv = old_argv
+        # forget the modules imported by the test script so the next job imports its own version of them
+        for name in set(sys.modules) - old_modules:
+            if _is_user_module(sys.modules[name]):
+                del sys.modules[name]
+        os.chdir(old_cwd)
+
+    return error
+
+
+def serve(socket_path, max_jobs=0, max_memory=0):
+    """
+    Executes the jobs received from the `WorkerPool` listening on `socket_path` until it closes the connection.
+    The worker stops after `max_jobs` jobs or when its memory usage exceeds `max_memory` bytes (0 means no limit) so that the pool replaces it.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        stream = sock.makefile("rw")
+        stream.write(json.dumps({"pid": os.getpid()}) + "\n")
+        stream.flush()
+
+        jobs = 0
+        for line in stream:
+            job = json.loads(line)
+            os.environ["CCORRECT_LAUNCH_TIME"] = str(job["launch_time"])
+            error = _run_job(job["test_script"], job["cwd"])
+            jobs += 1
+
+            recycle = (max_jobs > 0 and jobs >= max_jobs) or (max_memory > 0 and _memory_usage() > max_memory)
+            stream.write(json.dumps({"error": error, "recycle": recycle}) + "\n")
+            stream.flush()
+
+            if recycle:
+                break
@@ -10,5 +10,7 @@ setup(
     license="GPL-3.0",
     packages=["ccorrect"],
     include_package_data=True,
-    install_requires=["pycparser>=2.21", "PyYAML>=6.0"]
+    package_data={"ccorrect": ["_preload.c"]},
+    install_requires=["pycparser>=2.21", "PyYAML>=6.0"],
+    extras_require={"binary": ["msgpack>=1.0"], "numpy": ["numpy"]}
 )
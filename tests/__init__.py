@@ -1,3 +1,4 @@
 from tests.gdb_values import *
 from tests.parser import *
 from tests.example_exercise import *
+from tests.runners import *
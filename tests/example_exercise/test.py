@@ -96,6 +96,13 @@ class TestCCorrectTestCase(unittest.TestCase):
 
         self.assertDictEqual(results["summary"], {"total": 7, "succeeded": 2, "failed": 5, "score": 37.5})
 
+        for problem in results["problems"].values():
+            for test in problem["tests"]:
+                resources = test.pop("resources")
+                self.assertSetEqual(set(resources.keys()), {"wall_time", "cpu_user", "cpu_system", "peak_rss"})
+                self.assertGreater(resources["wall_time"], 0)
+                self.assertGreater(resources["peak_rss"], 0)
+
         expected = {
             "success": True,
             "score": 100.0,
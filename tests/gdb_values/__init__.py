@@ -1,5 +1,5 @@
-from tests.gdb_values.test_values import TestValues
-from tests.gdb_values.test_functions import TestFunctions, TestFunctionTimeout
+from tests.gdb_values.test_values import TestValues, TestValuesArena
+from tests.gdb_values.test_functions import TestFunctions, TestFunctionTimeout, TestFunctionCallTimeout, TestFunctionSignalTimeout, TestFunctionCheckpoint, TestFunctionPreload, TestFunctionReturnCapture, TestAllocationTracker, TestCrashReport, TestHeapSnapshot, TestIndexCache
 import subprocess
 import os
 
@@ -92,6 +92,30 @@ char *repeat_char(char c, int count) {
     return str;
 }
 
+char *repeat_char_twice(char c, int count) {
+    return repeat_char(c, count * 2);
+}
+
+double half(double x) {
+    return x / 2;
+}
+
+long double half_long(long double x) {
+    return x / 2;
+}
+
+int halves(int x) {
+    return (int) (half(x) + half_long(x));
+}
+
+static int scale(int x) {
+    return x * 2;
+}
+
+int scale_main(int x) {
+    return scale(x);
+}
+
 void loop(void) {
     while (1);
 }
@@ -121,6 +145,17 @@ int open_file_r(char *path) {
     return open(path, O_RDONLY);
 }
 
+node *make_list(int len) {
+    node *head = NULL;
+    while (len--) {
+        node *n = malloc(sizeof(node));
+        n->value = len;
+        n->next = head;
+        head = n;
+    }
+    return head;
+}
+
 int test_flexible(struct_flexible_array *a) {
     int sum = 0;
     for (int i = 0; i < a->size; i++)
@@ -0,0 +1,8 @@
+/* a second 'scale' function, static like the one of main.c, so that a breakpoint on 'scale' has two locations with different arguments */
+static int scale(int x, int factor) {
+    return x * factor;
+}
+
+int scale_other(int x) {
+    return scale(x, 3);
+}
@@ -1,7 +1,13 @@
 import ccorrect
 import unittest
+import array
+import io
+import tempfile
+import time
+import threading
 import os
 import gdb
+from ccorrect._index import build_index_cache
 
 
 program = os.path.join(os.path.dirname(__file__), "main")
@@ -29,6 +35,14 @@ class TestFunctions(unittest.TestCase):
         ret = str_struct_name_len(debugger.pointer(value))
         self.assertEqual(ret, 11)
 
+    def test_function_lookup_cache(self):
+        repeat_char = debugger.function("repeat_char")
+        self.assertIs(debugger.function("repeat_char")._value, repeat_char._value)
+        self.assertEqual(repeat_char("c", 3).string(), "ccc")
+
+        with self.assertRaises(ValueError):
+            debugger.function("environ")
+
     def test_call_variadic(self):
         printf, fflush = debugger.functions(["printf", "fflush"])
         printf("Hello stdout %d!\n", debugger.value("char", 42))
@@ -91,6 +105,39 @@ class TestFunctions(unittest.TestCase):
         self.assertTrue(debugger.malloced(ret))
         self.assertEqual(debugger.allocated_size(), 12)
 
+    def test_watch_history(self):
+        repeat_char, wrap_free = debugger.functions(["repeat_char", "wrap_free"])
+
+        with debugger.watch("malloc", history=0):
+            for i in range(5):
+                repeat_char("c", i)
+        self.assertEqual(debugger.stats["malloc"].called, 5)
+        self.assertEqual(len(debugger.stats["malloc"].args), 0)
+        self.assertEqual(len(debugger.stats["malloc"].returns), 0)
+        self.assertEqual(debugger.allocated_size(), sum(i + 1 for i in range(5)))
+
+        debugger.stats.clear()
+        with debugger.watch("malloc", history=2, compact=True):
+            for i in range(5):
+                ret = repeat_char("c", i)
+        self.assertEqual(debugger.stats["malloc"].called, 5)
+        self.assertEqual(list(debugger.stats["malloc"].args), [[4], [5]])
+        self.assertEqual(len(debugger.stats["malloc"].returns), 2)
+        self.assertIsInstance(debugger.stats["malloc"].returns[-1], int)
+        self.assertEqual(debugger.stats["malloc"].returns[-1], int(ret))
+        # the arguments and the return values are kept in arrays
+        self.assertIsInstance(debugger.stats["malloc"].args.columns[0].values, array.array)
+        self.assertEqual(list(debugger.stats["malloc"].args.columns[0]), [4, 5])
+        self.assertEqual(debugger.stats["malloc"].args.columns[0][-2:], [4, 5])
+        self.assertIsInstance(debugger.stats["malloc"].returns.values, array.array)
+
+        debugger.stats.clear()
+        with debugger.watch(["malloc", "free"], compact=True):
+            ptr = repeat_char("c", 3)
+            wrap_free(ptr)
+        self.assertEqual(list(debugger.stats["malloc"].args), [[4]])
+        self.assertEqual(list(debugger.stats["free"].args), [[int(ptr)]])
+
     def test_fail(self):
         repeat_char, str_struct_name_len = debugger.functions(["repeat_char", "str_struct_name_len"])
 
@@ -195,6 +242,59 @@ class TestFunctions(unittest.TestCase):
         test_free()
         self.assertEqual(len(debugger.stats.keys()), 0)
 
+    def test_watch_locations(self):
+        scale_main, scale_other = debugger.functions(["scale_main", "scale_other"])
+
+        # the static functions 'scale' of main.c and scale.c are two locations of the same breakpoint with different arguments
+        with debugger.watch("scale"):
+            for i in range(3):
+                self.assertEqual(scale_main(i), i * 2)
+                self.assertEqual(scale_other(i), i * 3)
+
+        self.assertEqual(debugger.stats["scale"].called, 6)
+        self.assertEqual([[int(arg) for arg in args] for args in debugger.stats["scale"].args], [[0], [0, 3], [1], [1, 3], [2], [2, 3]])
+        self.assertEqual([int(ret) for ret in debugger.stats["scale"].returns], [0, 0, 2, 3, 4, 6])
+
+    def test_fail_locations(self):
+        scale_main, scale_other = debugger.functions(["scale_main", "scale_other"])
+
+        with debugger.watch("scale"), debugger.fail("scale", retval=debugger.value("int", -1), when={1, 2}):
+            results = [scale_main(1), scale_other(1), scale_main(2), scale_other(2)]
+
+        self.assertEqual(results, [2, -1, -1, 6])
+        self.assertEqual([[int(arg) for arg in args] for args in debugger.stats["scale"].args], [[1], [1, 3], [2], [2, 3]])
+        self.assertEqual([int(ret) for ret in debugger.stats["scale"].returns], [2, -1, -1, 6])
+
+    def test_free_allocated_value(self):
+        test_free, wrap_free = debugger.functions(["test_free", "wrap_free"])
+
+        # the free breakpoint is hit by the values that are not allocated by the Debugger
+        test_free()
+        values = [debugger.value("int", [i, i + 1]) for i in range(3)]
+        for _ in range(3):
+            test_free()
+        self.assertEqual(debugger._allocated_addresses, {int(value.address) for value in values})
+
+        wrap_free(values[1].address)
+        # the value freed by the inferior is not freed again by free_allocated_values
+        self.assertEqual(debugger._allocated_addresses, {int(values[0].address), int(values[2].address)})
+        debugger.free_allocated_values()
+        self.assertEqual(debugger._allocated_addresses, set())
+
+    def test_fail_free(self):
+        repeat_char, wrap_free = debugger.functions(["repeat_char", "wrap_free"])
+
+        # gdb.Value arguments are not allocated by the Debugger
+        ret = repeat_char(gdb.Value(ord("c")).cast(gdb.lookup_type("char")), gdb.Value(3))
+        self.assertEqual(debugger._allocated_addresses, set())
+
+        # the free breakpoint still fails free when no value allocated by the Debugger can be freed
+        with debugger.fail("free"):
+            wrap_free(ret)
+        self.assertEqual(ret.string(), "ccc")
+        # not a double free
+        wrap_free(ret)
+
     def test_malloced_free(self):
         self.assertEqual(debugger.allocated_size(), 0)
 
@@ -299,6 +399,81 @@ class TestFunctions(unittest.TestCase):
             self.assertEqual(debugger.stats["return_arg"].args[0][1], 2)
 
 
+class TestAllocationTracker(unittest.TestCase):
+    def test_tracker(self):
+        tracker = ccorrect._debugger.AllocationTracker()
+        tracker.add(100, 10)
+        tracker.add(50, 20)
+        tracker.add(200, 0)
+        self.assertEqual(tracker.total_size, 30)
+        self.assertEqual(list(tracker), [(50, 20), (100, 10), (200, 0)])
+
+        self.assertEqual(tracker.find(50), (50, 20))
+        self.assertEqual(tracker.find(69), (50, 20))
+        self.assertIsNone(tracker.find(70))
+        self.assertEqual(tracker.find(109), (100, 10))
+        self.assertIsNone(tracker.find(200))
+        self.assertIsNone(tracker.find(10))
+
+        self.assertTrue(tracker.remove(50))
+        self.assertFalse(tracker.remove(50))
+        self.assertIsNone(tracker.find(60))
+        self.assertEqual(tracker.total_size, 10)
+
+        tracker.add(100, 5)
+        self.assertEqual(tracker.total_size, 5)
+        self.assertEqual(len(tracker), 2)
+
+
+class TestCrashReport(unittest.TestCase):
+    def test_size_budget(self):
+        f = io.StringIO()
+        report = ccorrect._debugger.CrashReport(f, 10, 60)
+        self.assertTrue(report.write("abcdef"))
+        self.assertFalse(report.write("ghijkl"))
+        self.assertFalse(report.write("mnopqr"))
+        self.assertTrue(report.truncated)
+        self.assertEqual(f.getvalue(), "abcdefghij\n--- crash report truncated ---\n")
+
+    def test_time_budget(self):
+        f = io.StringIO()
+        report = ccorrect._debugger.CrashReport(f, 1000, 0)
+        self.assertFalse(report.has_budget())
+        self.assertFalse(report.write("abc"))
+        self.assertEqual(f.getvalue(), "\n--- crash report truncated ---\n")
+
+
+class TestHeapSnapshot(unittest.TestCase):
+    def test_snapshot(self):
+        memory = bytes(range(256)) * 64
+        reads = []
+
+        def read_memory(address, length):
+            reads.append((address, length))
+            if address >= 0x3000:
+                return None
+            return memory[address - 0x1000:address - 0x1000 + length]
+
+        regions = [(0x1000, 16), (0x1020, 8), (0x1800, 4), (0x3000, 8)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "heap_snapshot.bin")
+            with open(path, "wb") as f:
+                ccorrect._heap.write_heap_snapshot(f, regions, read_memory, 26)
+            snapshot = ccorrect._heap.load_heap_snapshot(path)
+
+        # the 3 first regions are read together
+        self.assertEqual(reads, [(0x1000, 0x802)])
+        self.assertEqual([(block.address, block.size, len(block.data)) for block in snapshot.blocks],
+                         [(0x1000, 16, 16), (0x1020, 8, 8), (0x1800, 4, 2), (0x3000, 8, 0)])
+        self.assertEqual(snapshot.find(0x1024).address, 0x1020)
+        self.assertIsNone(snapshot.find(0x1010))
+        self.assertEqual(snapshot.read(0x1004, 4), bytes([4, 5, 6, 7]))
+        self.assertEqual(snapshot.unpack("=BB", 0x1020), (32, 33))
+        self.assertEqual(snapshot.view(0x1000, "B", 16).tolist(), list(range(16)))
+        with self.assertRaises(ValueError):
+            snapshot.read(0x1800, 4)
+
+
 class TestFunctionTimeout(unittest.TestCase):
     def setUp(self):
         debugger.start(timeout=1)
@@ -316,3 +491,305 @@ class TestFunctionTimeout(unittest.TestCase):
 
         with self.assertRaises(gdb.error):
             loop()
+        self.assertTrue(debugger.timed_out)
+
+
+class TestFunctionCallTimeout(unittest.TestCase):
+    def tearDown(self):
+        debugger.free_allocated_values()
+        debugger.stats.clear()
+        debugger.finish()
+
+    def test_call_timeout(self):
+        debugger.start()
+        repeat_char, loop = debugger.functions(["repeat_char", "loop"])
+
+        ret = repeat_char("c", 10, timeout=1)
+        self.assertEqual(ret.string(), "c" * 10)
+        self.assertFalse(debugger.timed_out)
+
+        start = time.monotonic()
+        with self.assertRaises(gdb.error):
+            loop(timeout=0.5)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(debugger.timed_out)
+
+    def test_cpu_timeout(self):
+        debugger.start(cpu_timeout=0.5)
+        loop = debugger.function("loop")
+
+        with self.assertRaises(gdb.error):
+            loop()
+        self.assertTrue(debugger.timed_out)
+
+    def test_finish_kills_timed_out(self):
+        pid = debugger.start()
+        loop = debugger.function("loop")
+
+        with self.assertRaises(gdb.error):
+            loop(timeout=0.5)
+        # the inferior still executing loop() must not be resumed by finish
+        start = time.monotonic()
+        debugger.finish()
+        self.assertLess(time.monotonic() - start, 5)
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+        # finished by tearDown
+        debugger.start()
+
+    def test_watchdog_thread_stops(self):
+        threads = threading.active_count()
+        for _ in range(3):
+            debugger.start(timeout=60)
+            self.assertEqual(threading.active_count(), threads + 1)
+            debugger.finish()
+            # the watchdog thread of a finished Debugger does not keep running
+            self.assertEqual(threading.active_count(), threads)
+
+        # finished by tearDown
+        debugger.start()
+
+
+class TestFunctionSignalTimeout(unittest.TestCase):
+    """Timeouts enforced with signals, as on GDB versions that don't let the watchdog thread run while the inferior executes."""
+
+    def setUp(self):
+        self.watchdog_supported = ccorrect._debugger._watchdog_supported
+        ccorrect._debugger._watchdog_supported = False
+
+    def tearDown(self):
+        debugger.free_allocated_values()
+        debugger.stats.clear()
+        debugger.finish()
+        ccorrect._debugger._watchdog_supported = self.watchdog_supported
+
+    def test_timeout(self):
+        debugger.start(timeout=1)
+        repeat_char, loop = debugger.functions(["repeat_char", "loop"])
+
+        self.assertEqual(repeat_char("c", 10).string(), "c" * 10)
+        with self.assertRaises(gdb.error):
+            loop()
+        self.assertTrue(debugger.timed_out)
+
+    def test_call_timeout(self):
+        debugger.start(timeout=60)
+        repeat_char, loop = debugger.functions(["repeat_char", "loop"])
+
+        self.assertEqual(repeat_char("c", 10, timeout=1).string(), "c" * 10)
+        self.assertFalse(debugger.timed_out)
+
+        start = time.monotonic()
+        with self.assertRaises(gdb.error):
+            loop(timeout=0.5)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(debugger.timed_out)
+        # the alarm of the test is restored after the call
+        self.assertGreater(int(gdb.parse_and_eval("(unsigned int) alarm(0)")), 50)
+
+    def test_cpu_timeout(self):
+        debugger.start(cpu_timeout=0.5)
+        loop = debugger.function("loop")
+
+        with self.assertRaises(gdb.error):
+            loop()
+        self.assertTrue(debugger.timed_out)
+
+
+class TestFunctionCheckpoint(unittest.TestCase):
+    def test_checkpoint_isolation(self):
+        checkpoint_debugger = ccorrect.Debugger(program, checkpoint=True)
+
+        pid = checkpoint_debugger.start()
+        setenv = checkpoint_debugger.function("setenv")
+        self.assertEqual(setenv("CCORRECT_CHECKPOINT", "1", 1), 0)
+        checkpoint_debugger.finish()
+
+        new_pid = checkpoint_debugger.start()
+        getenv, repeat_char = checkpoint_debugger.functions(["getenv", "repeat_char"])
+        self.assertNotEqual(pid, new_pid)
+        self.assertEqual(int(getenv("CCORRECT_CHECKPOINT")), 0)
+        self.assertEqual(repeat_char("c", 10).string(), "c" * 10)
+        checkpoint_debugger.finish()
+
+        ccorrect._debugger.close_checkpoints()
+
+    def test_checkpoint_asan_detect_leaks(self):
+        with self.assertRaises(ValueError):
+            ccorrect.Debugger(program, asan_detect_leaks=True, checkpoint=True)
+
+
+class TestFunctionReturnCapture(unittest.TestCase):
+    def setUp(self):
+        self.debugger = ccorrect.Debugger(program, return_capture="ret")
+        self.debugger.start()
+
+    def tearDown(self):
+        self.debugger.free_allocated_values()
+        self.debugger.stats.clear()
+        self.debugger.finish()
+
+    def test_watch(self):
+        repeat_char_twice, test_return_arg = self.debugger.functions(["repeat_char_twice", "test_return_arg"])
+
+        with self.debugger.watch(["repeat_char", "return_arg", "malloc"]):
+            ret = repeat_char_twice("c", 3)
+            self.assertEqual(ret.string(), "c" * 6)
+            self.assertEqual(self.debugger.stats["repeat_char"].called, 1)
+            self.assertEqual(self.debugger.stats["repeat_char"].returns[0], ret)
+            self.assertEqual(self.debugger.stats["malloc"].returns[0], ret)
+            self.assertTrue(self.debugger.malloced(ret))
+
+            ret = repeat_char_twice("d", 1)
+            self.assertEqual(self.debugger.stats["repeat_char"].called, 2)
+            self.assertEqual(self.debugger.stats["repeat_char"].returns[1], ret)
+
+            self.assertEqual(test_return_arg(2), 4)
+            self.assertEqual(self.debugger.stats["return_arg"].called, 1)
+            self.assertEqual(self.debugger.stats["return_arg"].returns, [None])
+
+    def test_watch_float(self):
+        halves = self.debugger.function("halves")
+
+        with self.debugger.watch(["half", "half_long"]):
+            self.assertEqual(halves(5), 5)
+        self.assertEqual(float(self.debugger.stats["half"].returns[0]), 2.5)
+        # a long double is not returned in xmm0, its return value is captured by a FinishBreakpoint instead
+        self.assertEqual(float(self.debugger.stats["half_long"].returns[0]), 2.5)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            ccorrect.Debugger(program, return_capture="invalid")
+
+
+preload_debugger = ccorrect.Debugger(program, watch_backend="preload")
+
+
+class TestFunctionPreload(unittest.TestCase):
+    def setUp(self):
+        preload_debugger.start()
+
+    def tearDown(self):
+        preload_debugger.free_allocated_values()
+        preload_debugger.stats.clear()
+        preload_debugger.finish()
+
+    def test_watch(self):
+        repeat_char, wrap_free = preload_debugger.functions(["repeat_char", "wrap_free"])
+
+        repeat_char("c", 10)
+        self.assertEqual(len(preload_debugger.stats.keys()), 0)
+
+        with preload_debugger.watch(["malloc", "free"]):
+            ret = repeat_char("c", 5)
+            self.assertEqual(preload_debugger.stats["malloc"].called, 1)
+            self.assertEqual(preload_debugger.stats["malloc"].args[0][0], 6)
+            self.assertEqual(preload_debugger.stats["malloc"].returns[0], ret)
+            self.assertTrue(preload_debugger.malloced(ret))
+            self.assertEqual(preload_debugger.allocated_size(), 6)
+
+            wrap_free(ret)
+            self.assertEqual(preload_debugger.stats["free"].called, 1)
+            self.assertEqual(preload_debugger.stats["free"].args[0][0], ret)
+            self.assertFalse(preload_debugger.malloced(ret))
+            self.assertEqual(preload_debugger.allocated_size(), 0)
+
+        repeat_char("c", 2)
+        self.assertEqual(preload_debugger.stats["malloc"].called, 1)
+
+    def test_watch_values_not_counted(self):
+        with preload_debugger.watch("malloc"):
+            preload_debugger.value("int", [1, 2, 3])
+            preload_debugger.string("Hello")
+        self.assertEqual(preload_debugger.stats["malloc"].called, 0)
+
+    def test_watch_after_error(self):
+        repeat_char = preload_debugger.function("repeat_char")
+
+        with preload_debugger.watch("malloc"):
+            with self.assertRaises(ValueError):
+                preload_debugger.allocate(4, b"\x01\x02")
+            # the watch is resumed even if allocating the value failed
+            repeat_char("c", 5)
+        self.assertEqual(preload_debugger.stats["malloc"].called, 1)
+        self.assertFalse(gdb.convenience_variable("__CCorrect_disable_watch_fail"))
+
+    def test_fail(self):
+        repeat_char = preload_debugger.function("repeat_char")
+
+        NULL = preload_debugger.pointer("void", 0)
+        with preload_debugger.watch("malloc"), preload_debugger.fail("malloc", NULL):
+            ret = repeat_char("c", 10)
+        self.assertEqual(ret, 0)
+        self.assertEqual(preload_debugger.stats["malloc"].called, 1)
+        self.assertEqual(preload_debugger.stats["malloc"].returns[0], 0)
+
+    def test_fail_when(self):
+        repeat_char = preload_debugger.function("repeat_char")
+        errno = gdb.parse_and_eval("&errno")
+
+        size_count = 0
+        fail_when = [0, 1, 4, 7, 4, 2]
+        with preload_debugger.watch("malloc"), preload_debugger.fail("malloc", retval=0, errno=12, when=fail_when):
+            for i in range(10):
+                errno.dereference().assign(0)
+                ret = repeat_char("c", i)
+                if i in fail_when:
+                    self.assertEqual(ret, 0)
+                    self.assertEqual(errno.dereference(), 12)
+                else:
+                    self.assertEqual(ret.string(), "c" * i)
+                    self.assertEqual(errno.dereference(), 0)
+                    size_count += i + 1
+                    self.assertEqual(preload_debugger.allocated_size(), size_count)
+
+        self.assertEqual(preload_debugger.stats["malloc"].called, 10)
+        self.assertTrue(all(args[0] == i + 1 for i, args in enumerate(preload_debugger.stats["malloc"].args)))
+
+        for i in range(3):
+            self.assertEqual(repeat_char("c", i).string(), "c" * i)
+
+
+class TestIndexCache(unittest.TestCase):
+    def setUp(self):
+        self.old_environ = {name: os.environ.get(name) for name in ("CCORRECT_DEBUGINFOD", "CCORRECT_INDEX_CACHE")}
+
+    def tearDown(self):
+        for name, value in self.old_environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def test_build_index_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, "cache")
+            os.environ["CCORRECT_DEBUGINFOD"] = "0"
+            build_index_cache(program, cache_dir)
+            self.assertGreater(len(os.listdir(cache_dir)), 0)
+
+    def test_environment(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.environ["CCORRECT_DEBUGINFOD"] = "0"
+            os.environ["CCORRECT_INDEX_CACHE"] = cache_dir
+            env_debugger = ccorrect.Debugger(program)
+            self.assertFalse(env_debugger._debuginfod)
+            self.assertEqual(env_debugger._index_cache, cache_dir)
+
+            env_debugger.start()
+            try:
+                self.assertEqual(gdb.parameter("index-cache directory"), cache_dir)
+            finally:
+                env_debugger.finish()
+
+            # the arguments of the Debugger take precedence over the environment
+            args_debugger = ccorrect.Debugger(program, debuginfod=True, index_cache=os.path.join(cache_dir, "other"))
+            self.assertTrue(args_debugger._debuginfod)
+            self.assertEqual(args_debugger._index_cache, os.path.join(cache_dir, "other"))
+
+            del os.environ["CCORRECT_DEBUGINFOD"]
+            del os.environ["CCORRECT_INDEX_CACHE"]
+            default_debugger = ccorrect.Debugger(program)
+            self.assertTrue(default_debugger._debuginfod)
+            self.assertIsNone(default_debugger._index_cache)
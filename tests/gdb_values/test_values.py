@@ -1,5 +1,6 @@
 import ccorrect
 import unittest
+import array
 import os
 import gdb
 
@@ -317,3 +318,164 @@ class TestValues(unittest.TestCase):
         self.assertEqual(str(ptr_ptr.type), "node **")
         self.assertEqual(str(ptr_ptr.dereference().type), "node *")
         self.assertEqual(ptr_ptr.dereference().dereference()["value"], 4)
+
+    def test_packing_plan_cache(self):
+        node_type = gdb.lookup_type("node")
+        plan = debugger._lookups.plan(node_type, {"value": 1, "next": {"value": 2, "next": None}})
+        self.assertIsNotNone(plan)
+        self.assertIs(debugger._lookups.plan(node_type, {"value": 3, "next": {"value": 4, "next": None}}), plan)
+        self.assertIsNot(debugger._lookups.plan(node_type, {"value": 3, "next": None}), plan)
+
+        for i in range(10):
+            val = debugger.value("node", {"value": i, "next": {"value": i * 2, "next": None}})
+            self.assertEqual(val["value"], i)
+            self.assertEqual(val["next"].dereference()["value"], i * 2)
+            self.assertEqual(int(val["next"].dereference()["next"]), 0)
+
+        with self.assertRaises(OverflowError):
+            debugger.value("unsigned char", 256)
+
+        # built with a tree of ValueNode
+        self.assertIsNone(debugger._lookups.plan(gdb.lookup_type("test_union"), {"t": {"c": 1, "i": 2}, "l": 421}))
+        template = None
+        for i in range(ccorrect._values.PLAN_MAX_DEPTH + 1):
+            template = {"value": i, "next": template}
+        self.assertIsNone(debugger._lookups.plan(node_type, template))
+
+        # the errors of the invalid templates are not hidden by the plans
+        with self.assertRaises(ValueError):
+            debugger._lookups.plan(gdb.lookup_type("int"), 0.5)
+        with self.assertRaises(KeyError):
+            debugger._lookups.plan(node_type, {"value": 1})
+
+    def test_buffer(self):
+        val = debugger.value("int", array.array("i", range(10000)))
+        self.assertEqual(str(val.type), "int [10000]")
+        self.assertEqual(val[0], 0)
+        self.assertEqual(val[9999], 9999)
+
+        val = debugger.value("char", b"Hello\0")
+        self.assertEqual(val.string(), "Hello")
+
+        ptr = debugger.pointer("double", array.array("d", [0.5, 1.5]))
+        self.assertEqual(str(ptr.type), "double *")
+        self.assertEqual(ptr[1], 1.5)
+
+        val = debugger.value("struct_flexible_array", {"size": 3, "array": array.array("i", [4, 5, 6])})
+        self.assertEqual([int(val["array"][i]) for i in range(3)], [4, 5, 6])
+
+        ptr = debugger.allocate(4, b"\x01\x02\x03\x04")
+        self.assertEqual(gdb.selected_inferior().read_memory(ptr, 4).tobytes(), b"\x01\x02\x03\x04")
+
+        with self.assertRaises(ValueError):
+            debugger.value("int", array.array("d", [1.0]))
+        with self.assertRaises(ValueError):
+            debugger.value("long", array.array("i", [1]))
+        with self.assertRaises(ValueError):
+            debugger.allocate(8, b"\x01")
+
+    def test_read_array(self):
+        val = debugger.value("int", list(range(100)))
+        elements = debugger.read_array(val)
+        self.assertEqual(elements, array.array("i", range(100)))
+        self.assertEqual(debugger.read_array(val.address.cast(gdb.lookup_type("int").pointer()), 3), array.array("i", [0, 1, 2]))
+        self.assertEqual(debugger.read_array(debugger.value("double", [0.5, 1.5])).tolist(), [0.5, 1.5])
+
+        val = debugger.value("test_struct", [{"c": "a", "i": 1}, {"c": "b", "i": 2}])
+        self.assertEqual(debugger.read_array(val), [{"c": ord("a"), "i": 1}, {"c": ord("b"), "i": 2}])
+
+        with self.assertRaises(ValueError):
+            debugger.read_array(debugger.pointer("int", 0))
+        with self.assertRaises(ValueError):
+            debugger.read_array(debugger.value("int", 1))
+
+    def test_to_python(self):
+        val = debugger.value("node_array2d", {"value": 4, "next": [[1, 2], [3, 4], [5, 6], [7, 8]]})
+        self.assertEqual(debugger.to_python(val), {"value": 4, "next": [[1, 2], [3, 4], [5, 6], [7, 8]]})
+
+        val = debugger.value("node", {"value": 4, "next": {"value": 5, "next": None}})
+        python_val = debugger.to_python(val)
+        self.assertEqual(python_val["value"], 4)
+        self.assertEqual(python_val["next"], int(val["next"]))
+
+        self.assertEqual(debugger.to_python(debugger.value("float", 0.5)), 0.5)
+        self.assertEqual(debugger.to_python(val["value"] + 1), 5)
+
+    def test_read_linked(self):
+        # built by the inferior, the nodes are not allocated by the debugger
+        list_ptr = debugger.function("make_list")(100000)
+
+        nodes = debugger.read_linked(list_ptr)
+        self.assertEqual([node["value"] for node in nodes], list(range(100000)))
+        self.assertEqual(nodes[-1]["next"], 0)
+        self.assertEqual(debugger.read_linked(list_ptr.dereference(), "next")[1]["value"], 1)
+        self.assertEqual(debugger.read_linked(debugger.pointer("node", 0)), [])
+
+        with self.assertRaises(ValueError):
+            debugger.read_linked(list_ptr, max_nodes=99999)
+        with self.assertRaises(ValueError):
+            debugger.read_linked(list_ptr, next_field="prev")
+
+        # the last node points to the second one
+        gdb.parse_and_eval(f"((node *) {nodes[-2]['next']})->next = ((node *) {int(list_ptr)})->next")
+        with self.assertRaises(ValueError):
+            debugger.read_linked(list_ptr)
+
+    def test_read_tree(self):
+        list_ptr = debugger.pointer(debugger.value("node", {"value": 1, "next": {"value": 2, "next": None}}))
+        tree = debugger.read_tree(list_ptr, child_fields=["next"])
+        self.assertEqual(tree, {"value": 1, "next": {"value": 2, "next": None}})
+        self.assertIsNone(debugger.read_tree(debugger.pointer("node", 0), child_fields=["next"]))
+
+        list_ptr["next"]["next"].assign(list_ptr)
+        with self.assertRaises(ValueError):
+            debugger.read_tree(list_ptr, child_fields=["next"])
+
+
+arena_debugger = ccorrect.Debugger(program, arena_size=4096)
+
+
+class TestValuesArena(unittest.TestCase):
+    def setUp(self):
+        arena_debugger.start()
+
+    def tearDown(self):
+        arena_debugger.free_allocated_values()
+        arena_debugger.finish()
+
+    def test_linked_list(self):
+        template = None
+        for i in reversed(range(1000)):
+            template = {"value": i, "next": template}
+        val = arena_debugger.value("node", template)
+
+        node = val
+        for i in range(1000):
+            self.assertEqual(node["value"], i)
+            if i < 999:
+                node = node["next"].dereference()
+        self.assertEqual(int(node["next"]), 0)
+        # 1000 nodes of 16 bytes don't fit in a single arena
+        self.assertEqual(len(arena_debugger._allocated_addresses), 4)
+
+    def test_long_linked_list(self):
+        # much deeper than the recursion limit
+        template = None
+        for i in reversed(range(10000)):
+            template = {"value": i, "next": template}
+        val = arena_debugger.value("node", template)
+
+        nodes = arena_debugger.read_linked(arena_debugger.pointer(val))
+        self.assertEqual([node["value"] for node in nodes], list(range(10000)))
+        self.assertEqual(nodes[-1]["next"], 0)
+
+    def test_values(self):
+        val = arena_debugger.value("int", [0, 1, 2, 3])
+        self.assertEqual([int(val[i]) for i in range(4)], [0, 1, 2, 3])
+        self.assertEqual(arena_debugger.string("Hello").string(), "Hello")
+        self.assertEqual(arena_debugger.value("node_ext", {"value": 4, "next": {"value": 5, "next": None}})["next"]["value"], 5)
+        self.assertEqual(len(arena_debugger._allocated_addresses), 1)
+
+        big = arena_debugger.value("char", ["a"] * 5000)
+        self.assertEqual(big[4999], ord("a"))
+        self.assertEqual(len(arena_debugger._allocated_addresses), 2)
@@ -0,0 +1,2 @@
+from tests.runners.test_run import TestRunMany, TestRunSharded, TestWorkerPool, TestRunAsync
+from tests.runners.test_results import TestSharding, TestJournal, TestResultsFormats
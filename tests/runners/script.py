@@ -0,0 +1,50 @@
+import sys
+import os
+import json
+import signal
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(base_dir, "../../"))
+
+import ccorrect
+
+
+# the 'submission.json' file of the directory where the test script is executed sets how its tests behave
+try:
+    with open("submission.json", "r") as f:
+        submission = json.load(f)
+except FileNotFoundError:
+    submission = {}
+
+
+class TestSubmission(ccorrect.TestCase):
+    debugger = ccorrect.Debugger(os.path.join(base_dir, "../gdb_values/main"))
+
+    @ccorrect.test_metadata(problem="return_arg")
+    def test_1(self):
+        self.check_return_arg(1)
+
+    @ccorrect.test_metadata(problem="return_arg")
+    def test_2(self):
+        self.check_return_arg(2)
+
+    @ccorrect.test_metadata(problem="return_arg")
+    def test_3(self):
+        self.check_return_arg(3)
+
+    @ccorrect.test_metadata(problem="return_arg")
+    def test_4(self):
+        self.check_return_arg(4)
+
+    @ccorrect.test_metadata(problem="message")
+    def test_5(self):
+        if submission.get("kill", False):
+            os.kill(os.getpid(), signal.SIGKILL)
+        self.push_info_msg("x" * submission.get("message_size", 0))
+
+    def check_return_arg(self, i):
+        test_return_arg = self.debugger.function("test_return_arg")
+        self.assertEqual(test_return_arg(i), (i // 2) * (i * 2) + submission.get("offset", 0))
+
+
+ccorrect.run_tests([TestSubmission])
@@ -0,0 +1,218 @@
+import unittest
+import importlib.util
+import tempfile
+import json
+import os
+from ccorrect._results import shard_tests, merge_shards, journal_path, read_journal, recover, load_results, dump_results, results_format, RESULTS_FILENAMES
+from ccorrect._run import recover_results, _load_results
+
+
+def make_record(test_id, problem, success, duration=None):
+    record = {
+        "id": test_id,
+        "problem": problem,
+        "test": {"description": f"testing '{test_id}'", "weight": 1, "success": success, "messages": [], "tags": []}
+    }
+    if duration is not None:
+        record["duration"] = duration
+    return record
+
+
+class TestSharding(unittest.TestCase):
+    def test_shard_tests(self):
+        test_ids = ["a", "b", "c", "d", "e"]
+        durations = {"a": 4, "b": 3, "c": 2, "d": 1}
+
+        shards = shard_tests(test_ids, 2, durations)
+        self.assertEqual(len(shards), 2)
+        self.assertCountEqual([test_id for shard in shards for test_id in shard], test_ids)
+        # 'e' has no known duration and counts as the mean duration (2.5)
+        loads = [sum(durations.get(test_id, 2.5) for test_id in shard) for shard in shards]
+        self.assertLessEqual(abs(loads[0] - loads[1]), 1)
+
+        # every shard computes the same split
+        self.assertEqual(shard_tests(test_ids, 2, durations), shards)
+
+    def test_shard_tests_without_durations(self):
+        shards = shard_tests(["a", "b", "c", "d"], 3)
+        self.assertEqual(sorted(len(shard) for shard in shards), [1, 1, 2])
+
+        shards = shard_tests(["a"], 3)
+        self.assertEqual(sorted(len(shard) for shard in shards), [0, 0, 1])
+
+    def test_merge_shards(self):
+        order = ["t.a", "t.b", "t.c", "t.d"]
+        partials = [
+            {"order": order, "records": [make_record("t.c", "p2", True, 0.5), make_record("t.a", "p1", True, 1.0)]},
+            {"order": order, "records": [make_record("t.d", "p2", False, 0.25), make_record("t.b", "p1", True, 2.0)]}
+        ]
+
+        results, durations = merge_shards(partials)
+        self.assertEqual(durations, {"t.a": 1.0, "t.b": 2.0, "t.c": 0.5, "t.d": 0.25})
+        self.assertEqual(results["summary"], {"total": 4, "succeeded": 3, "failed": 1, "score": 75.0})
+        # the tests are in the order in which run_tests would have executed them
+        self.assertEqual([t["description"] for t in results["problems"]["p1"]["tests"]], ["testing 't.a'", "testing 't.b'"])
+        self.assertEqual([t["description"] for t in results["problems"]["p2"]["tests"]], ["testing 't.c'", "testing 't.d'"])
+        self.assertTrue(results["problems"]["p1"]["success"])
+        self.assertFalse(results["problems"]["p2"]["success"])
+        self.assertEqual(results["problems"]["p2"]["score"], 50.0)
+
+    def test_merge_shards_banned(self):
+        # a shard that stopped before running its tests has complete results of its own
+        banned = {"summary": {"total": 1, "succeeded": 0, "failed": 1, "score": 0}, "problems": {}}
+        partials = [{"order": ["t.a"], "records": [make_record("t.a", "p1", True, 1.0)]}, banned]
+
+        self.assertEqual(merge_shards(partials), (banned, {}))
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.result_filepath = os.path.join(self.tmp_dir.name, "results.json")
+        self.journal_filepath = journal_path(self.result_filepath)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_journal(self, records, cut_line=None):
+        """Writes `records` in the journal like run_tests does, followed by the first half of the `cut_line` record if it is set."""
+        with open(self.journal_filepath, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            if cut_line is not None:
+                line = json.dumps(cut_line)
+                f.write(line[:len(line) // 2])
+
+    def test_journal_path(self):
+        self.assertEqual(self.journal_filepath, os.path.join(self.tmp_dir.name, "results.jsonl"))
+        self.assertEqual(journal_path("results.yml"), "results.jsonl")
+
+    def test_read_journal(self):
+        self.assertIsNone(read_journal(self.journal_filepath))
+
+        # each test is written when it starts and again with its duration when it is finished
+        self.write_journal([
+            make_record("t.a", "p1", False),
+            make_record("t.a", "p1", True, 1.0),
+            make_record("t.b", "p1", False)
+        ], cut_line=make_record("t.b", "p1", True, 2.0))
+
+        records = read_journal(self.journal_filepath)
+        self.assertEqual([record["id"] for record in records], ["t.a", "t.b"])
+        self.assertEqual(records[0]["duration"], 1.0)
+        # the cut line is ignored
+        self.assertNotIn("duration", records[1])
+
+    def test_recover(self):
+        self.assertIsNone(recover(self.journal_filepath))
+
+        self.write_journal([
+            make_record("t.a", "p1", True, 1.0),
+            make_record("t.b", "p2", False, 1.0),
+            make_record("t.c", "p2", True)
+        ])
+
+        results = recover(self.journal_filepath, data=-9)
+        self.assertEqual(results["summary"], {"total": 3, "succeeded": 1, "failed": 2, "score": 33.33, "error": {"reason": "aborted", "data": -9}})
+        self.assertEqual(results["problems"]["p2"]["tests"][1]["tags"], ["interrupted"])
+        self.assertFalse(results["problems"]["p2"]["tests"][1]["success"])
+        self.assertEqual(results["problems"]["p1"]["tests"][0]["tags"], [])
+
+    def test_recover_results(self):
+        self.assertIsNone(recover_results(self.result_filepath, returncode=-9, result_format="json"))
+
+        self.write_journal([make_record("t.a", "p1", True, 1.0), make_record("t.b", "p1", True)], cut_line=make_record("t.b", "p1", True, 1.0))
+
+        results = recover_results(self.result_filepath, returncode=-9, result_format="json")
+        self.assertEqual(results["summary"]["succeeded"], 1)
+        self.assertEqual(results["problems"]["p1"]["tests"][1]["tags"], ["interrupted"])
+        # the recovered results replace the journal
+        self.assertEqual(load_results(self.result_filepath)["summary"], results["summary"])
+        self.assertFalse(os.path.exists(self.journal_filepath))
+
+
+class TestResultsFormats(unittest.TestCase):
+    data = {
+        "summary": {"total": 2, "succeeded": 1, "failed": 1, "score": 33.33},
+        "problems": {
+            "p1": {"success": False, "score": 33.33, "tests": [
+                {"description": "testing 'a'", "weight": 1, "success": True, "stdout": "out\n", "messages": [], "tags": []},
+                {"description": "testing 'b'", "weight": 2, "success": False, "stdout": "", "messages": ["wrong"], "tags": ["sigsegv"]}
+            ]}
+        }
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_format(self, result_format):
+        filepath = os.path.join(self.tmp_dir.name, RESULTS_FILENAMES[result_format])
+        dump_results(self.data, filepath, result_format)
+        self.assertEqual(load_results(filepath), {"version": 1, **self.data})
+
+    def test_yaml(self):
+        self.check_format("yaml")
+
+    def test_json(self):
+        self.check_format("json")
+
+    @unittest.skipUnless(importlib.util.find_spec("msgpack"), "needs the 'msgpack' package")
+    def test_binary(self):
+        self.check_format("binary")
+
+    def test_banned_functions(self):
+        data = {"summary": {"total": 1, "succeeded": 0, "failed": 1, "score": 0, "error": {"reason": "banned_functions", "data": {"system", "fork"}}}}
+        filepath = os.path.join(self.tmp_dir.name, "results")
+        formats = ["yaml", "json", "binary"] if importlib.util.find_spec("msgpack") else ["yaml", "json"]
+        for result_format in formats:
+            dump_results(data, filepath, result_format)
+            found = load_results(filepath)["summary"]["error"]["data"]
+            # the formats without a set type write it as a sorted list
+            self.assertEqual(found, {"system", "fork"} if result_format == "yaml" else ["fork", "system"])
+
+    def test_detection(self):
+        # the format is detected from the content of the file, not from its name
+        filepath = os.path.join(self.tmp_dir.name, "results")
+        for result_format in ["yaml", "json"]:
+            dump_results(self.data, filepath, result_format)
+            self.assertEqual(load_results(filepath)["summary"], self.data["summary"])
+
+        # YAML flow mappings also start with a '{'
+        with open(filepath, "w") as f:
+            f.write("{summary: {total: 0}}")
+        self.assertEqual(load_results(filepath), {"summary": {"total": 0}})
+
+    def test_mixed_formats(self):
+        # results written by successive runs in different formats, the latest is loaded
+        for i, result_format in enumerate(["json", "yaml"]):
+            filepath = os.path.join(self.tmp_dir.name, RESULTS_FILENAMES[result_format])
+            dump_results({**self.data, "summary": {**self.data["summary"], "total": i}}, filepath, result_format)
+            os.utime(filepath, (i + 1, i + 1))
+        self.assertEqual(_load_results(self.tmp_dir.name)["summary"]["total"], 1)
+
+        os.utime(os.path.join(self.tmp_dir.name, RESULTS_FILENAMES["json"]), (3, 3))
+        self.assertEqual(_load_results(self.tmp_dir.name)["summary"]["total"], 0)
+
+        self.assertIsNone(_load_results(os.path.join(self.tmp_dir.name, "missing")))
+
+    def test_results_format(self):
+        self.assertEqual(results_format("json"), "json")
+        with self.assertRaises(ValueError):
+            results_format("xml")
+        with self.assertRaises(ValueError):
+            dump_results(self.data, os.path.join(self.tmp_dir.name, "results"), "xml")
+
+        old = os.environ.get("CCORRECT_RESULT_FORMAT")
+        try:
+            os.environ.pop("CCORRECT_RESULT_FORMAT", None)
+            self.assertEqual(results_format(), "yaml")
+            os.environ["CCORRECT_RESULT_FORMAT"] = "binary"
+            self.assertEqual(results_format(), "binary")
+        finally:
+            if old is None:
+                os.environ.pop("CCORRECT_RESULT_FORMAT", None)
+            else:
+                os.environ["CCORRECT_RESULT_FORMAT"] = old
@@ -0,0 +1,189 @@
+import unittest
+import asyncio
+import tempfile
+import json
+import os
+from ccorrect._run import run_many, run_sharded, run_async, stream_async, _move_heap_snapshots
+from ccorrect._pool import WorkerPool
+
+
+script = os.path.join(os.path.dirname(__file__), "script.py")
+
+
+def make_submission(parent_dir, name, **submission):
+    """Creates the `name` submission directory in `parent_dir` whose 'submission.json' file is `submission` and returns its path."""
+    submission_dir = os.path.join(parent_dir, name)
+    os.mkdir(submission_dir)
+    with open(os.path.join(submission_dir, "submission.json"), "w") as f:
+        json.dump(submission, f)
+    return submission_dir
+
+
+class TestRunMany(unittest.TestCase):
+    def test_run_many(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            submission_dirs = [
+                make_submission(tmp_dir, "alice"),
+                make_submission(tmp_dir, "bob", offset=1),
+                make_submission(tmp_dir, "carol")
+            ]
+            results = run_many(script, submission_dirs, workers=2)
+
+            self.assertEqual(len(results), 3)
+            self.assertEqual(results[0]["summary"], {"total": 5, "succeeded": 5, "failed": 0, "score": 100.0})
+            self.assertEqual(results[1]["summary"], {"total": 5, "succeeded": 1, "failed": 4, "score": 20.0})
+            self.assertEqual(results[2]["summary"], results[0]["summary"])
+            # each submission has its own results file
+            for submission_dir in submission_dirs:
+                self.assertTrue(os.path.exists(os.path.join(submission_dir, "results.yml")))
+
+    def test_run_many_error(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            submission_dirs = [os.path.join(tmp_dir, "missing"), make_submission(tmp_dir, "alice")]
+            results = run_many(script, submission_dirs)
+
+            # the error of a submission doesn't prevent the others from being graded
+            self.assertIsInstance(results[0], OSError)
+            self.assertEqual(results[1]["summary"]["score"], 100.0)
+
+
+class TestRunSharded(unittest.TestCase):
+    def tearDown(self):
+        try:
+            os.remove(os.path.join(os.path.dirname(script), "results.yml"))
+        except FileNotFoundError:
+            pass
+
+    def test_run_sharded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            durations_filepath = os.path.join(tmp_dir, "durations.json")
+            results = run_sharded(script, shards=2, durations_filepath=durations_filepath)
+
+            self.assertEqual(results["summary"], {"total": 5, "succeeded": 5, "failed": 0, "score": 100.0})
+            # the merged results are in the order of a run that is not sharded
+            self.assertEqual([t["description"] for t in results["problems"]["return_arg"]["tests"]], [f"testing 'test_{i}'" for i in range(1, 5)])
+            self.assertTrue(os.path.exists(os.path.join(os.path.dirname(script), "results.yml")))
+
+            # the durations are saved to balance the next runs
+            with open(durations_filepath, "r") as f:
+                durations = json.load(f)
+            self.assertEqual(len(durations), 5)
+            self.assertTrue(all(duration > 0 for duration in durations.values()))
+
+            self.assertEqual(run_sharded(script, shards=3, durations_filepath=durations_filepath)["summary"], results["summary"])
+
+    def test_move_heap_snapshots(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shard_dir = os.path.join(tmp_dir, "0")
+            os.mkdir(shard_dir)
+            heap_snapshot_path = os.path.join(shard_dir, "heap_snapshot.42.bin")
+            with open(heap_snapshot_path, "wb") as f:
+                f.write(b"CCHS")
+            partial = {"order": ["t.a", "t.b"], "records": [
+                {"id": "t.a", "problem": "p1", "test": {"heap_snapshot": heap_snapshot_path}},
+                {"id": "t.b", "problem": "p1", "test": {}}
+            ]}
+
+            # the snapshot must outlive the temporary directory of its shard
+            _move_heap_snapshots(partial, tmp_dir)
+            self.assertEqual(partial["records"][0]["test"]["heap_snapshot"], os.path.join(tmp_dir, "heap_snapshot.42.bin"))
+            self.assertFalse(os.path.exists(heap_snapshot_path))
+            with open(partial["records"][0]["test"]["heap_snapshot"], "rb") as f:
+                self.assertEqual(f.read(), b"CCHS")
+            self.assertEqual(partial["records"][1]["test"], {})
+
+            # the partial results of a shard stopped by the banned functions have no records
+            _move_heap_snapshots({"summary": {}, "problems": {}}, tmp_dir)
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.submission_dir = make_submission(self.tmp_dir.name, "alice")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_job(self, pool):
+        """Runs the test script in the pool and returns the pid of the idle worker afterwards."""
+        results = pool.run(script, cwd=self.submission_dir)
+        self.assertEqual(results["summary"]["score"], 100.0)
+        return pool._idle.queue[0].process.pid
+
+    def test_run(self):
+        with WorkerPool(workers=2) as pool:
+            bob_dir = make_submission(self.tmp_dir.name, "bob", offset=1)
+            self.assertEqual(pool.run(script, cwd=self.submission_dir)["summary"]["score"], 100.0)
+            self.assertEqual(pool.run(script, cwd=bob_dir)["summary"]["score"], 20.0)
+
+    def test_max_jobs(self):
+        with WorkerPool(workers=1, max_jobs=2) as pool:
+            pids = [self.run_job(pool) for _ in range(4)]
+        # the worker is replaced after every 2 jobs
+        self.assertNotEqual(pids[0], pids[1])
+        self.assertEqual(pids[1], pids[2])
+        self.assertNotEqual(pids[2], pids[3])
+
+    def test_max_memory(self):
+        with WorkerPool(workers=1, max_memory=1) as pool:
+            pids = [self.run_job(pool) for _ in range(3)]
+        # a GDB process always uses more than 1 byte so the worker is replaced after each job
+        self.assertEqual(len(set(pids)), 3)
+
+    def test_respawn_failure(self):
+        with WorkerPool(workers=1, max_jobs=1) as pool:
+            # the replacement of the worker after the job cannot start in time
+            pool._listener.settimeout(0.001)
+            self.assertEqual(pool.run(script, cwd=self.submission_dir)["summary"]["score"], 100.0)
+            self.assertIsNone(pool._idle.queue[0])
+
+            # the next job tries to start the worker again instead of waiting for it forever
+            with self.assertRaises(RuntimeError):
+                pool.run(script, cwd=self.submission_dir)
+
+            pool._listener.settimeout(60)
+            self.assertEqual(pool.run(script, cwd=self.submission_dir)["summary"]["score"], 100.0)
+
+
+class TestRunAsync(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def stream(self, submission_dir):
+        async def collect():
+            return [record async for record in stream_async(script, cwd=submission_dir)]
+        return asyncio.run(collect())
+
+    def test_stream_async(self):
+        records = self.stream(make_submission(self.tmp_dir.name, "alice", offset=1))
+
+        self.assertEqual([record["problem"] for record in records], ["return_arg"] * 4 + ["message"])
+        self.assertEqual([record["test"]["success"] for record in records], [False] * 4 + [True])
+        self.assertTrue(all(record["duration"] > 0 for record in records))
+
+    def test_stream_async_large_record(self):
+        # longer than the default line limit of asyncio streams (64 KiB)
+        records = self.stream(make_submission(self.tmp_dir.name, "alice", message_size=1 << 20))
+
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[-1]["test"]["messages"], ["x" * (1 << 20)])
+
+    def test_run_async(self):
+        submission_dir = make_submission(self.tmp_dir.name, "alice")
+        results = asyncio.run(run_async(script, cwd=submission_dir))
+        self.assertEqual(results["summary"], {"total": 5, "succeeded": 5, "failed": 0, "score": 100.0})
+
+    def test_run_async_recover(self):
+        # the GDB process is killed during the last test
+        submission_dir = make_submission(self.tmp_dir.name, "alice", kill=True)
+        results = asyncio.run(run_async(script, cwd=submission_dir))
+
+        self.assertEqual(results["summary"]["error"], {"reason": "aborted", "data": -9})
+        self.assertEqual(results["summary"]["succeeded"], 4)
+        self.assertFalse(results["problems"]["message"]["tests"][0]["success"])
+        self.assertIn("interrupted", results["problems"]["message"]["tests"][0]["tags"])
+        self.assertTrue(os.path.exists(os.path.join(submission_dir, "results.yml")))
+        self.assertFalse(os.path.exists(os.path.join(submission_dir, "results.jsonl")))
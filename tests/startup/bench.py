@@ -0,0 +1,40 @@
+#!/bin/python3
+
+# Measures the time between the launch of a GDB process executing a test script and the start of its first test.
+# Exits with a non-zero status if the median of this startup time exceeds the budget, which defaults to the
+# 'CCORRECT_STARTUP_BUDGET' environment variable or 2 seconds (a budget of 0 only reports the startup time).
+
+import sys
+import os
+import argparse
+import statistics
+import subprocess
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(base_dir, "../../"))
+
+if __name__ == "__main__":
+    import ccorrect
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10, help="number of GDB processes to launch")
+    parser.add_argument("--budget", type=float, default=float(os.environ.get("CCORRECT_STARTUP_BUDGET", 2.0)),
+                        help="maximum median startup time in seconds (0 means no maximum)")
+    args = parser.parse_args()
+
+    p = subprocess.run(["make", "-C", os.path.join(base_dir, "../gdb_values")])
+    if p.returncode != 0:
+        exit(1)
+
+    startup_times = []
+    for _ in range(args.runs):
+        results = ccorrect.run(os.path.join(base_dir, "test.py"), cwd=base_dir)
+        startup_times.append(results["startup_time"])
+    os.remove(os.path.join(base_dir, "results.yml"))
+
+    median = statistics.median(startup_times)
+    budget = f"{args.budget:.3f}s" if args.budget > 0 else "none"
+    print(f"startup time: median={median:.3f}s min={min(startup_times):.3f}s max={max(startup_times):.3f}s (budget: {budget})")
+    if args.budget > 0 and median > args.budget:
+        exit(1)
@@ -0,0 +1,15 @@
+import sys
+
+sys.path.insert(0, "../../")
+
+import ccorrect
+
+
+class TestStartup(ccorrect.TestCase):
+    debugger = ccorrect.Debugger("../gdb_values/main")
+
+    def test_start(self):
+        pass
+
+
+ccorrect.run_tests()